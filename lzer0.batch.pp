@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Post-elaborazione in batch (rnx2rtkp) di un intervallo di ore e siti.
+
+Fa per ogni ora lo stesso lavoro di lzer0.start.pp: estrae i RINEX del
+rover e del master (lzer0_rinex, con la cache delle conversioni: il
+master condiviso dai rover viene convertito una sola volta per ora),
+esegue rnx2rtkp e
+calcola media (.mean.pos) e statistica (.stat). Le ore sono
+indipendenti e vengono elaborate in parallelo (un job per core), ognuna
+in una propria directory temporanea invece della TMPDIR condivisa.
+
+Le ore i cui risultati 1Hpp sono già presenti e non vuoti vengono
+saltate (salvo -w); lo stato di ogni job è registrato in un manifest
+JSON, così un'elaborazione interrotta riprende da dove si era fermata.
+Il manifest è legato all'identità dell'esecuzione (opzioni e hash dei
+file di configurazione): rilanciando lo stesso comando, anche con -w,
+le ore già completate vengono saltate; un'esecuzione con opzioni o
+configurazione diverse, o successiva a una completata, riparte da capo.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from lzer0_cfg import read_sites_cfg
+from lzer0_pos import Q_FIX, mean_pos_path, pos_mean, read_station_coords
+from lzer0_posstat import pos_stat
+from lzer0_rinex import RinexCache, RinexError, fetch_hour
+from lzer0_session import Hour, hour_range, parse_hour
+
+JOB = os.path.basename(sys.argv[0])
+HOME = os.path.expanduser("~")
+
+#********************  TUNING VARIABLES BEGIN ********************
+DUMPDIR = "/mnt/hd/gnss"
+TMPROOT = f"{HOME}/tmp"
+RTKCFGFILE = f"{HOME}/cfg/rnx2rtkp.curr.conf"   # opzioni di post-elaborazione
+CRDFILE = f"{HOME}/tab/station.pos"              # coordinate a priori dei siti
+CFGFILE = f"{HOME}/cfg/sites.cfg"                # nomi di ROVER e MASTER
+MANIFEST = f"{TMPROOT}/lzer0.batch.pp.json"
+RATE = 30
+FIXLIM = 0.10
+#********************  TUNING VARIABLES END  ********************
+
+
+def usage() -> None:
+    print(f"- USAGE: {JOB} -b [YYYY.DDD.HH] -e [YYYY.DDD.HH] [-r SITE] [-r SITE ...] [-m MASTER] [-sr RATE] [-j JOBS] [-k MANIFEST] [-w]")
+    print("  -b/-e: first and last hour to process (HH is the hour of the data, 00 = session a)")
+    print(f"  -r: rover site(s), -m: master site (default from {CFGFILE})")
+    print(f"  -sr: sampling rate (default {RATE}), -j: parallel jobs (default: number of cores)")
+    print(f"  -k: progress manifest (default {MANIFEST}), an interrupted run resumes when the same command is run again")
+    print("  -w: overwrite existing results")
+    print(f"  e.g: {JOB} -b 2022.213.00 -e 2022.243.23 -r L001 -m BRU2")
+
+
+@dataclass
+class PPJob:
+    """Un'ora di un rover da post-elaborare."""
+    site: str
+    refv: str
+    hour: Hour
+
+    @property
+    def key(self) -> str:
+        return f"{self.site}.{self.hour.key}"
+
+    @property
+    def final_dir(self) -> str:
+        return self.hour.pp_dir(DUMPDIR)
+
+    @property
+    def pos_name(self) -> str:
+        return self.hour.pp_name(self.site)
+
+    @property
+    def pos_path(self) -> str:
+        return f"{self.final_dir}/{self.pos_name}"
+
+    def rinex(self, site: str, ext: str) -> str:
+        return self.hour.rinex_name(site, ext)
+
+    def fetch(self, site: str, rate: int, dest: str, cache: RinexCache) -> None:
+        """RINEX dell'ora di site in dest (HOUR degli script = ora dei dati + 1, 24 = sessione x)."""
+        fetch_hour(DUMPDIR, site, self.hour.year, self.hour.doy, self.hour.script_hour,
+                   rate, dest, cache)
+
+
+def _nonempty(path: str) -> bool:
+    try:
+        return os.path.getsize(path) > 0
+    except OSError:
+        return False
+
+
+def results_done(job: PPJob) -> bool:
+    """Soluzione, media e statistica dell'ora già presenti."""
+    return (_nonempty(job.pos_path) and os.path.exists(mean_pos_path(job.pos_path))
+            and os.path.exists(f"{job.pos_path}.stat"))
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 del contenuto del file ('' se non leggibile)."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def run_identity(args: argparse.Namespace, sites: List[str], refv: str) -> dict:
+    """Opzioni e configurazione che determinano i risultati di un'esecuzione."""
+    return {
+        "begin": args.begin, "end": args.end or args.begin, "sites": sites, "refv": refv,
+        "rate": args.rate, "force": args.force, "fixlim": FIXLIM,
+        "rtkcfg": file_digest(RTKCFGFILE), "crd": file_digest(CRDFILE),
+    }
+
+
+class Manifest:
+    """
+    Stato dei job su file JSON, riscritto in modo atomico a ogni aggiornamento.
+
+    Gli stati valgono per l'esecuzione descritta da run: con un'identità
+    diversa, o se l'esecuzione precedente era completa, si riparte da zero.
+    """
+
+    def __init__(self, path: str, run: dict):
+        self.path = path
+        self.lock = threading.Lock()
+        self.run_id = hashlib.sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()[:16]
+        self.run = {"id": self.run_id, "options": run, "complete": False,
+                    "started": datetime.now().isoformat(timespec="seconds")}
+        self.jobs: Dict[str, dict] = {}
+        self.resumed = False
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        prev = saved.get("run", {})
+        if prev.get("id") == self.run_id and not prev.get("complete"):
+            self.run = prev
+            self.jobs = saved.get("jobs", {})
+            self.resumed = True
+
+    def status(self, key: str) -> Optional[str]:
+        return self.jobs.get(key, {}).get("status")
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"run": self.run, "jobs": self.jobs}, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def update(self, key: str, status: str, error: str = "") -> None:
+        with self.lock:
+            entry = {"status": status, "updated": datetime.now().isoformat(timespec="seconds")}
+            if error:
+                entry["error"] = error
+            self.jobs[key] = entry
+            self._save()
+
+    def finish(self, complete: bool) -> None:
+        """Chiude l'esecuzione: se completa, la prossima ripartirà da capo."""
+        with self.lock:
+            self.run["complete"] = complete
+            self._save()
+
+
+class StepError(Exception):
+    pass
+
+
+def _run(cmd: List[str], cwd: str, stdout=subprocess.PIPE) -> None:
+    res = subprocess.run(cmd, cwd=cwd, stdout=stdout, stderr=subprocess.PIPE, text=True)
+    if res.returncode != 0:
+        tail = (res.stderr or "").strip().splitlines()[-1:]
+        raise StepError(f"{os.path.basename(cmd[0])} exit {res.returncode} {' '.join(tail)}")
+
+
+def summarize(job: PPJob) -> None:
+    """Media e statistica dell'ora, calcolate senza processi esterni."""
+    mean = pos_mean(job.pos_path, Q_FIX)
+    with open(mean_pos_path(job.pos_path), "w") as f:
+        if mean is not None:
+            f.write(mean.format_line() + "\n")
+    ref = read_station_coords(CRDFILE, job.site)
+    if ref is None:
+        print(f"- Error: no a priori coordinates for {job.site} in {CRDFILE}", file=sys.stderr)
+    stat = pos_stat(job.pos_path, ref, FIXLIM) if ref is not None else None
+    with open(f"{job.pos_path}.stat", "w") as f:
+        if stat is not None:
+            f.write(stat.format_line() + "\n")
+
+
+def process(job: PPJob, rate: int, force: bool, manifest: Manifest,
+            cache: RinexCache) -> None:
+    """Esegue l'intera catena di un'ora in una directory temporanea dedicata."""
+    os.makedirs(TMPROOT, exist_ok=True)
+    os.makedirs(job.final_dir, exist_ok=True)
+    if _nonempty(job.pos_path) and not force:
+        # La soluzione c'è già: mancano solo media e/o statistica
+        summarize(job)
+        return
+    manifest.update(job.key, "running")
+    tmpdir = tempfile.mkdtemp(prefix=f"tmp.{job.key}.", dir=TMPROOT)
+    try:
+        job.fetch(job.site, rate, tmpdir, cache)
+        job.fetch(job.refv, rate, tmpdir, cache)
+        rover_obs = job.rinex(job.site, "o")
+        pos_tmp = os.path.join(tmpdir, job.pos_name)
+        with open(pos_tmp, "w") as out:
+            _run(["rnx2rtkp", "-k", RTKCFGFILE, rover_obs, job.rinex(job.refv, "o"),
+                  job.rinex(job.site, "n"), job.rinex(job.site, "g")], tmpdir, stdout=out)
+        part = f"{job.pos_path}.part"
+        shutil.copyfile(pos_tmp, part)
+        os.replace(part, job.pos_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    summarize(job)
+
+
+def main() -> int:
+    if len(sys.argv) == 1:
+        usage()
+        return 1
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-b", dest="begin")
+    parser.add_argument("-e", dest="end")
+    parser.add_argument("-r", dest="sites", action="append", default=[])
+    parser.add_argument("-m", dest="refv", default="")
+    parser.add_argument("-sr", dest="rate", type=int, default=RATE)
+    parser.add_argument("-j", dest="jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-k", dest="manifest", default=MANIFEST)
+    parser.add_argument("-w", dest="force", action="store_true")
+    args, _ = parser.parse_known_args()
+
+    try:
+        sites_cfg = read_sites_cfg(CFGFILE)
+    except OSError:
+        sites_cfg = {}
+    sites = [s.upper() for s in args.sites] or [sites_cfg.get("rover name", "").upper() or "UNKN"]
+    refv = (args.refv or sites_cfg.get("master name", "")).upper()
+    if args.begin is None or refv == "":
+        print("- Error: one or more parameters ([YYYY.DDD.HH] and/or MASTER) are missing!")
+        return 0
+    try:
+        begin = parse_hour(args.begin)
+        end = parse_hour(args.end) if args.end else begin
+    except ValueError as e:
+        print(f"- Error: {e}")
+        return 1
+
+    manifest = Manifest(args.manifest, run_identity(args, sites, refv))
+    if manifest.resumed:
+        print(f"Resuming run {manifest.run_id} from {args.manifest}")
+    cache = RinexCache()
+    jobs = []
+    skipped = 0
+    for hour in hour_range(begin, end):
+        for site in sites:
+            job = PPJob(site, refv, hour)
+            if manifest.status(job.key) == "done" and results_done(job):
+                skipped += 1
+                continue
+            if not args.force and results_done(job):
+                skipped += 1
+                if manifest.status(job.key) != "done":
+                    manifest.update(job.key, "done")
+                continue
+            jobs.append(job)
+
+    print(f"{len(jobs)} hours to process, {skipped} already done, {args.jobs} parallel jobs")
+    start_time = time.time()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {pool.submit(process, job, args.rate, args.force, manifest, cache): job for job in jobs}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            try:
+                fut.result()
+            except (StepError, RinexError, OSError, ValueError, IndexError) as e:
+                failed += 1
+                manifest.update(job.key, "failed", str(e))
+                print(f"{job.key}: failed ({e})")
+                continue
+            manifest.update(job.key, "done")
+            print(f"{job.key}: done")
+    manifest.finish(failed == 0)
+
+    print(f"{len(jobs) - failed} done, {failed} failed in {time.time() - start_time:.0f} s"
+          f" (RINEX cache: {cache.hits} hits, {cache.misses} conversions)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
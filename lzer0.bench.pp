@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark degli script di post-elaborazione su fixture sintetiche.
+
+Genera le fixture (lzer0_bench) in una directory temporanea, esegue
+ogni stadio (posavg, posstat, fileformat, compress, hourlygnss, utm) -n volte
+e salva le misure migliori in JSON. L'output di ogni stadio deve
+coincidere byte per byte con bench/golden.json (-u per aggiornarlo dopo
+una modifica voluta del formato). Con -b il risultato è confrontato con
+un JSON precedente: uno stadio più lento oltre la soglia -t fa fallire
+l'esecuzione (exit 1), come un output diverso dal golden, uno stadio
+senza golden (senza -u il file non viene mai scritto) o un controllo
+di accuratezza di lzer0_geodesy oltre la tolleranza.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from lzer0_bench import compare, geodesy_checks, make_fixtures, measure, stages
+
+JOB = os.path.basename(sys.argv[0])
+HOME = os.path.expanduser("~")
+BINDIR = os.path.dirname(os.path.realpath(__file__))
+
+#********************  TUNING VARIABLES BEGIN ********************
+GOLDEN_FILE = f"{BINDIR}/bench/golden.json"
+OUTDIR = f"{HOME}/log/bench"
+REPEAT = 3
+THRESHOLD = 0.25     # rallentamento relativo ammesso
+MIN_DELTA = 0.05     # [s] differenze più piccole sono rumore
+#********************  TUNING VARIABLES END  ********************
+
+
+def usage() -> None:
+    print(f"- USAGE: {JOB} [-n REPEAT] [-s STAGE] [-b BASELINE.json] [-t THRESHOLD] [-o OUT.json] [-u] [-k]")
+    print(f"  -n: runs per stage, the fastest is kept (default {REPEAT})")
+    print("  -s: only stages and accuracy checks matching this pattern (e.g. 'posstat.*'), may be repeated")
+    print(f"  -b: fail when a stage is slower than in BASELINE by more than THRESHOLD (default {THRESHOLD})")
+    print(f"  -o: results file (default {OUTDIR}/{JOB}.YYYYMMDD.HHMMSS.json)")
+    print(f"  -u: update the golden digests in {GOLDEN_FILE}")
+    print("  -k: keep the fixture directory")
+    print(f"  e.g: {JOB} -o /tmp/before.json")
+    print(f"  e.g: {JOB} -b /tmp/before.json -t 0.10")
+
+
+def load_json(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("-n", dest="repeat", type=int, default=REPEAT)
+    parser.add_argument("-s", dest="patterns", action="append", default=[])
+    parser.add_argument("-b", dest="baseline")
+    parser.add_argument("-t", dest="threshold", type=float, default=THRESHOLD)
+    parser.add_argument("-o", dest="output")
+    parser.add_argument("-u", dest="update", action="store_true")
+    parser.add_argument("-k", dest="keep", action="store_true")
+    parser.add_argument("--help", dest="help", action="store_true")
+    args, _ = parser.parse_known_args()
+    if args.help:
+        usage()
+        return 0
+
+    golden = load_json(GOLDEN_FILE)
+    baseline = load_json(args.baseline).get("stages", {}) if args.baseline else {}
+    if args.baseline and not baseline:
+        print(f"- Error: no results in {args.baseline}")
+        return 1
+
+    work = tempfile.mkdtemp(prefix="lzer0.bench.")
+    print(f"Generating fixtures in {work}...")
+    fx = make_fixtures(work)
+    todo = [s for s in stages(fx, BINDIR)
+            if not args.patterns or any(fnmatch.fnmatch(s.name, p) for p in args.patterns)]
+
+    results = {}
+    failures = []
+    print("%-18s %8s %8s %6s %11s %11s  %s" % ("STAGE", "WALL[s]", "CPU[s]", "FORKS", "READ[B]", "WRITTEN[B]", "OUTPUT"))
+    for stage in todo:
+        r = measure(stage, fx, args.repeat)
+        results[stage.name] = r
+        expected = golden.get(stage.name)
+        if r["returncode"]:
+            check = f"exit {r['returncode']}"
+            failures.append(f"{stage.name}: exit {r['returncode']}\n{r['stderr']}")
+        elif not r["stable"]:
+            check = "UNSTABLE"
+            failures.append(f"{stage.name}: output differs between runs")
+        elif args.update:
+            check = "new" if expected != r["digest"] else "ok"
+            golden[stage.name] = r["digest"]
+        elif expected is None:
+            check = "NO GOLDEN"
+            failures.append(f"{stage.name}: no golden, run with -u")
+        elif expected == r["digest"]:
+            check = "ok"
+        else:
+            check = "DIFFERS"
+            failures.append(f"{stage.name}: output differs from golden")
+        print("%-18s %8.3f %8.3f %6d %11d %11d  %s" % (
+            stage.name, r["wall"], r["cpu"], r["forks"], r["read_bytes"], r["write_bytes"], check))
+
+    accuracy = {}
+    checks = [c for c in geodesy_checks()
+              if not args.patterns or any(fnmatch.fnmatch(c[0], p) for p in args.patterns)]
+    if checks:
+        print("%-18s %12s %12s  %s" % ("ACCURACY", "ERROR[m]", "TOL[m]", "CHECK"))
+    for name, error, tol in checks:
+        accuracy[name] = {"error": error, "tolerance": tol}
+        ok = error <= tol
+        if not ok:
+            failures.append(f"{name}: error {error:.6g} m over {tol:g} m")
+        print("%-18s %12.3e %12.3e  %s" % (name, error, tol, "ok" if ok else "FAIL"))
+
+    slow = compare(results, baseline, args.threshold, MIN_DELTA) if baseline else []
+    failures += [f"slower: {s}" for s in slow]
+
+    output = args.output or time.strftime(f"{OUTDIR}/{JOB}.%Y%m%d.%H%M%S.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+                   "machine": platform.machine(), "python": platform.python_version(),
+                   "cpus": os.cpu_count(), "repeat": args.repeat, "stages": results,
+                   "accuracy": accuracy}, f, indent=1)
+    print(f"Results written to {output}")
+
+    if args.update:
+        os.makedirs(os.path.dirname(GOLDEN_FILE), exist_ok=True)
+        with open(GOLDEN_FILE, "w") as f:
+            json.dump(dict(sorted(golden.items())), f, indent=1)
+            f.write("\n")
+        print(f"Golden digests written to {GOLDEN_FILE}")
+
+    if args.keep:
+        print(f"Fixtures kept in {work}")
+    else:
+        shutil.rmtree(work, ignore_errors=True)
+
+    for failure in failures:
+        print(f"- FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
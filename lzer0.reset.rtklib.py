@@ -11,8 +11,56 @@ Condizioni di riavvio:
    - "5": se persiste per 3+ letture consecutive (3+ minuti) riavvia
    - Ambiguo/errore: 5 tentativi ogni 40s, poi riavvia
    - Altri valori: riavvia immediatamente
+
+Lo status viene letto dallo stream delle soluzioni di rtkrcv tramite una
+connessione persistente (lzer0_rtk.RTKSolutionClient), senza lanciare
+socat ad ogni controllo. Con -i si può ridurre l'intervallo di controllo
+sotto il minuto: ogni lettura costa solo una recv non bloccante.
+
+Il monitor conserva le soluzioni recenti (tempo, status, satelliti,
+sigma) in un buffer circolare a dimensione fissa e i propri contatori
+(controlli, riavvii, tempi di lettura); con METRICS_ADDR (-m) li espone
+in formato Prometheus (/metrics) e JSON (/metrics.json) su una porta
+locale o un socket Unix, servita nello stesso ciclo a eventi.
+
+Il monitor è una macchina a stati guidata da eventi (selectors): non
+esistono attese bloccanti, le attese per status 2, status 5, risposte
+ambigue, connessione persa e riavvio sono timer. Durante i periodi di
+tolleranza il campionamento continua, la chiusura della porta viene
+rilevata appena avviene e SIGTERM interrompe subito il ciclo.
+
+Modalità supervisore: se esiste il file dei servizi (SERVICES_FILE, -c)
+il daemon avvia e possiede direttamente le istanze di rtkrcv/str2str
+elencate, con comando, controllo di salute e politica di riavvio per
+ciascuna. La terminazione dei figli è notificata tramite pidfd (niente
+scansioni di ps) e viene riavviata solo l'istanza guasta invece di
+`pkill -f rtkrcv`. Esempio di file:
+
+    [rtkrcv]
+    command = /usr/local/bin/rtkrcv -s -nc -p 2950 -o /home/lzer0/cfg/rtkrcv.curr.conf
+    cwd = /home/lzer0/log
+    probe = rtk:127.0.0.1:5754
+    restart = always
+    match = rtkrcv 2950
+
+    [hourlypos]
+    command = /usr/local/bin/str2str -in tcpcli://127.0.0.1:5754 -out file:///mnt/hd/gnss/%Y/%n/%H/L001.%Y.%m.%d.%n.%H.pos::S=1::T -f 0
+    restart = always
+    match = str2str 5754 L001
+
+probe: rtk[:HOST:PORT] (status delle soluzioni), tcp:HOST:PORT
+(porta raggiungibile) o none. restart: always, on-failure o never.
+match: parole chiave delle istanze già attive (avviate da cron o a
+mano) da terminare all'avvio, così che il supervisore ne sia l'unico
+proprietario. Senza file dei servizi il comportamento è quello storico.
 """
 
+import argparse
+import configparser
+import dataclasses
+import errno
+import selectors
+import shlex
 import socket
 import time
 import os
@@ -21,7 +69,12 @@ import sys
 import signal
 from datetime import datetime
 from dataclasses import dataclass
-from typing import Optional
+from enum import Enum
+from typing import Callable, Dict, List, Optional
+
+import lzer0_proc
+from lzer0_metrics import MetricsServer, Sample, SolutionRing, Timing, host_samples
+from lzer0_rtk import RTKSolutionClient, Solution, parse_solution
 
 # Configurazione
 @dataclass
@@ -30,259 +83,1027 @@ class Config:
     PORT: int = 5754
     LOG_DIR: str = "/home/lzer0/log"
     PIDFILE: str = "/home/lzer0/log/lzer0.resetrtklib.pid"
+    SERVICES_FILE: str = "/home/lzer0/cfg/services.cfg"
     CHECK_INTERVAL: int = 60
     CONNECTION_RETRY_ATTEMPTS: int = 5
+    CONNECTION_FAIL_TIME_THRESHOLD: int = 240  # 4 minuti
     STATUS_RETRY_INTERVAL: int = 40
     STATUS_RETRY_ATTEMPTS: int = 5
     STATUS_2_WAIT_TIME: int = 300  # 5 minuti
     STATUS_5_TIME_THRESHOLD: int = 180  # 3 minuti
     STATUS_5_COUNT_THRESHOLD: int = 3
     SOCKET_TIMEOUT: int = 10
-    SOCAT_TIMEOUT: int = 10
+    SOLUTION_TIMEOUT: int = 10
+    RECONNECT_BACKOFF_MIN: int = 1
+    RECONNECT_BACKOFF_MAX: int = 30
+    KILL_GRACE_TIME: int = 2
     RESTART_WAIT_TIME: int = 60
     STARTUP_DELAY: int = 120  # Attesa iniziale per stabilizzazione sistema
+    SERVICE_RESTART_DELAY: int = 5
+    METRICS_ADDR: str = "127.0.0.1:9754"  # HOST:PORT o socket Unix, vuoto per disabilitare
+    RING_SIZE: int = 3600  # soluzioni conservate (un'ora a 1 Hz)
 
 config = Config()
 
-class RTKMonitor:
-    def __init__(self):
-        self.connection_attempts = 0
-        self.status5_count = 0
-        self.status5_start = None
-        self.shutdown_requested = False
-        self._setup_daemon()
-    
-    def _setup_daemon(self) -> None:
+
+def write_log(cfg: Config, message: str) -> None:
+    """Registra un evento nel log con flush immediato."""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    log_entry = f"[ {timestamp} ] [PID:{os.getpid()}] - {message}\n"
+
+    try:
+        log_file = f"{cfg.LOG_DIR}/lzer0.resetrtklib.log"
+        with open(log_file, "a") as f:
+            f.write(log_entry)
+            f.flush()  # Forza la scrittura immediata
+
+        # Output anche su stdout per crontab
+        print(log_entry.strip())
+        sys.stdout.flush()
+    except Exception as e:
+        # Fallback su stderr se il log file non è accessibile
+        print(f"ERRORE LOG: {e} - {log_entry.strip()}", file=sys.stderr)
+
+
+class State(Enum):
+    """Stati del monitor."""
+    STARTUP = "startup"              # attesa iniziale di stabilizzazione
+    DISCONNECTED = "disconnected"    # porta non raggiungibile
+    OK = "ok"                        # status 1
+    STATUS2 = "status2"              # status 2, in attesa del ritorno a 1
+    STATUS5 = "status5"              # status 5 consecutivi
+    AMBIGUOUS = "ambiguous"          # nessuna soluzione valida ricevuta
+    RESTART_KILL = "restart_kill"    # SIGTERM inviato, in attesa del kill -9
+    RESTART_WAIT = "restart_wait"    # attesa della ripartenza di rtkrcv
+    STOPPED = "stopped"
+
+
+class Daemon:
+    """Pidfile, segnali e risveglio del ciclo a eventi comuni ai daemon."""
+
+    cfg: Config
+    shutdown_requested: bool
+    metrics_server: Optional[MetricsServer] = None
+
+    def _init_loop(self, selector: Optional[selectors.BaseSelector]) -> None:
+        """Usa il selector condiviso o ne crea uno con il proprio socket di risveglio."""
+        self.started_at = time.time()
+        if selector is not None:
+            self.selector = selector
+            self._wakeup_r = self._wakeup_w = None
+            return
+        self.selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._drain_wakeup)
+
+    def daemonize(self) -> None:
         """Configura il processo come daemon."""
         self._ensure_log_dir()
         self._write_pidfile()
         self._setup_signal_handlers()
-        
+
         # Redirect stdout/stderr al log per catturare tutti gli output
-        log_file = f"{config.LOG_DIR}/lzer0.resetrtklib.log"
+        log_file = f"{self.cfg.LOG_DIR}/lzer0.resetrtklib.log"
         sys.stdout = open(log_file, 'a', buffering=1)
         sys.stderr = sys.stdout
-    
+
     def _write_pidfile(self) -> None:
         """Scrive il PID del processo corrente."""
         try:
-            with open(config.PIDFILE, 'w') as f:
+            with open(self.cfg.PIDFILE, 'w') as f:
                 f.write(str(os.getpid()))
         except Exception as e:
             print(f"Errore scrittura pidfile: {e}")
-    
+
     def _cleanup_pidfile(self) -> None:
         """Rimuove il pidfile."""
         try:
-            if os.path.exists(config.PIDFILE):
-                os.remove(config.PIDFILE)
+            if os.path.exists(self.cfg.PIDFILE):
+                os.remove(self.cfg.PIDFILE)
         except Exception as e:
             self._log(f"Errore rimozione pidfile: {e}")
-    
+
     def _setup_signal_handlers(self) -> None:
         """Configura i gestori dei segnali per shutdown pulito."""
         def signal_handler(signum, frame):
             self._log(f"Ricevuto segnale {signum}. Avvio shutdown...")
             self.shutdown_requested = True
-        
+
+        # Il byte scritto sul socket di risveglio interrompe subito la select
+        signal.set_wakeup_fd(self._wakeup_w.fileno())
         signal.signal(signal.SIGTERM, signal_handler)
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGHUP, signal_handler)
-    
-    def _ensure_log_dir(self) -> None:
-        """Crea la directory di log se non esiste."""
-        os.makedirs(config.LOG_DIR, exist_ok=True)
-    
-    def _check_connection(self) -> bool:
-        """Verifica se il servizio è raggiungibile."""
+
+    def request_shutdown(self) -> None:
+        """Richiede l'arresto del monitor (utilizzabile anche da un altro thread)."""
+        self.shutdown_requested = True
+        if self._wakeup_w is None:
+            return
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.settimeout(config.SOCKET_TIMEOUT)
-                sock.connect((config.HOST, config.PORT))
-                return True
-        except socket.error:
-            return False
-    
-    def _get_rtk_status(self) -> str:
-        """Ottiene lo stato RTK corrente."""
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _drain_wakeup(self) -> None:
         try:
-            cmd = f"echo 'solution' | socat tcp:{config.HOST}:{config.PORT} - | head -n 1"
-            output = subprocess.check_output(
-                cmd, shell=True, text=True, timeout=config.SOCAT_TIMEOUT
-            )
-            values = output.strip().split()
-            return values[5] if len(values) >= 6 else "UNKNOWN"
-        except Exception as e:
-            self._log(f"Errore nell'ottenere lo status: {e}")
-            return "ERROR"
-    
-    def _get_rtk_status_with_retry(self) -> str:
-        """Ottiene lo status RTK con tentativi multipli per errori."""
-        for attempt in range(config.STATUS_RETRY_ATTEMPTS):
-            status = self._get_rtk_status()
-            
-            if status not in ["ERROR", "UNKNOWN"]:
-                return status
-            
-            self._log(f"Status ambiguo ({status}) - tentativo {attempt + 1}/{config.STATUS_RETRY_ATTEMPTS}")
-            if attempt < config.STATUS_RETRY_ATTEMPTS - 1:
-                time.sleep(config.STATUS_RETRY_INTERVAL)
-        
-        self._log(f"Impossibile ottenere status valido dopo {config.STATUS_RETRY_ATTEMPTS} tentativi")
-        return "FAILED"
-    
-    def _restart_rtkrcv(self) -> bool:
-        """Uccide e riavvia il processo rtkrcv."""
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def metrics(self) -> List[Sample]:
+        return []
+
+    def solutions(self, n: int) -> Dict[str, List[dict]]:
+        return {}
+
+    def _all_metrics(self) -> List[Sample]:
+        uptime = Sample("lzer0_daemon_uptime_seconds", "gauge", "Tempo dall'avvio del daemon",
+                        time.time() - self.started_at)
+        return [uptime] + host_samples() + self.metrics()
+
+    def serve_metrics(self, addr: str) -> None:
+        """Espone le metriche su addr (HOST:PORT o socket Unix) nel ciclo a eventi."""
+        if not addr:
+            return
         try:
-            self._log("Riavvio rtkrcv in corso...")
-            
-            # Uccidi tutti i processi rtkrcv più robustamente
-            kill_commands = [
-                "pkill -f rtkrcv",
-                "ps -ef | grep '[r]tkrcv' | awk '{print $2}' | xargs -r kill -9"
-            ]
-            
-            for cmd in kill_commands:
-                try:
-                    subprocess.run(cmd, shell=True, check=False, timeout=30)
-                    time.sleep(2)
-                except subprocess.TimeoutExpired:
-                    self._log("Timeout durante kill del processo")
-            
-            time.sleep(config.RESTART_WAIT_TIME)
-            self._reset_status5_tracking()
+            self.metrics_server = MetricsServer(addr, self.selector, self._all_metrics, self.solutions,
+                                                self.clock)
+        except (OSError, ValueError) as e:
+            self._log(f"Endpoint delle metriche non disponibile su {addr}: {e}")
+            return
+        self._log(f"Metriche disponibili su {addr}")
+
+    def _wakeup_deadline(self, deadline: float) -> float:
+        """deadline, anticipata alla scadenza delle connessioni dell'endpoint delle metriche."""
+        pending = self.metrics_server.next_deadline() if self.metrics_server is not None else None
+        return deadline if pending is None else min(deadline, pending)
+
+    def _expire_metrics(self, now: float) -> None:
+        if self.metrics_server is not None:
+            self.metrics_server.expire(now)
+
+    def _close_metrics(self) -> None:
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+
+    def _ensure_log_dir(self) -> None:
+        """Crea la directory di log se non esiste."""
+        os.makedirs(self.cfg.LOG_DIR, exist_ok=True)
+
+    def _log(self, message: str) -> None:
+        """Registra un evento nel log con flush immediato."""
+        write_log(self.cfg, message)
+
+
+class RTKMonitor(Daemon):
+    """
+    Macchina a stati che controlla lo status delle soluzioni di un rtkrcv.
+
+    Da sola esegue il proprio ciclo (monitor()); nel supervisore condivide
+    il selector e, invece di `pkill`, chiama restart_action per riavviare
+    soltanto l'istanza controllata.
+    """
+
+    def __init__(self, cfg: Config = config, clock: Callable[[], float] = time.monotonic,
+                 selector: Optional[selectors.BaseSelector] = None,
+                 restart_action: Optional[Callable[[str], None]] = None,
+                 name: str = ""):
+        self.cfg = cfg
+        self.clock = clock
+        self.name = name
+        self.restart_action = restart_action
+        self.state = State.STARTUP
+        self.connection_attempts = 0
+        self.connection_fail_start = None
+        self.status5_count = 0
+        self.status5_start = None
+        self.status2_deadline = None
+        self.ambiguous_count = 0
+        self.restart_count = 0
+        self.shutdown_requested = False
+        self.client = RTKSolutionClient(
+            cfg.HOST, cfg.PORT, cfg.SOCKET_TIMEOUT,
+            cfg.RECONNECT_BACKOFF_MIN, cfg.RECONNECT_BACKOFF_MAX,
+        )
+        self.last_solution: Optional[Solution] = None
+        self.last_solution_at = 0.0
+        self.connected_at = 0.0
+        self.next_tick = 0.0
+        self.sample_deadline = None
+        self.state_deadline = None
+        self._registered_sock = None
+        self.restart_reason = ""
+        self.ring = SolutionRing(cfg.RING_SIZE)
+        self.read_timing = Timing()     # lettura e analisi delle righe disponibili
+        self.sample_timing = Timing()   # attesa di una soluzione fresca dopo il controllo
+        self.sample_requested_at = None
+        self.checks = 0
+        self.connections = 0
+        self.ambiguous_total = 0
+        self._init_loop(selector)
+
+    # ------------------------------------------------------------------
+    # Connessione e ricezione delle soluzioni
+    # ------------------------------------------------------------------
+
+    def _sync_registration(self) -> None:
+        """Mantiene registrato nel selector il socket corrente del client."""
+        sock = self.client.sock
+        if sock is self._registered_sock:
+            return
+        if self._registered_sock is not None:
+            try:
+                self.selector.unregister(self._registered_sock)
+            except (KeyError, ValueError):
+                pass
+        if sock is not None:
+            self.selector.register(sock, selectors.EVENT_READ, self._on_client_event)
+        self._registered_sock = sock
+
+    def _on_client_event(self) -> None:
+        self._on_readable(self.clock())
+
+    def _check_connection(self, now: float) -> bool:
+        """Verifica (ed eventualmente riapre) la connessione persistente al servizio."""
+        if self.client.connected:
             return True
-        except Exception as e:
-            self._log(f"Errore durante il riavvio di rtkrcv: {e}")
-            return False
-    
+        if self.client.connect():
+            self._log(f"Connesso a {self.cfg.HOST}:{self.cfg.PORT}")
+            self.connections += 1
+            self.connected_at = now
+            self.last_solution = None
+            self._sync_registration()
+            return True
+        return False
+
+    def _on_readable(self, now: float) -> None:
+        """Legge tutte le righe disponibili e conserva l'ultima soluzione valida."""
+        started = time.perf_counter()
+        wall = time.time()
+        for line in self.client.read_lines():
+            solution = parse_solution(line)
+            if solution is not None:
+                self.last_solution = solution
+                self.last_solution_at = now
+                self.ring.append(wall, solution)
+        self.read_timing.add(time.perf_counter() - started)
+        if self.status2_deadline is not None and self.last_solution is not None:
+            # Il ritorno a 1 durante l'attesa dello status 2 annulla il riavvio
+            self._status2_recovered()
+        if not self.client.connected:
+            self._sync_registration()
+            self._log(f"Connessione persa: {self.client.last_error}")
+            self.last_solution = None
+            self.sample_deadline = None
+            if self.state not in (State.RESTART_KILL, State.RESTART_WAIT):
+                # Prova subito a riconnettersi invece di attendere il prossimo controllo
+                self.next_tick = min(self.next_tick, now + self.cfg.RECONNECT_BACKOFF_MIN)
+        elif self.sample_deadline is not None and self.last_solution is not None:
+            self.sample_deadline = None
+            self.sample_timing.add(now - self.sample_requested_at)
+            self._process_status(self.last_solution.q, now)
+
+    # ------------------------------------------------------------------
+    # Macchina a stati
+    # ------------------------------------------------------------------
+
+    def _set_state(self, state: State) -> None:
+        if state != self.state:
+            self.state = state
+
+    def _tick(self, now: float) -> None:
+        """Controllo periodico: verifica la connessione e campiona lo status."""
+        self.next_tick = now + self.cfg.CHECK_INTERVAL
+        self.checks += 1
+        if not self._check_connection(now):
+            self._set_state(State.DISCONNECTED)
+            if self._handle_connection_failure(now):
+                self._restart_rtkrcv(now, "porta non raggiungibile")
+            return
+        self.connection_attempts = 0
+        self.connection_fail_start = None
+
+        fresh = (self.last_solution is not None
+                 and now - self.last_solution_at <= self.cfg.SOLUTION_TIMEOUT)
+        if fresh:
+            self.sample_timing.add(0.0)
+            self._process_status(self.last_solution.q, now)
+        else:
+            # Attende la prossima soluzione (o la scadenza del timeout)
+            self.sample_deadline = now + self.cfg.SOLUTION_TIMEOUT
+            self.sample_requested_at = now
+
+    def _on_sample_timeout(self, now: float) -> None:
+        """Nessuna soluzione valida entro SOLUTION_TIMEOUT."""
+        self.sample_deadline = None
+        status = "UNKNOWN" if self.client.connected else "ERROR"
+        self.ambiguous_count += 1
+        self.ambiguous_total += 1
+        self._log(f"Status ambiguo ({status}) - tentativo {self.ambiguous_count}/{self.cfg.STATUS_RETRY_ATTEMPTS}")
+        if self.ambiguous_count >= self.cfg.STATUS_RETRY_ATTEMPTS:
+            self._log(f"Impossibile ottenere status valido dopo {self.cfg.STATUS_RETRY_ATTEMPTS} tentativi")
+            self._log("Status fallito dopo tutti i tentativi. Riavvio necessario.")
+            self._restart_rtkrcv(now, "status ambiguo")
+            return
+        if self.state not in (State.STATUS2, State.STATUS5):
+            self._set_state(State.AMBIGUOUS)
+        self.next_tick = min(self.next_tick, now + self.cfg.STATUS_RETRY_INTERVAL)
+
     def _reset_status5_tracking(self) -> None:
         """Resetta il tracking dello status 5."""
         self.status5_count = 0
         self.status5_start = None
-    
-    def _handle_status5(self) -> bool:
+
+    def _handle_status5(self, now: float) -> bool:
         """Gestisce lo status 5. Restituisce True se il processo deve essere riavviato."""
         if self.status5_count == 0:
-            self.status5_start = time.time()
-        
+            self.status5_start = now
+
         self.status5_count += 1
-        elapsed = time.time() - (self.status5_start or 0)
-        
-        if elapsed >= config.STATUS_5_TIME_THRESHOLD and self.status5_count >= config.STATUS_5_COUNT_THRESHOLD:
+        elapsed = now - (self.status5_start or now)
+
+        if elapsed >= self.cfg.STATUS_5_TIME_THRESHOLD and self.status5_count >= self.cfg.STATUS_5_COUNT_THRESHOLD:
             self._log("Status '5' persistente per oltre 3 minuti. Riavvio necessario.")
+            self.restart_reason = "status 5 persistente"
             return True
-        
+
         return False
-    
-    def _handle_status2(self) -> bool:
+
+    def _handle_status2(self, now: float) -> bool:
         """Gestisce lo status 2. Restituisce True se il processo deve essere riavviato."""
-        self._log(f"Status 2: attendo {config.STATUS_2_WAIT_TIME//60} minuti per verifica...")
-        time.sleep(config.STATUS_2_WAIT_TIME)
-        
-        new_status = self._get_rtk_status()
-        self._log(f"Status dopo attesa: {new_status}")
-        
-        if new_status != "1":
+        if self.status2_deadline is None:
+            self._log(f"Status 2: attendo {self.cfg.STATUS_2_WAIT_TIME//60} minuti per verifica...")
+            self.status2_deadline = now + self.cfg.STATUS_2_WAIT_TIME
+        return self._status2_expired(now)
+
+    def _status2_recovered(self) -> bool:
+        """Chiude l'attesa dello status 2 se l'ultima soluzione è tornata a 1."""
+        if self.last_solution is None or self.last_solution.q != "1":
+            return False
+        self._log("Status tornato a 1.")
+        self.status2_deadline = None
+        self._reset_status5_tracking()
+        self._set_state(State.OK)
+        return True
+
+    def _status2_expired(self, now: float) -> bool:
+        if self.status2_deadline is not None and now >= self.status2_deadline:
+            if self._status2_recovered():
+                return False
+            status = self.last_solution.q if self.last_solution is not None else "UNKNOWN"
+            self._log(f"Status dopo attesa: {status}")
             self._log("Status non tornato a 1. Riavvio necessario.")
+            self.restart_reason = "status 2 persistente"
             return True
-        
         return False
-    
-    def _process_status(self, status: str) -> bool:
-        """Processa lo status e determina se è necessario un riavvio."""
-        if status == "FAILED":
-            self._log("Status fallito dopo tutti i tentativi. Riavvio necessario.")
-            return True
-        
+
+    def _process_status(self, status: str, now: float) -> None:
+        """Aggiorna lo stato in base allo status ricevuto ed eventualmente riavvia."""
         self._log(f"Status rtkrcv: {status}")
-        
+        self.ambiguous_count = 0
+        restart_needed = False
+
         if status == "1":
+            if self.status2_deadline is not None:
+                self._log("Status tornato a 1.")
+            self.status2_deadline = None
             self._reset_status5_tracking()
-            return False
+            self._set_state(State.OK)
         elif status == "2":
-            restart_needed = self._handle_status2()
             self._reset_status5_tracking()
-            return restart_needed
+            self._set_state(State.STATUS2)
+            restart_needed = self._handle_status2(now)
         elif status == "5":
-            return self._handle_status5()
+            if self.status2_deadline is not None:
+                # Il periodo di tolleranza dello status 2 resta attivo finché non si torna a 1
+                restart_needed = self._status2_expired(now)
+            else:
+                self._set_state(State.STATUS5)
+            restart_needed = self._handle_status5(now) or restart_needed
         else:
             self._log(f"Status non riconosciuto ({status}). Riavvio necessario.")
-            return True
-    
-    def _handle_connection_failure(self) -> bool:
+            self.restart_reason = f"status {status}"
+            restart_needed = True
+
+        if restart_needed:
+            self._restart_rtkrcv(now, self.restart_reason)
+
+    def _handle_connection_failure(self, now: float) -> bool:
         """Gestisce i fallimenti di connessione. Restituisce True se è necessario un riavvio."""
+        if self.connection_attempts == 0:
+            self.connection_fail_start = now
         self.connection_attempts += 1
-        self._log(f"Connessione fallita ({self.connection_attempts}/{config.CONNECTION_RETRY_ATTEMPTS})")
-        
-        if self.connection_attempts >= config.CONNECTION_RETRY_ATTEMPTS:
+        elapsed = now - (self.connection_fail_start or now)
+        self._log(f"Connessione fallita ({self.connection_attempts}/{self.cfg.CONNECTION_RETRY_ATTEMPTS}): {self.client.last_error}")
+
+        # Con polling sotto il minuto servono anche almeno 4 minuti di fallimenti
+        if (self.connection_attempts >= self.cfg.CONNECTION_RETRY_ATTEMPTS
+                and elapsed >= self.cfg.CONNECTION_FAIL_TIME_THRESHOLD):
             self._log("Troppi fallimenti di connessione consecutivi. Riavvio necessario.")
             self.connection_attempts = 0
+            self.connection_fail_start = None
             return True
-        
+
         return False
-    
-    def _log(self, message: str) -> None:
-        """Registra un evento nel log con flush immediato."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[ {timestamp} ] [PID:{os.getpid()}] - {message}\n"
-        
+
+    # ------------------------------------------------------------------
+    # Riavvio
+    # ------------------------------------------------------------------
+
+    def _run_kill(self, cmd: str) -> None:
         try:
-            log_file = f"{config.LOG_DIR}/lzer0.resetrtklib.log"
-            with open(log_file, "a") as f:
-                f.write(log_entry)
-                f.flush()  # Forza la scrittura immediata
-            
-            # Output anche su stdout per crontab
-            print(log_entry.strip())
-            sys.stdout.flush()
+            subprocess.run(cmd, shell=True, check=False, timeout=30)
+        except subprocess.TimeoutExpired:
+            self._log("Timeout durante kill del processo")
         except Exception as e:
-            # Fallback su stderr se il log file non è accessibile
-            print(f"ERRORE LOG: {e} - {log_entry.strip()}", file=sys.stderr)
-    
+            self._log(f"Errore durante il riavvio di rtkrcv: {e}")
+
+    def _reset_tracking(self) -> None:
+        """Chiude la connessione e azzera tutti i contatori e i timer di status."""
+        self.client.close()
+        self._sync_registration()
+        self.last_solution = None
+        self.sample_deadline = None
+        self.status2_deadline = None
+        self.ambiguous_count = 0
+        self.connection_attempts = 0
+        self.connection_fail_start = None
+        self._reset_status5_tracking()
+
+    def _restart_rtkrcv(self, now: float, reason: str = "") -> None:
+        """Uccide rtkrcv; il kill -9 e l'attesa di ripartenza sono gestiti come timer."""
+        self._log("Riavvio rtkrcv in corso...")
+        self.restart_count += 1
+        self._reset_tracking()
+        if self.restart_action is not None:
+            # Nel supervisore viene riavviata solo l'istanza controllata
+            self.restart_action(reason)
+            self._set_state(State.RESTART_WAIT)
+            self.state_deadline = now + self.cfg.RESTART_WAIT_TIME
+            return
+        self._run_kill("pkill -f rtkrcv")
+        self._set_state(State.RESTART_KILL)
+        self.state_deadline = now + self.cfg.KILL_GRACE_TIME
+
+    def notify_restarted(self, now: float) -> None:
+        """Il processo controllato è stato riavviato dall'esterno: attende che riparta."""
+        self._reset_tracking()
+        self._set_state(State.RESTART_WAIT)
+        self.state_deadline = now + self.cfg.RESTART_WAIT_TIME
+
+    def start(self, now: float) -> None:
+        """Avvia la macchina a stati con l'attesa iniziale di stabilizzazione."""
+        self._set_state(State.STARTUP)
+        self.state_deadline = now + self.cfg.STARTUP_DELAY
+
+    def _on_state_deadline(self, now: float) -> None:
+        self.state_deadline = None
+        if self.state == State.STARTUP:
+            self._set_state(State.DISCONNECTED)
+            self.next_tick = now
+        elif self.state == State.RESTART_KILL:
+            # Uccidi tutti i processi rtkrcv rimasti
+            self._run_kill("ps -ef | grep '[r]tkrcv' | awk '{print $2}' | xargs -r kill -9")
+            self._set_state(State.RESTART_WAIT)
+            self.state_deadline = now + self.cfg.RESTART_WAIT_TIME
+        elif self.state == State.RESTART_WAIT:
+            self._set_state(State.DISCONNECTED)
+            self.next_tick = now
+
+    # ------------------------------------------------------------------
+    # Ciclo principale
+    # ------------------------------------------------------------------
+
+    def next_deadline(self) -> float:
+        if self.state in (State.STARTUP, State.RESTART_KILL, State.RESTART_WAIT):
+            return self.state_deadline
+        deadlines = [self.next_tick]
+        if self.sample_deadline is not None:
+            deadlines.append(self.sample_deadline)
+        if self.status2_deadline is not None:
+            deadlines.append(self.status2_deadline)
+        return min(deadlines)
+
+    def run_timers(self, now: float) -> None:
+        if self.state in (State.STARTUP, State.RESTART_KILL, State.RESTART_WAIT):
+            if self.state_deadline is not None and now >= self.state_deadline:
+                self._on_state_deadline(now)
+            return
+        if self.sample_deadline is not None and now >= self.sample_deadline:
+            self._on_sample_timeout(now)
+        elif self._status2_expired(now):
+            self._restart_rtkrcv(now, self.restart_reason)
+        elif now >= self.next_tick:
+            self._tick(now)
+
+    def step(self, max_wait: Optional[float] = None) -> None:
+        """Attende il prossimo evento (dati, segnale o timer) e lo gestisce."""
+        now = self.clock()
+        timeout = max(0.0, self._wakeup_deadline(self.next_deadline()) - now)
+        if max_wait is not None:
+            timeout = min(timeout, max_wait)
+        for key, _ in self.selector.select(timeout):
+            key.data()
+        if self.shutdown_requested:
+            return
+        now = self.clock()
+        self._expire_metrics(now)
+        self.run_timers(now)
+
+    def metrics(self) -> List[Sample]:
+        """Contatori del monitor e statistiche del buffer delle soluzioni."""
+        labels = {"service": self.name or "rtkrcv"}
+        age = self.clock() - self.last_solution_at if self.ring.total else -1
+        samples = [
+            Sample("lzer0_monitor_state", "gauge", "Stato corrente del monitor", 1,
+                   {**labels, "state": self.state.value}),
+            Sample("lzer0_monitor_connected", "gauge", "Connessione allo stream delle soluzioni attiva",
+                   int(self.client.connected), labels),
+            Sample("lzer0_monitor_checks_total", "counter", "Controlli periodici eseguiti", self.checks, labels),
+            Sample("lzer0_monitor_connections_total", "counter", "Connessioni aperte allo stream",
+                   self.connections, labels),
+            Sample("lzer0_monitor_ambiguous_total", "counter", "Controlli senza soluzione valida",
+                   self.ambiguous_total, labels),
+            Sample("lzer0_monitor_restarts_total", "counter", "Riavvii di rtkrcv richiesti",
+                   self.restart_count, labels),
+            Sample("lzer0_monitor_last_solution_age_seconds", "gauge", "Età dell'ultima soluzione (-1 se nessuna)",
+                   age, labels),
+        ]
+        samples += self.read_timing.samples("lzer0_monitor_read", "Lettura delle soluzioni disponibili", labels)
+        samples += self.sample_timing.samples("lzer0_monitor_sample_wait",
+                                              "Attesa di una soluzione fresca dopo il controllo", labels)
+        return samples + self.ring.samples(labels)
+
+    def solutions(self, n: int) -> Dict[str, List[dict]]:
+        return {self.name or "rtkrcv": self.ring.recent(n)}
+
+    def close(self) -> None:
+        """Chiude la connessione e ferma la macchina a stati."""
+        self.client.close()
+        self._sync_registration()
+        self._set_state(State.STOPPED)
+
+    def _log(self, message: str) -> None:
+        """Registra un evento nel log con flush immediato."""
+        write_log(self.cfg, f"[{self.name}] {message}" if self.name else message)
+
     def monitor(self) -> None:
         """Funzione principale di monitoraggio."""
-        self._log("Monitoraggio rtkrcv avviato")
-        self._log(f"Attesa iniziale di {config.STARTUP_DELAY} secondi per stabilizzazione sistema...")
-        time.sleep(config.STARTUP_DELAY)
-        
+        self._log(f"Monitoraggio rtkrcv avviato (intervallo {self.cfg.CHECK_INTERVAL}s)")
+        self._log(f"Attesa iniziale di {self.cfg.STARTUP_DELAY} secondi per stabilizzazione sistema...")
+        self.start(self.clock())
+
         while not self.shutdown_requested:
             try:
-                if self._check_connection():
-                    self.connection_attempts = 0
-                    status = self._get_rtk_status_with_retry()
-                    
-                    if self._process_status(status):
-                        self._restart_rtkrcv()
-                else:
-                    if self._handle_connection_failure():
-                        self._restart_rtkrcv()
-                
-                # Check periodico per shutdown durante il sleep
-                for _ in range(config.CHECK_INTERVAL):
-                    if self.shutdown_requested:
-                        break
-                    time.sleep(1)
-                
+                self.step()
             except Exception as e:
                 self._log(f"Errore imprevisto: {e}")
-                # Attesa breve prima di riprovare
-                for _ in range(min(config.CHECK_INTERVAL, 30)):
-                    if self.shutdown_requested:
-                        break
-                    time.sleep(1)
-        
+                # Attesa breve prima di riprovare, interrotta subito dallo shutdown
+                self.client.close()
+                self._sync_registration()
+                self.sample_deadline = None
+                self.next_tick = self.clock() + min(self.cfg.CHECK_INTERVAL, 30)
+
+        self.close()
+        self._close_metrics()
         self._log("Shutdown del monitoraggio completato")
         self._cleanup_pidfile()
 
+
+class TCPProbe:
+    """
+    Controllo di salute minimo: la porta TCP del servizio accetta connessioni.
+
+    Stessa interfaccia a timer di RTKMonitor; chiede il riavvio quando la
+    porta resta irraggiungibile per CONNECTION_FAIL_TIME_THRESHOLD secondi.
+    La connect è non bloccante e il suo esito arriva dal selector, così
+    una porta che non risponde non ferma gli altri servizi per
+    SOCKET_TIMEOUT secondi.
+    """
+
+    def __init__(self, cfg: Config, clock: Callable[[], float],
+                 restart_action: Callable[[str], None], name: str,
+                 selector: selectors.BaseSelector):
+        self.cfg = cfg
+        self.clock = clock
+        self.restart_action = restart_action
+        self.name = name
+        self.selector = selector
+        self.next_check = 0.0
+        self.fail_start = None
+        self.checks = 0
+        self.failures = 0
+        self.sock: Optional[socket.socket] = None
+        self.connect_deadline: Optional[float] = None
+
+    def start(self, now: float) -> None:
+        self._cancel()
+        self.next_check = now + self.cfg.STARTUP_DELAY
+        self.fail_start = None
+
+    def notify_restarted(self, now: float) -> None:
+        self._cancel()
+        self.next_check = now + self.cfg.RESTART_WAIT_TIME
+        self.fail_start = None
+
+    def next_deadline(self) -> float:
+        # con una connect in corso il prossimo controllo parte dopo il suo esito
+        if self.connect_deadline is not None:
+            return self.connect_deadline
+        return self.next_check
+
+    def run_timers(self, now: float) -> None:
+        if self.connect_deadline is not None and now >= self.connect_deadline:
+            self._cancel()
+            self._failed(now, "timeout")
+        if now < self.next_check or self.sock is not None:
+            return
+        self.next_check = now + self.cfg.CHECK_INTERVAL
+        self.checks += 1
+        try:
+            family, type_, proto, _, addr = socket.getaddrinfo(
+                self.cfg.HOST, self.cfg.PORT, type=socket.SOCK_STREAM)[0]
+            sock = socket.socket(family, type_, proto)
+        except OSError as e:
+            self._failed(now, e)
+            return
+        sock.setblocking(False)
+        err = sock.connect_ex(addr)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            sock.close()
+            self._failed(now, os.strerror(err))
+            return
+        self.sock = sock
+        self.connect_deadline = now + self.cfg.SOCKET_TIMEOUT
+        self.selector.register(sock, selectors.EVENT_WRITE, self._on_connect)
+
+    def _on_connect(self) -> None:
+        err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        self._cancel()
+        if err:
+            self._failed(self.clock(), os.strerror(err))
+        else:
+            self.fail_start = None
+
+    def _cancel(self) -> None:
+        """Abbandona la connect in corso."""
+        if self.sock is None:
+            return
+        try:
+            self.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+        self.sock = None
+        self.connect_deadline = None
+
+    def _failed(self, now: float, error) -> None:
+        self.failures += 1
+        if self.fail_start is None:
+            self.fail_start = now
+        write_log(self.cfg, f"[{self.name}] Porta {self.cfg.HOST}:{self.cfg.PORT} non raggiungibile: {error}")
+        if now - self.fail_start >= self.cfg.CONNECTION_FAIL_TIME_THRESHOLD:
+            self.restart_action("porta non raggiungibile")
+
+    def metrics(self) -> List[Sample]:
+        labels = {"service": self.name}
+        return [
+            Sample("lzer0_probe_checks_total", "counter", "Controlli della porta eseguiti", self.checks, labels),
+            Sample("lzer0_probe_failures_total", "counter", "Controlli della porta falliti", self.failures, labels),
+        ]
+
+    def solutions(self, n: int) -> Dict[str, List[dict]]:
+        return {}
+
+    def close(self) -> None:
+        self._cancel()
+
+
+@dataclass
+class ServiceSpec:
+    """Un servizio del file dei servizi."""
+    name: str
+    command: List[str]
+    cwd: Optional[str] = None
+    probe: str = "none"
+    restart: str = "always"
+    restart_delay: float = config.SERVICE_RESTART_DELAY
+    match: List[str] = dataclasses.field(default_factory=list)
+    log: Optional[str] = None
+
+
+RESTART_POLICIES = ("always", "on-failure", "never")
+PROBE_KINDS = ("rtk", "tcp", "none")
+
+
+def probe_target(target: str):
+    """'HOST:PORT' (o ':PORT', 'PORT') del probe -> (host, porta); ValueError se la porta non è valida."""
+    host, _, port = target.rpartition(":")
+    if not (port.isdigit() and 0 < int(port) < 65536):
+        raise ValueError(f"porta non valida: {port!r}")
+    return host, int(port)
+
+
+def load_services(path: str) -> List[ServiceSpec]:
+    """
+    Legge il file dei servizi (formato INI, una sezione per servizio).
+
+    Il file è letto senza interpolazione, così i pattern %Y/%n/%H dei
+    percorsi di str2str e rtkrcv si scrivono senza raddoppiare il '%'.
+    """
+    parser = configparser.RawConfigParser()
+    with open(path) as f:
+        parser.read_file(f)
+    specs = []
+    for name in parser.sections():
+        sec = parser[name]
+        command = shlex.split(sec.get("command", ""))
+        if not command:
+            raise ValueError(f"{path}: [{name}] senza command")
+        probe = sec.get("probe", "none")
+        kind, _, target = probe.partition(":")
+        if kind not in PROBE_KINDS:
+            raise ValueError(f"{path}: [{name}] probe non valido: {probe}")
+        if target:
+            try:
+                probe_target(target)
+            except ValueError as e:
+                raise ValueError(f"{path}: [{name}] probe non valido: {probe} ({e})")
+        restart = sec.get("restart", "always")
+        if restart not in RESTART_POLICIES:
+            raise ValueError(f"{path}: [{name}] restart non valido: {restart}")
+        specs.append(ServiceSpec(
+            name=name,
+            command=command,
+            cwd=sec.get("cwd") or None,
+            probe=probe,
+            restart=restart,
+            restart_delay=sec.getfloat("restart_delay", config.SERVICE_RESTART_DELAY),
+            match=sec.get("match", "").split(),
+            log=sec.get("log") or None,
+        ))
+    return specs
+
+
+class Service:
+    """Istanza in esecuzione di un servizio e relativo controllo di salute."""
+
+    def __init__(self, spec: ServiceSpec):
+        self.spec = spec
+        self.proc: Optional[subprocess.Popen] = None
+        self.pidfd: Optional[int] = None
+        self.probe = None
+        self.start_at: Optional[float] = None   # avvio programmato
+        self.kill_at: Optional[float] = None    # SIGKILL se non è ancora uscito
+        self.restart_requested = False
+        self.restarts = 0
+
+    @property
+    def running(self) -> bool:
+        return self.proc is not None
+
+
+class Supervisor(Daemon):
+    """
+    Avvia e possiede le istanze di rtkrcv/str2str del file dei servizi.
+
+    L'uscita di un figlio è notificata dal suo pidfd nel selector (poll
+    periodico dove pidfd_open non è disponibile); i riavvii richiesti dai
+    controlli di salute terminano solo il gruppo di processi del servizio.
+    """
+
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, specs: List[ServiceSpec], cfg: Config = config,
+                 clock: Callable[[], float] = time.monotonic):
+        self.cfg = cfg
+        self.clock = clock
+        self.shutdown_requested = False
+        self._init_loop(None)
+        self.services = [Service(spec) for spec in specs]
+        for svc in self.services:
+            svc.probe = self._make_probe(svc)
+
+    def _make_probe(self, svc: Service):
+        kind, _, target = svc.spec.probe.partition(":")
+        if kind == "none":
+            return None
+        cfg = self.cfg
+        if target:
+            host, port = probe_target(target)
+            cfg = dataclasses.replace(cfg, HOST=host or cfg.HOST, PORT=port)
+        action = lambda reason, s=svc: self.restart(s, reason)
+        if kind == "rtk":
+            return RTKMonitor(cfg, self.clock, selector=self.selector,
+                              restart_action=action, name=svc.spec.name)
+        return TCPProbe(cfg, self.clock, action, svc.spec.name, self.selector)
+
+    # ------------------------------------------------------------------
+    # Processi figli
+    # ------------------------------------------------------------------
+
+    def _adopt_existing(self) -> None:
+        """Termina le istanze già attive (cron, avvio manuale) dei servizi gestiti."""
+        for svc in self.services:
+            if not svc.spec.match:
+                continue
+            found = lzer0_proc.find_pids(*svc.spec.match)
+            if found:
+                self._log(f"[{svc.spec.name}] Termino istanze esistenti: {' '.join(map(str, found))}")
+                lzer0_proc.terminate(found, self.cfg.KILL_GRACE_TIME)
+
+    def _spawn(self, svc: Service, now: float) -> None:
+        svc.start_at = None
+        out = subprocess.DEVNULL
+        try:
+            if svc.spec.log:
+                out = open(svc.spec.log, "ab")
+            svc.proc = subprocess.Popen(
+                svc.spec.command, cwd=svc.spec.cwd, stdin=subprocess.DEVNULL,
+                stdout=out, stderr=subprocess.STDOUT, start_new_session=True,
+            )
+        except OSError as e:
+            self._log(f"[{svc.spec.name}] Avvio fallito: {e}")
+            svc.start_at = now + max(svc.spec.restart_delay, 1)
+            return
+        finally:
+            if out is not subprocess.DEVNULL:
+                out.close()
+        self._log(f"[{svc.spec.name}] Avviato (PID {svc.proc.pid}): {shlex.join(svc.spec.command)}")
+        try:
+            svc.pidfd = os.pidfd_open(svc.proc.pid)
+            self.selector.register(svc.pidfd, selectors.EVENT_READ,
+                                   lambda s=svc: self._reap(s, self.clock()))
+        except (AttributeError, OSError):
+            svc.pidfd = None   # nessun pidfd: uscita rilevata dal poll periodico
+
+    def _signal(self, svc: Service, sig: int) -> None:
+        try:
+            os.killpg(svc.proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _reap(self, svc: Service, now: float) -> None:
+        """Gestisce l'uscita del figlio secondo la politica di riavvio."""
+        if svc.proc is None or svc.proc.poll() is None:
+            return
+        code = svc.proc.returncode
+        if svc.pidfd is not None:
+            self.selector.unregister(svc.pidfd)
+            os.close(svc.pidfd)
+            svc.pidfd = None
+        svc.proc = None
+        svc.kill_at = None
+        self._log(f"[{svc.spec.name}] Terminato con codice {code}")
+        if self.shutdown_requested:
+            return
+        policy = svc.spec.restart
+        if svc.restart_requested or policy == "always" or (policy == "on-failure" and code != 0):
+            svc.start_at = now + (0 if svc.restart_requested else svc.spec.restart_delay)
+            svc.restarts += 1
+            if svc.probe is not None:
+                svc.probe.notify_restarted(now)
+        svc.restart_requested = False
+
+    def restart(self, svc: Service, reason: str) -> None:
+        """Riavvia solo questo servizio: SIGTERM al gruppo, SIGKILL dopo KILL_GRACE_TIME."""
+        self._log(f"[{svc.spec.name}] Riavvio richiesto: {reason}")
+        if svc.proc is None:
+            if svc.start_at is None:
+                svc.start_at = self.clock()
+            return
+        svc.restart_requested = True
+        self._signal(svc, signal.SIGTERM)
+        svc.kill_at = self.clock() + self.cfg.KILL_GRACE_TIME
+
+    def _stop_all(self) -> None:
+        """Arresta tutti i figli all'uscita del supervisore."""
+        running = [svc for svc in self.services if svc.proc is not None]
+        for svc in running:
+            self._signal(svc, signal.SIGTERM)
+        deadline = time.monotonic() + self.cfg.KILL_GRACE_TIME
+        for svc in running:
+            try:
+                svc.proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self._signal(svc, signal.SIGKILL)
+                svc.proc.wait()
+            self._reap(svc, self.clock())
+
+    def metrics(self) -> List[Sample]:
+        samples = []
+        for svc in self.services:
+            labels = {"service": svc.spec.name}
+            samples += [
+                Sample("lzer0_service_running", "gauge", "Processo del servizio in esecuzione",
+                       int(svc.running), labels),
+                Sample("lzer0_service_restarts_total", "counter", "Riavvii del servizio", svc.restarts, labels),
+            ]
+            if svc.probe is not None:
+                samples += svc.probe.metrics()
+        return samples
+
+    def solutions(self, n: int) -> Dict[str, List[dict]]:
+        out = {}
+        for svc in self.services:
+            if svc.probe is not None:
+                out.update(svc.probe.solutions(n))
+        return out
+
+    # ------------------------------------------------------------------
+    # Ciclo principale
+    # ------------------------------------------------------------------
+
+    def next_deadline(self) -> float:
+        deadlines = []
+        for svc in self.services:
+            if svc.start_at is not None:
+                deadlines.append(svc.start_at)
+            if svc.kill_at is not None:
+                deadlines.append(svc.kill_at)
+            if svc.probe is not None and svc.running:
+                deadlines.append(svc.probe.next_deadline())
+            if svc.running and svc.pidfd is None:
+                deadlines.append(self.clock() + self.POLL_INTERVAL)
+        return min(deadlines, default=self.clock() + self.cfg.CHECK_INTERVAL)
+
+    def run_timers(self, now: float) -> None:
+        for svc in self.services:
+            if svc.running and svc.pidfd is None:
+                self._reap(svc, now)
+            if svc.kill_at is not None and now >= svc.kill_at:
+                svc.kill_at = None
+                self._log(f"[{svc.spec.name}] Non terminato dopo SIGTERM, invio SIGKILL")
+                self._signal(svc, signal.SIGKILL)
+            if svc.start_at is not None and now >= svc.start_at:
+                self._spawn(svc, now)
+            if svc.probe is not None and svc.running and svc.kill_at is None:
+                svc.probe.run_timers(now)
+
+    def step(self, max_wait: Optional[float] = None) -> None:
+        """Attende il prossimo evento (uscita di un figlio, dati, segnale o timer)."""
+        timeout = max(0.0, self._wakeup_deadline(self.next_deadline()) - self.clock())
+        if max_wait is not None:
+            timeout = min(timeout, max_wait)
+        for key, _ in self.selector.select(timeout):
+            key.data()
+        if self.shutdown_requested:
+            return
+        now = self.clock()
+        self._expire_metrics(now)
+        self.run_timers(now)
+
+    def run(self) -> None:
+        """Avvia tutti i servizi e li supervisiona fino allo shutdown."""
+        self._log(f"Supervisore avviato: {', '.join(s.spec.name for s in self.services)}")
+        self._adopt_existing()
+        now = self.clock()
+        for svc in self.services:
+            self._spawn(svc, now)
+            if svc.probe is not None:
+                svc.probe.start(now)
+
+        while not self.shutdown_requested:
+            try:
+                self.step()
+            except Exception as e:
+                self._log(f"Errore imprevisto: {e}")
+                time.sleep(1)
+
+        for svc in self.services:
+            if svc.probe is not None:
+                svc.probe.close()
+        self._stop_all()
+        self._close_metrics()
+        self._log("Shutdown del supervisore completato")
+        self._cleanup_pidfile()
+
+
 def main():
     """Punto di ingresso principale per daemon."""
+    parser = argparse.ArgumentParser(description="Monitoraggio e riavvio di rtkrcv")
+    parser.add_argument("-i", "--interval", type=int, default=config.CHECK_INTERVAL,
+                        help="intervallo di controllo in secondi (anche sotto il minuto)")
+    parser.add_argument("-c", "--services", default=config.SERVICES_FILE,
+                        help="file dei servizi da avviare e supervisionare")
+    parser.add_argument("-m", "--metrics", default=config.METRICS_ADDR,
+                        help="HOST:PORT o socket Unix delle metriche ('' per disabilitare)")
+    args = parser.parse_args()
+    config.CHECK_INTERVAL = max(1, args.interval)
+    config.SERVICES_FILE = args.services
+    config.METRICS_ADDR = args.metrics
+
     # Verifica se un'altra istanza è già in esecuzione
     if os.path.exists(config.PIDFILE):
         try:
             with open(config.PIDFILE, 'r') as f:
                 old_pid = int(f.read().strip())
-            
+
             # Controlla se il processo è ancora attivo
             try:
                 os.kill(old_pid, 0)  # Signal 0 solo per verificare esistenza
@@ -295,8 +1116,29 @@ def main():
         except (ValueError, FileNotFoundError):
             # Pidfile corrotto o non trovato, procedi
             pass
-    
-    monitor = RTKMonitor()
+
+    if os.path.exists(config.SERVICES_FILE):
+        try:
+            specs = load_services(config.SERVICES_FILE)
+        except (OSError, ValueError, configparser.Error) as e:
+            print(f"ERRORE: file dei servizi non valido: {e}")
+            sys.exit(1)
+        supervisor = Supervisor(specs, config)
+        supervisor.daemonize()
+        supervisor.serve_metrics(config.METRICS_ADDR)
+        try:
+            supervisor.run()
+        except Exception as e:
+            supervisor._log(f"Errore fatale: {e}")
+            supervisor._stop_all()
+            sys.exit(1)
+        finally:
+            supervisor._cleanup_pidfile()
+        return
+
+    monitor = RTKMonitor(config)
+    monitor.daemonize()
+    monitor.serve_metrics(config.METRICS_ADDR)
     try:
         monitor.monitor()
     except Exception as e:
@@ -22,9 +22,9 @@ set CFGFILE 	= ${HOME}/cfg/sites.cfg			# it includes ROVER and MASTER GNSS site
 # DEFAULT PARAMS
 set SITE	= "" # ROVER GNSS SITE NAME (default empty string)
 set REFV	= "" # ROVER GNSS SITE NAME (default empty string)
-set YEAR  	= `date +%Y`
-set DOY   	= `date +%j`
-set HOUR  	= `date +%H`
+set YEAR  	= "" # default: the hour just ended (see lzer0.get.session)
+set DOY   	= ""
+set HOUR  	= ""
 set RATE  	= 30 	#sampling rate
 set FORCE 	= "N" 	# do not overwrite existing results
 set FIXLIM 	= 0.10 	# to be used for statistic check
@@ -38,21 +38,6 @@ if ( -e $CFGFILE ) then
         endif
 endif
 #
-# To avoid problems with the last session X for Hour 00
-if ($HOUR == "00" || $HOUR == "0") then
-        set HOUR = 24
-        if ($DOY == 1) then
-                # it happens the 1st of Jannuary at midnight
-                set decDoys = -1
-        else
-                # it happens in all other cases
-                @ decDoys = $DOY - 2
-        endif
-        set DOY = `date -d "$decDoys days ${YEAR}-01-01" +%j`
-        set YEAR = `date -d "$decDoys days ${YEAR}-01-01" +%Y`
-else
-endif
-#
 # check command line params. First one is used to set the site name, second one for brand
 while($#)
         switch($1)
@@ -98,15 +83,14 @@ while($#)
 end
 set site	= `echo $SITE | tr 'A-Z' 'a-z'`
 set refv	= `echo $REFV | tr 'A-Z' 'a-z'`
-set SES		= `echo $HOUR | hr2ses`
-set ses		= `echo $SES | tr 'A-Z' 'a-z'`
-set HOURONDISK	= `echo "$HOUR" | awk ' {if (length($0) <=1) print 0$0; else print $0}'`
-set DOYONDISK	= `echo $DOY | awk '{if (length($0) == 1) print "00"$0} {if (length($0) == 2) print "0"$0} {if (length($0) == 3) print $0}'`
-set YR		= `echo $YEAR | awk '{print substr($0,3,2)}'`
 #
-# Building full date
-@ tempDOY = $DOY - 1
-set FULLDATE = `date -d "$tempDOY days ${YEAR}-01-01" +"%Y.%m.%d"`
+# SES, ses, HOURONDISK, DOYONDISK, YR and FULLDATE in one call (no date/awk);
+# without -h the hour just ended: for Hour 00 the last session X of the day before
+set SESOPTS	= ()
+if ($YEAR != "") set SESOPTS = ($SESOPTS -y $YEAR)
+if ($DOY != "") set SESOPTS = ($SESOPTS -d $DOY)
+if ($HOUR != "") set SESOPTS = ($SESOPTS -h $HOUR)
+eval `lzer0.get.session -c $SESOPTS`
 #
 # Check TMPDIR
 if ( ! -e ${TMPDIR} ) then
@@ -134,10 +118,9 @@ endif
 # Check il results pos file in post processing mode is already there
 if ( ! -e ${finalDir}/${tgtPos}) then
 	echo "Recovering ${SITE} and ${REFV} data into ${TMPDIR}..."
-	echo "lzer0.get.hourlygnss -s ${SITE} -d ${DOY} -h ${HOUR} -sr $RATE"
-	lzer0.get.hourlygnss -s ${SITE} -d ${DOY} -h ${HOUR} -sr $RATE
-	echo "lzer0.get.hourlygnss -s ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE -p"
-	lzer0.get.hourlygnss -s ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE -p
+	# rover and reference converted concurrently
+	echo "lzer0.get.hourlygnss -s ${SITE} -m ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE"
+	lzer0.get.hourlygnss -s ${SITE} -m ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE
 	#
 	# elaboration and  moving result to add
 	cd ${TMPDIR}
@@ -167,10 +150,9 @@ else
 	set sizeTgt = `stat -c %s ${finalDir}/${tgtPos}`
 	if (${FORCE} == "Y" || $sizeTgt == 0) then
         	echo "Recovering ${SITE} and ${REFV} data into ${TMPDIR}..."
-        	echo "lzer0.get.hourlygnss -s ${SITE} -d ${DOY} -h ${HOUR} -sr $RATE"
-        	lzer0.get.hourlygnss -s ${SITE} -d ${DOY} -h ${HOUR} -sr $RATE
-        	echo "lzer0.get.hourlygnss -s ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE -p"
-        	lzer0.get.hourlygnss -s ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE -p
+        	# rover and reference converted concurrently
+        	echo "lzer0.get.hourlygnss -s ${SITE} -m ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE"
+        	lzer0.get.hourlygnss -s ${SITE} -m ${REFV} -d ${DOY} -h ${HOUR} -sr $RATE
 	        #
 		# elaboration and  moving result to add
 		cd ${TMPDIR}
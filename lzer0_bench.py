@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+Benchmark e controllo di regressione degli script di post-elaborazione.
+
+Le fixture sono generate in modo deterministico (random.Random con seme
+fisso) in una directory di lavoro: ore .pos a 1 Hz e a 30 s, file delle
+coordinate, ore grezze UBX e RTCM3 e un albero DUMPDIR di più anni. I
+programmi di RTKLIB sono sostituiti da stub (convbin) in WORK/bin, così
+tutto gira senza ricevitore né RTKLIB installato.
+
+Ogni stadio esegue uno script in un processo figlio, caricato da questo
+modulo (python3 lzer0_bench.py SCRIPT ARGS...) con le costanti TUNING
+sostituite da LZER0_BENCH_SET (JSON), e misura:
+    wall       tempo reale [s]
+    cpu        tempo utente + sistema del figlio e dei suoi figli [s]
+    forks      processi creati (contatore di /proc/stat)
+    read/write byte letti e scritti (/proc/self/io, figli inclusi)
+L'output (stdout o i file prodotti) è ridotto a uno SHA-256 e
+confrontato con bench/golden.json.
+
+geodesy_checks misura l'errore di lzer0_geodesy su punti di riferimento
+pubblicati (UTM ed ECEF) e nei cicli di andata e ritorno.
+"""
+
+import bz2
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+SEED = 20220823
+SITE = "L001"
+REFV = "L000"
+REF_LLH = (45.437181234, 12.335910987, 48.1234)
+FALSE_FIX_LIMIT = 0.05
+
+POS_HEADER = (
+    "% program   : RTKLIB ver.2.4.3 b34\n"
+    "% pos mode  : kinematic\n"
+    "% (lat/lon/height=WGS84/ellipsoidal,Q=1:fix,2:float,3:sbas,4:dgps,5:single,6:ppp,ns=# of satellites)\n"
+    "%  GPST                  latitude(deg) longitude(deg)  height(m)   Q  ns   sdn(m)   sde(m)   sdu(m)"
+    "  sdne(m)  sdeu(m)  sdun(m) age(s)  ratio\n"
+)
+POS_LINE_FORMAT = ("%s %s %14.9f %14.9f %10.4f %3d %3d "
+                   "%8.4f %8.4f %8.4f %8.4f %8.4f %8.4f %6.2f %6.1f\n")
+
+# Albero DUMPDIR: anni, giorni e sessioni con risultati 1Hpp a 30 s
+TREE_YEARS = ("2022", "2023", "2024")
+TREE_DAYS = ("001", "182")
+TREE_SESSIONS = "abc"
+
+# Ora grezza usata da compress e hourlygnss
+RAW_YEAR, RAW_DOY, RAW_HOUR = "2024", "182", 1
+RAW_EPOCHS = 3600
+
+# Punti per wgs842utm33 (lat lon h attorno a REF_LLH)
+LLH_POINTS = 20000
+
+# Riferimenti per lzer0_geodesy: nome, lat, lon, zona, easting, northing, tolleranza [m]
+UTM_REFERENCE = (
+    ("utm.equator.cm", 0.0, 15.0, 33, 500000.0, 0.0, 0.001),
+    # ampiezza della fascia all'equatore: 166021.4431 m
+    ("utm.equator.3deg", 0.0, 12.0, 33, 166021.4431, 0.0, 0.001),
+    # 0.9996 x arco di meridiano a 45 gradi (4984944.3779 m)
+    ("utm.45n.cm", 45.0, 15.0, 33, 500000.0, 4982950.4002, 0.001),
+    # 0.9996 x quarto di meridiano (10001965.7293 m)
+    ("utm.pole", 90.0, 15.0, 33, 500000.0, 9997964.9430, 0.001),
+    # CN Tower, Toronto (zona 17, coordinate pubblicate al metro)
+    ("utm.cntower", 43.642566667, -79.387138889, 17, 630084.0, 4833438.0, 1.0),
+)
+# nome, lat, lon, h, x, y, z, tolleranza [m]
+ECEF_REFERENCE = (
+    ("ecef.equator", 0.0, 0.0, 0.0, 6378137.0, 0.0, 0.0, 0.001),
+    ("ecef.pole", 90.0, 0.0, 0.0, 0.0, 0.0, 6356752.3142, 0.001),
+)
+ROUNDTRIP_TOLERANCE = 1e-4   # [m]
+
+# Stub di convbin: legge l'ingresso due volte come il vero convbin
+# (scansione e conversione) e scrive file deterministici
+CONVBIN_STUB = '''#!/usr/bin/env python3
+import hashlib, sys
+a = sys.argv[1:]
+fmt = a[a.index("-r") + 1]
+src = a[a.index("-r") + 2]
+with open(src, "rb") as f:
+    f.read()
+h = hashlib.sha256()
+with open(src, "rb") as f:
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        h.update(chunk)
+for flag in ("-o", "-n", "-g", "-h", "-q", "-l", "-s"):
+    if flag in a:
+        with open(a[a.index(flag) + 1], "w") as out:
+            out.write("%s %s %s\\n" % (fmt, flag, h.hexdigest()))
+'''
+
+
+# ----------------------------------------------------------------------
+# Fixture
+# ----------------------------------------------------------------------
+
+def pos_hour(rng: random.Random, date: str, hour: int, interval: int) -> str:
+    """Un'ora .pos di RTKLIB: fix con qualche float, single e falso fix."""
+    lines = [POS_HEADER]
+    for k in range(0, 3600, interval):
+        r = rng.random()
+        q = 1 if r < 0.85 else 2 if r < 0.95 else 5
+        sigma = 0.003 if q == 1 else 0.15 if q == 2 else 1.5
+        dlat = rng.gauss(0, 3e-8 if q == 1 else 2e-6)
+        dlon = rng.gauss(0, 3e-8 if q == 1 else 2e-6)
+        dh = rng.gauss(0, 0.008 if q == 1 else 0.3)
+        if q == 1 and rng.random() < 0.01:
+            dlat += 2e-6   # falso fix (circa 0.2 m a nord)
+        lines.append(POS_LINE_FORMAT % (
+            date, "%02d:%02d:%02d.000" % (hour, k // 60, k % 60),
+            REF_LLH[0] + dlat, REF_LLH[1] + dlon, REF_LLH[2] + dh, q, rng.randint(14, 24),
+            sigma, sigma, 2 * sigma, sigma / 3, -sigma / 4, sigma / 5,
+            rng.choice((0.0, 1.0)), rng.uniform(3.0, 30.0) if q == 1 else 0.0))
+    return "".join(lines)
+
+
+def _ubx(cls: int, msg_id: int, payload: bytes) -> bytes:
+    body = bytes((cls, msg_id)) + len(payload).to_bytes(2, "little") + payload
+    ck_a = ck_b = 0
+    for b in body:
+        ck_a = (ck_a + b) & 0xFF
+        ck_b = (ck_b + ck_a) & 0xFF
+    return b"\xb5\x62" + body + bytes((ck_a, ck_b))
+
+
+def ubx_hour(rng: random.Random, epochs: int = RAW_EPOCHS) -> bytes:
+    """Un'ora di UBX: RXM-RAWX (32 satelliti) e NAV-PVT a ogni epoca."""
+    out = []
+    for _ in range(epochs):
+        out.append(_ubx(0x02, 0x15, rng.randbytes(16 + 32 * 32)))
+        out.append(_ubx(0x01, 0x07, rng.randbytes(92)))
+    return b"".join(out)
+
+
+def rtcm3_hour(rng: random.Random, epochs: int = RAW_EPOCHS) -> bytes:
+    """Un'ora di RTCM3: un MSM7 (1077) a ogni epoca, CRC-24Q corretto."""
+    from lzer0_rawfmt import crc24q
+    out = []
+    for _ in range(epochs):
+        payload = (1077 << 4).to_bytes(2, "big") + rng.randbytes(180)
+        head = b"\xd3" + len(payload).to_bytes(2, "big") + payload
+        out.append(head + crc24q(head).to_bytes(3, "big"))
+    return b"".join(out)
+
+
+def _write(path: str, data) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    return path
+
+
+def _doy_date(year: str, doy: str) -> str:
+    return time.strftime("%Y/%m/%d", time.strptime(f"{year} {doy}", "%Y %j"))
+
+
+def make_fixtures(work: str) -> Dict[str, str]:
+    """Genera le fixture in work e restituisce i percorsi per nome."""
+    rng = random.Random(SEED)
+    fx = {"work": work, "dumpdir": f"{work}/gnss", "seed": f"{work}/seed", "bin": f"{work}/bin"}
+    # Nomi standard: posstat ricava l'ora dalla lettera di sessione
+    date = _doy_date(RAW_YEAR, RAW_DOY)
+    name = f"{SITE}.{date.replace('/', '.')}.{RAW_DOY}.{chr(97 + RAW_HOUR)}.pp.pos"
+    fx["pos_1hz"] = _write(f"{work}/pos/1hz/{name}", pos_hour(rng, date, RAW_HOUR, 1))
+    fx["pos_30s"] = _write(f"{work}/pos/30s/{name}", pos_hour(rng, date, RAW_HOUR, 30))
+    fx["crd"] = _write(f"{work}/tab/station.pos",
+                       "%% lat lon h site\n%.9f %.9f %.4f %s\n%.9f %.9f %.4f %s\n" % (
+                           *REF_LLH, SITE, REF_LLH[0] + 0.01, REF_LLH[1], REF_LLH[2], REFV))
+    fx["ubx"] = _write(f"{work}/raw/{SITE}.ubx", ubx_hour(rng))
+    fx["rtcm3"] = _write(f"{work}/raw/{SITE}.rtcm3", rtcm3_hour(rng))
+
+    for year in TREE_YEARS:
+        for doy in TREE_DAYS:
+            day = _doy_date(year, doy)
+            for ses in TREE_SESSIONS:
+                hour = ord(ses) - ord("a")
+                name = f"{SITE}.{day.replace('/', '.')}.{doy}.{ses}.pp.pos"
+                _write(f"{fx['dumpdir']}/{year}/{doy}/1Hpp/{name}", pos_hour(rng, day, hour, 30))
+
+    # Ora grezza (sessione di RAW_HOUR come in hr2ses) per compress e hourlygnss
+    ses = chr(64 + RAW_HOUR).lower()
+    yy = RAW_YEAR[2:]
+    for prefix, site in (("", SITE), ("U", SITE), ("", REFV)):
+        name = f"{prefix}{site}{ses}{yy}.{RAW_DOY}"
+        _write(f"{fx['seed']}/{name}", ubx_hour(rng, RAW_EPOCHS // 4))
+    fx["raw_session"] = f"{fx['dumpdir']}/{RAW_YEAR}/{RAW_DOY}/{ses}"
+
+    fx["llh"] = _write(f"{work}/llh.txt", "".join(
+        "%.9f %.9f %.4f\n" % (REF_LLH[0] + rng.uniform(-1, 1), REF_LLH[1] + rng.uniform(-3, 3),
+                              REF_LLH[2] + rng.uniform(-50, 500))
+        for _ in range(LLH_POINTS)))
+
+    _write(f"{fx['bin']}/convbin", CONVBIN_STUB)
+    os.chmod(f"{fx['bin']}/convbin", 0o755)
+    return fx
+
+
+# ----------------------------------------------------------------------
+# Stadi
+# ----------------------------------------------------------------------
+
+class Stage(NamedTuple):
+    name: str
+    script: str
+    args: List[str]
+    overrides: Dict[str, str] = {}
+    setup: Optional[Callable[[], None]] = None
+    outputs: Optional[Callable[[], bytes]] = None   # None: conta lo stdout
+
+
+def _reset_raw_session(fx: Dict[str, str], compressed: bool) -> None:
+    """Ripristina la sessione grezza dai seed: file grezzi o già compressi."""
+    sdir = fx["raw_session"]
+    shutil.rmtree(sdir, ignore_errors=True)
+    os.makedirs(sdir)
+    for name in sorted(os.listdir(fx["seed"])):
+        if compressed:
+            with open(f"{fx['seed']}/{name}", "rb") as fin, bz2.open(f"{sdir}/{name}.bz2", "wb") as fout:
+                shutil.copyfileobj(fin, fout)
+        else:
+            shutil.copy(f"{fx['seed']}/{name}", sdir)
+
+
+def _tree_digest(path: str, decompress: bool = False) -> bytes:
+    """Nomi e contenuto dei file di una directory (i .bz2 decompressi se richiesto)."""
+    h = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if not os.path.isfile(full):
+            continue
+        opener = bz2.open if decompress and name.endswith(".bz2") else open
+        with opener(full, "rb") as f:
+            h.update(name.encode() + b"\0" + f.read() + b"\0")
+    return h.digest()
+
+
+def stages(fx: Dict[str, str], bindir: str) -> List[Stage]:
+    dumpdir = fx["dumpdir"]
+    batch = f"{dumpdir}/*/*/1Hpp/{SITE}.*.pp.pos"
+    rinex_dir = f"{fx['work']}/rinex"
+
+    def hourly_setup() -> None:
+        _reset_raw_session(fx, compressed=True)
+        shutil.rmtree(f"{fx['work']}/tmp/rinex.cache", ignore_errors=True)
+        shutil.rmtree(rinex_dir, ignore_errors=True)
+
+    def script(name: str) -> str:
+        return os.path.join(bindir, name)
+
+    return [
+        Stage("posavg.1hz", script("lzer0.get.posavg"), ["-f", fx["pos_1hz"], "-s", SITE]),
+        Stage("posavg.30s", script("lzer0.get.posavg"), ["-f", fx["pos_30s"], "-s", SITE]),
+        Stage("posavg.batch", script("lzer0.get.posavg"), ["-g", batch]),
+        Stage("posstat.1hz", script("lzer0.get.posstat"),
+              ["-f", fx["pos_1hz"], "-s", SITE, "-c", fx["crd"], "-t", str(FALSE_FIX_LIMIT)]),
+        Stage("posstat.30s", script("lzer0.get.posstat"),
+              ["-f", fx["pos_30s"], "-s", SITE, "-c", fx["crd"], "-t", str(FALSE_FIX_LIMIT)]),
+        Stage("posstat.batch", script("lzer0.get.posstat"),
+              ["-g", batch, "-c", fx["crd"], "-t", str(FALSE_FIX_LIMIT)]),
+        Stage("fileformat.ubx", script("lzer0.check.fileformat"), ["-f", fx["ubx"]]),
+        Stage("fileformat.rtcm3", script("lzer0.check.fileformat"), ["-f", fx["rtcm3"]]),
+        Stage("compress.hour", script("lzer0.compress.hourlygnss"),
+              ["-s", SITE, "-y", RAW_YEAR, "-d", RAW_DOY, "-h", str(RAW_HOUR)],
+              {"DUMPDIR": dumpdir},
+              setup=lambda: _reset_raw_session(fx, compressed=False),
+              outputs=lambda: _tree_digest(fx["raw_session"], decompress=True)),
+        Stage("hourlygnss.hour", script("lzer0.get.hourlygnss"),
+              ["-s", SITE, "-m", REFV, "-y", RAW_YEAR, "-d", RAW_DOY, "-h", str(RAW_HOUR),
+               "-t", rinex_dir],
+              {"DUMPDIR": dumpdir},
+              setup=hourly_setup,
+              outputs=lambda: _tree_digest(rinex_dir)),
+        Stage("utm.batch", script("wgs842utm33"), ["-f", fx["llh"]]),
+    ]
+
+
+# ----------------------------------------------------------------------
+# Accuratezza di lzer0_geodesy
+# ----------------------------------------------------------------------
+
+def _horizontal_error(lat, lon, lat_ref, lon_ref) -> float:
+    """Massima distanza [m] (approssimata sulla sfera) tra due serie di punti."""
+    import numpy as np
+    from lzer0_geodesy import WGS84_A
+    dlat = np.radians(lat - lat_ref)
+    dlon = np.radians((lon - lon_ref + 180) % 360 - 180) * np.cos(np.radians(lat_ref))
+    return float(np.max(np.hypot(dlat, dlon)) * WGS84_A)
+
+
+def geodesy_checks() -> List[Tuple[str, float, float]]:
+    """(nome, errore massimo [m], tolleranza [m]) di ogni controllo di lzer0_geodesy."""
+    # import qui: gli script misurati (python3 lzer0_bench.py SCRIPT) non caricano numpy per questo
+    import numpy as np
+    from lzer0_geodesy import ecef2llh, enu2llh, llh2ecef, llh2enu, llh2utm, utm2llh
+    checks = []
+    for name, lat, lon, zone, east, north, tol in UTM_REFERENCE:
+        e, n, _ = llh2utm(lat, lon, zone, False)
+        checks.append((name, float(np.hypot(e - east, n - north)), tol))
+    for name, lat, lon, h, x, y, z, tol in ECEF_REFERENCE:
+        xyz = llh2ecef(lat, lon, h)
+        checks.append((name, float(np.sqrt(sum((a - b) ** 2 for a, b in zip(xyz, (x, y, z))))), tol))
+
+    # griglia su tutte le zone, fino a 3.5 gradi dal meridiano centrale
+    lat, dlon = np.meshgrid(np.linspace(-80, 84, 83), np.linspace(-3.5, 3.5, 15))
+    lat = lat.ravel()
+    zone = np.repeat(np.arange(1, 61), lat.size)
+    lat = np.tile(lat, 60)
+    lon = np.tile(dlon.ravel(), 60) + zone * 6 - 183.0
+    h = np.tile(np.linspace(-100, 5000, dlon.size), 60)
+    e, n, _ = llh2utm(lat, lon, zone)
+    lat_back, lon_back = utm2llh(e, n, zone, lat < 0)
+    checks.append(("utm.roundtrip", _horizontal_error(lat_back, lon_back, lat, lon), ROUNDTRIP_TOLERANCE))
+    lat_back, lon_back, h_back = ecef2llh(*llh2ecef(lat, lon, h))
+    checks.append(("ecef.roundtrip", max(_horizontal_error(lat_back, lon_back, lat, lon),
+                                         float(np.max(np.abs(h_back - h)))), ROUNDTRIP_TOLERANCE))
+    ref = REF_LLH
+    near_lat, near_lon = ref[0] + (lat - ref[0]) / 100, ref[1] + ((lon - ref[1] + 180) % 360 - 180) / 100
+    lat_back, lon_back, h_back = enu2llh(*llh2enu(near_lat, near_lon, h, *ref), *ref)
+    checks.append(("enu.roundtrip", max(_horizontal_error(lat_back, lon_back, near_lat, near_lon),
+                                        float(np.max(np.abs(h_back - h)))), ROUNDTRIP_TOLERANCE))
+    return checks
+
+
+# ----------------------------------------------------------------------
+# Misura
+# ----------------------------------------------------------------------
+
+def _proc_io() -> Dict[str, int]:
+    out = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                key, value = line.split(":")
+                out[key] = int(value)
+    except OSError:
+        pass
+    return out
+
+
+def _forks() -> int:
+    try:
+        with open("/proc/stat") as f:
+            for line in f:
+                if line.startswith("processes "):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def run_stage(stage: Stage, fx: Dict[str, str]) -> Dict[str, object]:
+    """Esegue una volta lo stadio e restituisce misure e digest dell'output."""
+    if stage.setup:
+        stage.setup()
+    env = dict(os.environ, HOME=fx["work"], PATH=f"{fx['bin']}:{os.environ.get('PATH', '')}",
+               LZER0_BENCH_SET=json.dumps(stage.overrides), PYTHONDONTWRITEBYTECODE="1")
+    cmd = [sys.executable, os.path.abspath(__file__), stage.script] + stage.args
+    io0, forks0 = _proc_io(), _forks()
+    ru0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, cwd=fx["work"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    io1, forks1 = _proc_io(), _forks()
+    # i percorsi stampati (modalità batch) non dipendono dalla directory di lavoro
+    out = stage.outputs() if stage.outputs else proc.stdout.replace(fx["work"].encode(), b"WORK")
+    digest = hashlib.sha256(out).hexdigest()
+    return {
+        "wall": round(wall, 4),
+        "cpu": round((ru1.ru_utime - ru0.ru_utime) + (ru1.ru_stime - ru0.ru_stime), 4),
+        "forks": max(0, forks1 - forks0 - 1),
+        "read_bytes": io1.get("rchar", 0) - io0.get("rchar", 0),
+        "write_bytes": io1.get("wchar", 0) - io0.get("wchar", 0),
+        "returncode": proc.returncode,
+        "digest": digest,
+        "stderr": proc.stderr.decode(errors="replace")[-2000:] if proc.returncode else "",
+    }
+
+
+def measure(stage: Stage, fx: Dict[str, str], repeat: int) -> Dict[str, object]:
+    """Migliore di repeat esecuzioni (tempo reale minimo); il digest deve essere stabile."""
+    runs = [run_stage(stage, fx) for _ in range(max(1, repeat))]
+    best = dict(min(runs, key=lambda r: r["wall"]))
+    best["runs"] = [r["wall"] for r in runs]
+    best["stable"] = len({r["digest"] for r in runs}) == 1
+    return best
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict],
+            threshold: float, min_delta: float) -> List[str]:
+    """Stadi più lenti del riferimento oltre threshold (relativo) e min_delta [s]."""
+    slow = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if cur["wall"] > base["wall"] * (1 + threshold) and cur["wall"] - base["wall"] > min_delta:
+            slow.append(f"{name}: {base['wall']:.3f} s -> {cur['wall']:.3f} s "
+                        f"(+{100 * (cur['wall'] / base['wall'] - 1):.0f}%)")
+    return slow
+
+
+def _exec_script() -> int:
+    """Esegue sys.argv[1] come script, con le costanti di LZER0_BENCH_SET."""
+    import importlib.util
+    from importlib.machinery import SourceFileLoader
+    path = sys.argv[1]
+    sys.argv = [path] + sys.argv[2:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    loader = SourceFileLoader("__lzer0_bench__", path)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    for key, value in json.loads(os.environ.get("LZER0_BENCH_SET", "{}")).items():
+        setattr(module, key, value)
+    return module.main() or 0
+
+
+if __name__ == "__main__":
+    sys.exit(_exec_script())
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Lettura di sites.cfg per gli script Python.
+
+Stesse regole dei gawk degli script tcsh: righe `chiave: valore`, righe
+con '#' ignorate, spazi del valore rimossi.
+"""
+
+from typing import Dict
+
+
+def read_sites_cfg(path: str) -> Dict[str, str]:
+    """Voci `chiave: valore` di sites.cfg, chiavi minuscole; OSError se il file non si legge."""
+    values = {}
+    with open(path) as f:
+        for line in f:
+            if "#" in line or ":" not in line:
+                continue
+            key, value = line.split(":", 1)
+            values[key.strip().lower()] = value.replace(" ", "").strip()
+    return values
+
+
+def rover_name(path: str) -> str:
+    """Valore di `rover name` in maiuscolo, "" se manca."""
+    return read_sites_cfg(path).get("rover name", "").upper()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Controlli periodici dei servizi lzer0 in un solo processo.
+
+Ogni controllo riproduce uno script tcsh/bash lanciato da cron (stessi
+messaggi negli stessi file di log, stesse azioni di avvio e arresto) ma
+cerca i processi leggendo /proc (lzer0_proc) invece delle catene
+`ps -ef | grep | grep | gawk | wc`, e non lancia `date`/`tr`/`awk`:
+si crea un processo solo quando c'è davvero qualcosa da avviare.
+
+    RTKCheck         lzer0.check.rtk               ogni minuto
+    RecordPosCheck   lzer0.check.recordhourlypos   al minuto 1 di ogni ora
+    SerialPortCheck  lzer0.manage.serialport check ogni 10 minuti
+    ConnectionCheck  lzer0.check.connection        ogni 30 secondi (root)
+
+Scheduler esegue i controlli allineati all'orologio come cron.
+"""
+
+import os
+import signal
+import socket
+import struct
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional
+
+from lzer0_proc import find_pids, tap_recorders
+
+HOME = os.path.expanduser("~")
+BINDIR = f"{HOME}/bin"
+LOGDIR = f"{HOME}/log"
+
+PING_TIMEOUT = 10.0
+SER2NET_CONFIG = "/etc/ser2net.yaml"
+
+
+def append_line(path: str, line: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(line + "\n")
+
+
+def start_detached(cmd: List[str], log_path: Optional[str] = None) -> int:
+    """Esegue uno script di avvio fuori dalla sessione del checker; restituisce il codice di uscita."""
+    out = open(log_path, "ab") if log_path else subprocess.DEVNULL
+    try:
+        return subprocess.call(cmd, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    except OSError:
+        return 127
+    finally:
+        if log_path:
+            out.close()
+
+
+class Check:
+    """Un controllo periodico: eseguito ogni period secondi, a offset secondi dall'allineamento."""
+
+    name = ""
+    period = 60
+    offset = 0
+
+    def run(self) -> None:
+        raise NotImplementedError
+
+    def next_due(self, now: float) -> float:
+        """Primo istante da now in poi con secondi dalla mezzanotte locale = offset (mod period), come cron."""
+        t = time.localtime(now)
+        sod = t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec + now % 1
+        return now + (self.offset - sod) % self.period
+
+
+class RTKCheck(Check):
+    """lzer0.check.rtk: avvia rtkrcv (porta 2950) con lzer0.start.rtk se non è attivo."""
+
+    name = "rtk"
+    period = 60
+
+    def __init__(self, cfg_file: str, log_path: str = f"{LOGDIR}/lzer0.check.rtkrcv.log"):
+        self.cfg_file = cfg_file
+        self.log_path = log_path
+
+    def log(self, msg: str) -> None:
+        append_line(self.log_path, f"{time.strftime('%Y-%m-%d %H:%M:%S')} - {msg}")
+
+    def run(self) -> None:
+        self.log("Starting check for rtkrcv service")
+        pids = find_pids("rtkrcv", "2950")
+        if pids:
+            self.log(f"rtkrcv is running with PID {' '.join(map(str, pids))}")
+        else:
+            self.log("rtkrcv not running. Starting now!")
+            cmd = [f"{BINDIR}/lzer0.start.rtk", "-f", self.cfg_file]
+            self.log(f"Executing: {' '.join(cmd)}")
+            rc = start_detached(cmd)
+            if rc == 0:
+                self.log("Successfully started rtkrcv")
+            else:
+                self.log(f"Failed to start rtkrcv, exit code: {rc}")
+        self.log("Check completed")
+
+
+class RecordPosCheck(Check):
+    """
+    lzer0.check.recordhourlypos: riavvia lo str2str che registra le
+    soluzioni (porta 5754) del sito, se non le registra già
+    lzer0.tap.stream (avviato con -f o con -s del sito).
+    """
+
+    name = "recordhourlypos"
+    period = 3600
+    offset = 60
+
+    def __init__(self, site: str, log_path: str = f"{LOGDIR}/lzer0.check.recordhourlypos.log"):
+        self.site = site.upper()
+        self.log_path = log_path
+
+    def log(self, msg: str) -> None:
+        append_line(self.log_path, f"{time.strftime('%Y-%m-%d %H:%M:%S')} - lzer0.check.recordhourlypos - {msg}")
+
+    def run(self) -> None:
+        pids = find_pids("str2str", self.site, "5754")
+        taps = [pid for pid, site in tap_recorders("pos").items() if site in ("", self.site)]
+        if pids:
+            self.log(f"str2str is running with PID {' '.join(map(str, pids))}")
+        elif taps:
+            self.log(f"lzer0.tap.stream is running with PID {' '.join(map(str, taps))}")
+        else:
+            self.log("str2str is stopped... Restarting now!")
+            start_detached([f"{BINDIR}/lzer0.record.hourlypos", "-s", self.site])
+            self.log(f"Restarted str2str for site {self.site}")
+
+
+class SerialPortCheck(Check):
+    """
+    lzer0.manage.serialport check: la porta seriale del ricevitore deve
+    essere di ser2net oppure di un solo str2str (serial -> 2222); in
+    ogni altro caso ser2net viene fermato e avviato str2str.
+    """
+
+    name = "serialport"
+    period = 600
+
+    def __init__(self, log_path: str = f"{LOGDIR}/lzer0.manage.serialport.check.log"):
+        self.log_path = log_path
+
+    @staticmethod
+    def ser2net_status() -> int:
+        # come lzer0.manage.ser2net: il demone con il suo file di configurazione,
+        # non qualunque riga che contenga "ser2net" (es. lo script stesso da cron)
+        return 1 if find_pids("ser2net", SER2NET_CONFIG) else 0
+
+    @staticmethod
+    def str2str_status() -> int:
+        # come `ps | grep | wc -l`: 2 istanze non sono uno stato valido
+        return len(find_pids("str2str", "serial", "2222"))
+
+    def log(self, msg: str) -> None:
+        line = f"[{time.strftime('%H:%M')}] {msg}"
+        append_line(self.log_path, line)
+        print(line, flush=True)
+
+    def run(self) -> None:
+        sta1, sta2 = self.ser2net_status(), self.str2str_status()
+        if sta1 == 1 and sta2 == 0:
+            self.log("Status: ser2net")
+        elif sta1 == 0 and sta2 == 1:
+            self.log("Status: str2str")
+        else:
+            self.log("Status: UNKN, launch str2str")
+            # lzer0.manage.ser2net stop, lzer0.manage.str2str start
+            if sta1 == 1:
+                start_detached(["sudo", "systemctl", "stop", "ser2net"])
+            if sta2 != 1:
+                start_detached([f"{BINDIR}/lzer0.ser2tcp.ubx"], f"{LOGDIR}/lzer0.ser2tcp.ubx.log")
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    s = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+
+def ping(host: str, timeout: float = PING_TIMEOUT) -> bool:
+    """
+    Un echo ICMP, come `ping -c 1`: socket ICMP non privilegiato o raw
+    (root); se nessuno dei due è disponibile, il comando ping.
+    """
+    for kind in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+        with sock:
+            ident = os.getpid() & 0xFFFF
+            payload = struct.pack("!d", time.time())
+            header = struct.pack("!BBHHH", 8, 0, 0, ident, 1)
+            packet = struct.pack("!BBHHH", 8, 0, _icmp_checksum(header + payload), ident, 1) + payload
+            deadline = time.monotonic() + timeout
+            try:
+                sock.sendto(packet, (host, 0))
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    sock.settimeout(remaining)
+                    data, addr = sock.recvfrom(1024)
+                    if kind == socket.SOCK_RAW:
+                        data = data[(data[0] & 0x0F) * 4:]   # intestazione IP
+                        if data[4:6] != struct.pack("!H", ident):
+                            continue
+                    # con SOCK_DGRAM il kernel riscrive l'identificativo e filtra le risposte
+                    if addr[0] == host and data[:1] == b"\x00":
+                        return True
+            except OSError:
+                return False
+    try:
+        return subprocess.call(["ping", "-c", "1", host], stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0
+    except OSError:
+        return False
+
+
+class ConnectionCheck(Check):
+    """
+    lzer0.check.connection (root): con eth0 assente controlla la VPN e,
+    in subordine, Internet; a ogni errore rilancia lzer0.start.4GNet e
+    dopo 5 errori consecutivi passa all'altro operatore.
+    """
+
+    name = "connection"
+    period = 30
+    tries_max = 5
+
+    def __init__(self, vpn_host: str = "10.55.66.1", internet_host: str = "8.8.8.8",
+                 provider_file: str = "/home/lzer0/var/provider.config",
+                 start_cmd: str = "/home/lzer0/bin/lzer0.start.4GNet",
+                 log_path: str = "/home/lzer0/log/lzer0.check.connection.log",
+                 wired: str = "eth0", pinger: Callable[[str], bool] = ping):
+        self.vpn_host = vpn_host
+        self.internet_host = internet_host
+        self.provider_file = provider_file
+        self.start_cmd = start_cmd
+        self.log_path = log_path
+        self.wired = wired
+        self.ping = pinger
+        self.tries = 0
+
+    def log(self, msg: str) -> None:
+        append_line(self.log_path, f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
+        print(msg, flush=True)
+
+    def switch_provider(self) -> None:
+        try:
+            with open(self.provider_file) as f:
+                provider = f.read().strip()
+        except OSError:
+            provider = ""
+        if provider == "vodafone":
+            provider = "tim"
+        elif provider == "tim":
+            provider = "vodafone"
+        else:
+            self.log("No provider found, set vodafone as default.")
+            provider = "vodafone"
+        with open(self.provider_file, "w") as f:
+            f.write(provider + "\n")
+
+    def run(self) -> None:
+        if os.path.exists(f"/sys/class/net/{self.wired}"):
+            self.tries = 0
+            self.log(f"{self.wired} interface detected. Suspending lte connection check.")
+            return
+        if self.tries >= self.tries_max:
+            # dopo 5 tentativi falliti si cambia operatore, senza un altro ping
+            self.tries = 0
+            self.log("Connection is down. Trying to set another provider...")
+            self.switch_provider()
+            start_detached([self.start_cmd])
+            return
+        if self.ping(self.vpn_host):
+            self.tries = 0
+            self.log("Connection is up.")
+        elif self.ping(self.internet_host):
+            self.tries = 0
+            self.log("VPN connection is down, but Google is reachable.")
+        else:
+            self.tries += 1
+            self.log(f"Connection is down. Trying to reconnect... {self.tries}")
+            start_detached([self.start_cmd])
+
+
+class Scheduler:
+    """Esegue i controlli alla loro scadenza finché stop() non viene chiamato."""
+
+    def __init__(self, checks: List[Check], log: Callable[[str], None] = print):
+        self.checks = checks
+        self.log = log
+        self.running = True
+        self._wake = threading.Event()
+        self.runs = {c.name: 0 for c in checks}
+        self.errors = {c.name: 0 for c in checks}
+
+    def stop(self, *_) -> None:
+        self.running = False
+        self._wake.set()
+
+    def run_check(self, check: Check) -> None:
+        self.runs[check.name] += 1
+        try:
+            check.run()
+        except Exception as e:   # un controllo guasto non ferma gli altri
+            self.errors[check.name] += 1
+            self.log(f"{check.name}: {type(e).__name__}: {e}")
+
+    def run(self, run_now: bool = True) -> None:
+        now = time.time()
+        due = {c.name: now if run_now else c.next_due(now) for c in self.checks}
+        while self.running:
+            now = time.time()
+            for check in self.checks:
+                if due[check.name] <= now:
+                    self.run_check(check)
+                    due[check.name] = check.next_due(max(now, due[check.name]) + 0.5)
+            if not self.running:
+                break
+            delay = min(due.values()) - time.time()
+            if delay > 0:
+                # time.sleep riprenderebbe dopo il segnale: stop() sveglia l'attesa
+                self._wake.wait(delay)
+
+    def install_signals(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Compressione bz2 dei file orari grezzi GNSS (DUMPDIR/YEAR/DOY/ses).
+
+Sostituisce le chiamate ricorsive di lzer0.compress.hourlygnss (una per
+ora, con molti `date`/`awk`/`tr`) e il `bzip2` a singolo core: ogni
+directory di sessione viene letta una sola volta, tutti i file grezzi
+dei prefissi ''/U/R vengono compressi in parallelo (il modulo bz2 rilascia
+il GIL, quindi i thread usano tutti i core) e in streaming.
+
+Il .bz2 viene scritto in un file temporaneo nascosto e rinominato solo a
+compressione completata, poi il grezzo viene rimosso: un .bz2 parziale
+non può mai nascondere il file originale. Se un'esecuzione si interrompe
+tra rinomina e rimozione, la successiva riconosce la coppia (stessa
+mtime, come fa bzip2) e completa la rimozione.
+"""
+
+import argparse
+import bz2
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, List, Tuple
+
+from lzer0_session import Hour, from_script_hour, from_session, past_hours
+
+PREFIXES = ("", "U", "R")
+CHUNK_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 9   # come bzip2 senza opzioni
+PART_SUFFIX = ".part"
+
+# Esiti di compress_file
+BUILT = "built"
+EXISTS = "exists"
+RESUMED = "resumed"
+
+
+def add_time_args(parser: argparse.ArgumentParser) -> None:
+    """Opzioni di data/ora comuni a lzer0.compress.hourlygnss e hourlygnssall."""
+    now = datetime.now()
+    parser.add_argument("-y", dest="year", default=now.strftime("%Y"))
+    parser.add_argument("-d", dest="doy", default=now.strftime("%j"))
+    parser.add_argument("-h", dest="hour", type=int, default=now.hour)
+    parser.add_argument("-l", dest="ses", default=None)
+    parser.add_argument("-p", dest="phours", type=int, default=None)
+    parser.add_argument("-w", dest="force", action="store_true")
+    parser.add_argument("-j", dest="jobs", type=int, default=os.cpu_count() or 1)
+
+
+def sessions_from_args(args: argparse.Namespace) -> List[Hour]:
+    """Sessione indicata (-y/-d/-h o -l) oppure le NHOURS ore precedenti (-p)."""
+    if args.phours:
+        return past_hours(args.phours)
+    if args.ses:
+        return [from_session(args.year, args.doy, args.ses)]
+    return [from_script_hour(args.year, args.doy, args.hour)]
+
+
+def find_raw(dumpdir: str, sites: Iterable[str],
+             sessions: Iterable[Hour]) -> Iterator[Tuple[str, str, bool]]:
+    """
+    Per ogni sito e sessione restituisce (percorso base, prefisso, presente).
+
+    Ogni directory di sessione viene letta una sola volta; per i prefissi
+    con grezzo o .bz2 su disco viene restituito un elemento ciascuno,
+    altrimenti uno solo (prefisso '') con presente=False.
+    """
+    sites = [s.upper() for s in sites]
+    for session in sessions:
+        sdir = session.session_dir(dumpdir)
+        try:
+            names = set(os.listdir(sdir))
+        except OSError:
+            names = set()
+        for site in sites:
+            found = False
+            for prefix in PREFIXES:
+                name = session.raw_name(site, prefix)
+                if name in names or f"{name}.bz2" in names:
+                    found = True
+                    yield os.path.join(sdir, name), prefix, True
+            if not found:
+                yield os.path.join(sdir, session.raw_name(site)), "", False
+
+
+def _part_path(bz2_path: str) -> str:
+    head, tail = os.path.split(bz2_path)
+    return os.path.join(head, f".{tail}{PART_SUFFIX}")
+
+
+def _same_source(raw: str, bz2_path: str) -> bool:
+    """Il .bz2 deriva da questo grezzo (compressione completata ma grezzo non rimosso)."""
+    try:
+        return os.stat(raw).st_mtime_ns == os.stat(bz2_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def compress_file(raw: str, force: bool = False) -> str:
+    """
+    Comprime raw in raw.bz2 in streaming, con scrittura atomica, e rimuove raw.
+
+    Senza force un .bz2 già presente non viene sovrascritto (EXISTS).
+    """
+    target = f"{raw}.bz2"
+    if os.path.exists(target) and not force:
+        if _same_source(raw, target):
+            os.remove(raw)
+            return RESUMED
+        return EXISTS
+    part = _part_path(target)
+    comp = bz2.BZ2Compressor(COMPRESS_LEVEL)
+    try:
+        with open(raw, "rb") as fin, open(part, "wb") as fout:
+            while True:
+                chunk = fin.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = comp.compress(chunk)
+                if data:
+                    fout.write(data)
+            fout.write(comp.flush())
+            fout.flush()
+            os.fsync(fout.fileno())
+        shutil.copystat(raw, part)
+        os.replace(part, target)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    os.remove(raw)
+    return BUILT
+
+
+def cleanup_parts(dirs: Iterable[str]) -> None:
+    """Rimuove i .part rimasti da un'esecuzione interrotta."""
+    for d in set(dirs):
+        try:
+            names = os.listdir(d)
+        except OSError:
+            continue
+        for name in names:
+            if name.startswith(".") and name.endswith(".bz2" + PART_SUFFIX):
+                try:
+                    os.remove(os.path.join(d, name))
+                except OSError:
+                    pass
+
+
+def compress_all(raws: List[str], force: bool = False,
+                 workers: int = os.cpu_count() or 1) -> Iterator[Tuple[str, str]]:
+    """Comprime in parallelo i file grezzi; restituisce (percorso, esito o errore)."""
+    cleanup_parts(os.path.dirname(r) for r in raws)
+
+    def job(raw: str) -> Tuple[str, str]:
+        try:
+            return raw, compress_file(raw, force)
+        except OSError as e:
+            return raw, f"error: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        yield from pool.map(job, raws)
+
+
+def run(dumpdir: str, sites: Iterable[str], sessions: Iterable[Hour],
+        force: bool = False, workers: int = os.cpu_count() or 1) -> int:
+    """Trova e comprime i file delle sessioni indicate stampando i messaggi degli script tcsh."""
+    todo = []
+    for raw, _, present in find_raw(dumpdir, sites, sessions):
+        if not present:
+            print(f"{raw} not present on disk")
+        elif not os.path.exists(raw):
+            print(f"{raw}.bz2 already exists.")
+        else:
+            todo.append(raw)
+    errors = 0
+    for raw, result in compress_all(todo, force, workers):
+        if result == BUILT:
+            print(f"{raw}.bz2 building.")
+        elif result == RESUMED:
+            print(f"{raw}.bz2 already built, {raw} removed.")
+        elif result == EXISTS:
+            print(f"{raw}.bz2 already exists.")
+        else:
+            errors += 1
+            print(f"{raw}.bz2 {result}")
+    return 1 if errors else 0
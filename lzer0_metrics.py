@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Metriche dei daemon lzer0 (monitor di rtkrcv, supervisore).
+
+SolutionRing conserva le ultime N soluzioni di rtkrcv in array a
+dimensione fissa (tempo, status, satelliti, sigma, ratio): la memoria
+occupata non cresce con i mesi di funzionamento. Timing accumula numero,
+somma e massimo di una durata (es. la lettura delle soluzioni).
+
+MetricsServer risponde su una porta TCP locale o su un socket Unix,
+dentro il ciclo a eventi (selectors) del daemon, senza thread:
+    /metrics       formato testo di Prometheus
+    /metrics.json  le stesse metriche e le soluzioni recenti in JSON
+"""
+
+import json
+import os
+import selectors
+import socket
+import time
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, urlsplit
+
+REQUEST_MAX = 4096
+REQUEST_TIMEOUT = 5.0
+SEND_TIMEOUT = 2.0
+JSON_SOLUTIONS = 300
+THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+
+
+class Sample(NamedTuple):
+    """Un valore di una metrica con le sue etichette."""
+    name: str
+    kind: str   # counter | gauge
+    help: str
+    value: float
+    labels: Dict[str, str] = {}
+
+
+class Timing:
+    """Numero, somma e massimo di una durata in secondi."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def samples(self, name: str, help: str, labels: Dict[str, str]) -> List[Sample]:
+        return [
+            Sample(f"{name}_seconds_count", "counter", help, self.count, labels),
+            Sample(f"{name}_seconds_sum", "counter", help, self.total, labels),
+            Sample(f"{name}_seconds_max", "gauge", help, self.max, labels),
+        ]
+
+
+class SolutionRing:
+    """Ultime capacity soluzioni in array a dimensione fissa (buffer circolare)."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.t = array("d", bytes(8 * capacity))
+        self.q = array("b", bytes(capacity))
+        self.ns = array("H", bytes(2 * capacity))
+        self.sdn = array("f", bytes(4 * capacity))
+        self.sde = array("f", bytes(4 * capacity))
+        self.sdu = array("f", bytes(4 * capacity))
+        self.ratio = array("f", bytes(4 * capacity))
+        self.head = 0    # prossima posizione da scrivere
+        self.size = 0
+        self.total = 0   # soluzioni ricevute dall'avvio
+
+    def append(self, t: float, sol) -> None:
+        """Aggiunge una soluzione (lzer0_rtk.Solution) ricevuta all'istante t."""
+        i = self.head
+        self.t[i] = t
+        self.q[i] = int(sol.q) if sol.q.isdigit() else 0
+        self.ns[i] = min(max(sol.ns, 0), 65535)
+        self.sdn[i] = sol.sdn
+        self.sde[i] = sol.sde
+        self.sdu[i] = sol.sdu
+        self.ratio[i] = sol.ratio
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.total += 1
+
+    def _indices(self, n: Optional[int] = None) -> range:
+        """Posizioni delle ultime n soluzioni, dalla più vecchia."""
+        n = self.size if n is None else min(n, self.size)
+        start = self.head - n
+        return range(start, self.head)
+
+    def recent(self, n: Optional[int] = None) -> List[dict]:
+        out = []
+        for j in self._indices(n):
+            i = j % self.capacity
+            out.append({"time": self.t[i], "q": self.q[i], "ns": self.ns[i],
+                        "sdn": round(self.sdn[i], 4), "sde": round(self.sde[i], 4),
+                        "sdu": round(self.sdu[i], 4), "ratio": round(self.ratio[i], 1)})
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        """Conteggi per status, ratio di fix e medie sulla finestra del buffer."""
+        counts: Dict[int, int] = {}
+        ns = 0
+        for j in self._indices():
+            i = j % self.capacity
+            counts[self.q[i]] = counts.get(self.q[i], 0) + 1
+            ns += self.ns[i]
+        n = self.size
+        last = (self.head - 1) % self.capacity
+        return {
+            "size": n,
+            "counts": counts,
+            "fix_ratio": counts.get(1, 0) / n if n else 0.0,
+            "mean_ns": ns / n if n else 0.0,
+            "span": self.t[last] - self.t[(self.head - n) % self.capacity] if n else 0.0,
+            "last_sdn": round(self.sdn[last], 4) if n else 0.0,
+            "last_sde": round(self.sde[last], 4) if n else 0.0,
+            "last_sdu": round(self.sdu[last], 4) if n else 0.0,
+        }
+
+    def samples(self, labels: Dict[str, str]) -> List[Sample]:
+        s = self.summary()
+        out = [
+            Sample("lzer0_rtk_solutions_total", "counter", "Soluzioni ricevute da rtkrcv", self.total, labels),
+            Sample("lzer0_rtk_window_size", "gauge", "Soluzioni nel buffer circolare", s["size"], labels),
+            Sample("lzer0_rtk_window_seconds", "gauge", "Intervallo coperto dal buffer", s["span"], labels),
+            Sample("lzer0_rtk_fix_ratio", "gauge", "Frazione di soluzioni fix (Q=1) nel buffer", s["fix_ratio"], labels),
+            Sample("lzer0_rtk_mean_satellites", "gauge", "Numero medio di satelliti nel buffer", s["mean_ns"], labels),
+        ]
+        for q, count in sorted(s["counts"].items()):
+            out.append(Sample("lzer0_rtk_window_solutions", "gauge", "Soluzioni nel buffer per status Q",
+                              count, {**labels, "q": str(q)}))
+        for axis in ("sdn", "sde", "sdu"):
+            out.append(Sample(f"lzer0_rtk_last_{axis}_meters", "gauge", f"Ultima deviazione standard {axis}",
+                              s[f"last_{axis}"], labels))
+        return out
+
+
+def host_samples() -> List[Sample]:
+    """Carico e temperatura della CPU (le informazioni di lzer0.log.temp)."""
+    out = [Sample("lzer0_load1", "gauge", "Carico medio a 1 minuto", os.getloadavg()[0])]
+    try:
+        with open(THERMAL_ZONE) as f:
+            out.append(Sample("lzer0_cpu_temperature_celsius", "gauge", "Temperatura della CPU",
+                              int(f.read()) / 1000))
+    except (OSError, ValueError):
+        pass
+    return out
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                    for k, v in labels.items())
+    return "{" + body + "}"
+
+
+def render_prometheus(samples: List[Sample]) -> str:
+    """
+    Formato testo di Prometheus, con HELP/TYPE una volta per metrica.
+
+    I campioni sono raggruppati per nome (nell'ordine della prima
+    comparsa), così una famiglia prodotta da più servizi non è spezzata.
+    """
+    families: Dict[str, List[Sample]] = {}
+    for s in samples:
+        families.setdefault(s.name, []).append(s)
+    lines = []
+    for name, family in families.items():
+        lines.append(f"# HELP {name} {family[0].help}")
+        lines.append(f"# TYPE {name} {family[0].kind}")
+        lines.extend(f"{name}{_labels(s.labels)} {s.value:.10g}" for s in family)
+    return "\n".join(lines) + "\n"
+
+
+def render_json(samples: List[Sample], solutions: Dict[str, List[dict]]) -> str:
+    metrics: Dict[str, list] = {}
+    for s in samples:
+        metrics.setdefault(s.name, []).append({"labels": s.labels, "value": s.value})
+    return json.dumps({"time": time.time(), "metrics": metrics, "solutions": solutions})
+
+
+class MetricsServer:
+    """
+    Endpoint HTTP minimo nel selector del daemon.
+
+    addr è HOST:PORT oppure il percorso di un socket Unix. samples e
+    solutions sono chiamati a ogni richiesta; solutions(n) restituisce le
+    ultime n soluzioni per servizio. Una connessione che non completa la
+    richiesta entro REQUEST_TIMEOUT secondi è chiusa da expire(), che il
+    daemon chiama dai suoi timer (next_deadline()).
+    """
+
+    def __init__(self, addr: str, selector: selectors.BaseSelector,
+                 samples: Callable[[], List[Sample]],
+                 solutions: Callable[[int], Dict[str, List[dict]]],
+                 clock: Callable[[], float] = time.monotonic):
+        self.addr = addr
+        self.selector = selector
+        self.samples = samples
+        self.solutions = solutions
+        self.clock = clock
+        self.requests = 0
+        self.conns: Dict[socket.socket, float] = {}   # connessione -> scadenza
+        self.sock = self._listen(addr)
+        self.selector.register(self.sock, selectors.EVENT_READ, self._accept)
+
+    @staticmethod
+    def _listen(addr: str) -> socket.socket:
+        if addr.startswith("/"):
+            try:
+                os.remove(addr)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(addr)
+        else:
+            host, _, port = addr.rpartition(":")
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((host or "127.0.0.1", int(port)))
+        sock.listen(8)
+        sock.setblocking(False)
+        return sock
+
+    def _accept(self) -> None:
+        try:
+            conn, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(False)
+        buf = bytearray()
+        self.selector.register(conn, selectors.EVENT_READ, lambda: self._read(conn, buf))
+        self.conns[conn] = self.clock() + REQUEST_TIMEOUT
+
+    def next_deadline(self) -> Optional[float]:
+        """Prima scadenza delle connessioni aperte, None se non ce ne sono."""
+        return min(self.conns.values(), default=None)
+
+    def expire(self, now: float) -> None:
+        """Chiude le connessioni che non hanno completato la richiesta in tempo."""
+        for conn, deadline in list(self.conns.items()):
+            if now >= deadline:
+                self._drop(conn)
+
+    def _drop(self, conn: socket.socket) -> None:
+        self.conns.pop(conn, None)
+        try:
+            self.selector.unregister(conn)
+        except (KeyError, ValueError):
+            pass
+        conn.close()
+
+    def _read(self, conn: socket.socket, buf: bytearray) -> None:
+        try:
+            data = conn.recv(REQUEST_MAX)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        buf += data
+        if data and b"\r\n\r\n" not in buf and b"\n\n" not in buf and len(buf) < REQUEST_MAX:
+            return
+        self.conns.pop(conn, None)
+        self.selector.unregister(conn)
+        try:
+            if data:
+                self._respond(conn, bytes(buf))
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def _respond(self, conn: socket.socket, request: bytes) -> None:
+        parts = request.split(b"\r\n", 1)[0].split()
+        target = urlsplit(parts[1].decode("latin-1") if len(parts) > 1 else "/")
+        self.requests += 1
+        if target.path in ("/", "/metrics"):
+            status, ctype = "200 OK", "text/plain; version=0.0.4"
+            body = render_prometheus(self.samples())
+        elif target.path == "/metrics.json":
+            try:
+                n = int(parse_qs(target.query).get("n", [JSON_SOLUTIONS])[0])
+            except ValueError:
+                n = JSON_SOLUTIONS
+            status, ctype = "200 OK", "application/json"
+            body = render_json(self.samples(), self.solutions(max(0, n)))
+        else:
+            status, ctype, body = "404 Not Found", "text/plain", "not found\n"
+        data = body.encode()
+        head = (f"HTTP/1.0 {status}\r\nContent-Type: {ctype}\r\n"
+                f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n").encode()
+        conn.settimeout(SEND_TIMEOUT)
+        conn.sendall(head + data)
+
+    def close(self) -> None:
+        for conn in list(self.conns):
+            self._drop(conn)
+        try:
+            self.selector.unregister(self.sock)
+        except (KeyError, ValueError):
+            pass
+        self.sock.close()
+        if self.addr.startswith("/"):
+            try:
+                os.remove(self.addr)
+            except OSError:
+                pass
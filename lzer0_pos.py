@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Lettura e statistiche dei file .pos generati da RTKLIB (rtkrcv, rnx2rtkp).
+
+Colonne di una riga di soluzione (le intestazioni contengono '%'):
+%  GPST                  latitude(deg) longitude(deg)  height(m)   Q  ns   sdn(m)   sde(m)   sdu(m)  sdne(m)  sdeu(m)  sdun(m) age(s)  ratio
+
+Il modulo legge ogni file una sola volta e accumula tutte le medie
+necessarie in un unico passaggio, al posto delle molte pipeline
+`cat | grep | awk` dei vecchi script tcsh.
+"""
+
+import glob
+import os
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional
+
+# Valori del campo Q
+Q_FIX = 1
+Q_FLOAT = 2
+Q_SBAS = 3
+Q_DGPS = 4
+Q_SINGLE = 5
+Q_PPP = 6
+
+# Riga di media oraria, identica a quella stampata da lzer0.get.posavg
+MEAN_LINE_FORMAT = ("%10s %12s %14.9f %14.9f %10.4f %3.0f %3.0f "
+                    "%8.4f %8.4f %8.4f %8.4f %8.4f %8.4f %6.2f %6.1f")
+
+# Riga di statistica oraria (file .stat), come da lzer0.get.posstat
+STAT_HEADER = "%-10s %6s %6s %6s %6s %6s %6s" % (
+    "DATE", "O/E%", "OTH%", "STD%", "FLT%", "FIX%", "FFIX%")
+STAT_LINE_FORMAT = "%-10s %6.2f %6.2f %6.2f %6.2f %6.2f %6.2f"
+
+# Numero di epoche attese in un'ora (per O/E%)
+EXPECTED_HOURLY_OBS = 3600
+
+
+def iter_pos_rows(path: str, comment: str = "%") -> Iterator[List[str]]:
+    """Restituisce i campi di ogni riga che non contiene il carattere di commento."""
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            if comment in line:
+                continue
+            yield line.split()
+
+
+def _num(fields: List[str], idx: int) -> float:
+    """Conversione numerica tollerante come in awk (campo mancante o non numerico = 0)."""
+    try:
+        return float(fields[idx])
+    except (IndexError, ValueError):
+        return 0.0
+
+
+@dataclass
+class PosMean:
+    """Media oraria delle epoche con la qualità richiesta."""
+    date: str
+    hour: str
+    quality: int
+    count: int
+    lat: float
+    lon: float
+    height: float
+    nsat: float
+    sdn: float
+    sde: float
+    sdu: float
+    sdne: float
+    sdeu: float
+    sdun: float
+    age: float
+    ratio: float
+    time: Optional[str] = None   # epoca della riga (default metà dell'ora)
+
+    def format_line(self) -> str:
+        """Riga a larghezza fissa nel formato del file .mean.pos."""
+        # Gli arrotondamenti intermedi replicano i printf degli awk originali
+        height = float("%8.3f" % self.height)
+        nsat = float("%1.0f" % self.nsat)
+        return MEAN_LINE_FORMAT % (
+            self.date, self.time or f"{self.hour}:30:00.000",
+            self.lat, self.lon, height, self.quality, nsat,
+            self.sdn, self.sde, self.sdu, self.sdne, self.sdeu, self.sdun,
+            self.age, self.ratio,
+        )
+
+
+class PosAverager:
+    """
+    Accumulatore a passaggio singolo per le medie di un file .pos.
+
+    Per ogni epoca con Q uguale alla qualità scelta somma coordinate,
+    numero di satelliti, quadrati delle sigma (per l'RMS), age e ratio.
+    Di tutte le epoche conserva solo data e ora, necessarie per
+    individuare l'epoca di riferimento di metà ora.
+    """
+
+    def __init__(self, quality: int = Q_FIX):
+        self.quality = quality
+        self._quality_str = str(quality)
+        self._stamps: List[tuple] = []
+        self.count = 0
+        self._lat = self._lon = self._height = self._nsat = 0.0
+        self._sd2 = [0.0] * 6
+        self._age = self._ratio = 0.0
+
+    def add(self, fields: List[str]) -> None:
+        """Aggiunge una riga già suddivisa in campi."""
+        self._stamps.append((fields[0] if fields else "",
+                             fields[1] if len(fields) > 1 else ""))
+        if len(fields) < 6 or fields[5] != self._quality_str:
+            return
+        self.count += 1
+        self._lat += _num(fields, 2)
+        self._lon += _num(fields, 3)
+        self._height += _num(fields, 4)
+        self._nsat += _num(fields, 6)
+        sd2 = self._sd2
+        for i in range(6):
+            v = _num(fields, 7 + i)
+            sd2[i] += v * v
+        self._age += _num(fields, 13)
+        self._ratio += _num(fields, 14)
+
+    def add_rows(self, rows: Iterable[List[str]]) -> "PosAverager":
+        for fields in rows:
+            self.add(fields)
+        return self
+
+    def result(self) -> Optional[PosMean]:
+        """Restituisce la media, oppure None se non ci sono epoche valide."""
+        n = self.count
+        if n < 1:
+            return None
+        # Come `tail -n N/2 | head -n 1` sulle righe non di intestazione
+        middle = n // 2
+        date, time = self._stamps[-middle] if middle > 0 else ("", "")
+        return PosMean(
+            date=date, hour=time[:2], quality=self.quality, count=n,
+            lat=self._lat / n, lon=self._lon / n, height=self._height / n,
+            nsat=self._nsat / n,
+            sdn=(self._sd2[0] / n) ** 0.5, sde=(self._sd2[1] / n) ** 0.5,
+            sdu=(self._sd2[2] / n) ** 0.5, sdne=(self._sd2[3] / n) ** 0.5,
+            sdeu=(self._sd2[4] / n) ** 0.5, sdun=(self._sd2[5] / n) ** 0.5,
+            age=self._age / n, ratio=self._ratio / n,
+        )
+
+
+def pos_mean(path: str, quality: int = Q_FIX) -> Optional[PosMean]:
+    """Media di un singolo file .pos letto in streaming."""
+    return PosAverager(quality).add_rows(iter_pos_rows(path)).result()
+
+
+def _awk_pct(num: float, den: float) -> float:
+    """Percentuale num/den*100 con l'arrotondamento di `print` in awk (OFMT %.6g)."""
+    if den == 0:
+        return 0.0
+    v = num / den * 100
+    return float("%d" % v if v == int(v) else "%.6g" % v)
+
+
+def format_stat_line(date: str, total: int, oth: int, std: int, flt: int,
+                     fix: int, false_fix: int,
+                     expected: int = EXPECTED_HOURLY_OBS) -> str:
+    """Riga a larghezza fissa nel formato del file .stat."""
+    return STAT_LINE_FORMAT % (
+        date, _awk_pct(total, expected),
+        _awk_pct(oth, total), _awk_pct(std, total),
+        _awk_pct(flt, total), _awk_pct(fix, total),
+        _awk_pct(false_fix, fix),
+    )
+
+
+def read_station_coords(path: str, site: str) -> Optional[tuple]:
+    """Coordinate a priori (lat, lon, h) di SITE dal file delle stazioni (es. station.pos)."""
+    site = site.upper()
+    for fields in iter_pos_rows(path):
+        if len(fields) >= 4 and fields[3] == site:
+            return float(fields[0]), float(fields[1]), float(fields[2])
+    return None
+
+
+def mean_pos_path(path: str) -> str:
+    """Nome del file di media associato (es. X.pp.pos -> X.pp.mean.pos)."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.mean{ext or '.pos'}"
+
+
+def expand_globs(patterns: Iterable[str]) -> List[str]:
+    """Espande uno o più pattern glob in una lista ordinata e senza duplicati."""
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.expanduser(pattern)))
+    return sorted(paths)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Statistiche orarie di qualità delle soluzioni RTKLIB (file .stat).
+
+Le colonne del file .pos vengono caricate in array NumPy e tutte le
+epoche sono trasformate in coordinate locali ENU rispetto al punto di
+riferimento con una sola chiamata vettoriale. Conteggi e percentuali
+(O/E%, OTH/STD/FLT/FIX% e FFIX%) sono calcolati nello stesso passaggio.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from lzer0_geodesy import llh2enu
+from lzer0_pos import (EXPECTED_HOURLY_OBS, Q_FIX, Q_FLOAT, Q_SINGLE,
+                       format_stat_line)
+
+# Distanza massima [m] dal punto di riferimento per considerare valido un fix
+FALSE_FIX_LIMIT = 0.05
+
+
+@dataclass
+class PosColumns:
+    """Colonne delle epoche di un'ora di file .pos."""
+    date: str
+    lat: np.ndarray
+    lon: np.ndarray
+    height: np.ndarray
+    q: np.ndarray
+
+
+@dataclass
+class PosStat:
+    """Conteggi orari per qualità della soluzione."""
+    date: str
+    total: int
+    oth: int
+    std: int
+    flt: int
+    fix: int
+    false_fix: int
+
+    def format_line(self, expected: int = EXPECTED_HOURLY_OBS) -> str:
+        return format_stat_line(self.date, self.total, self.oth, self.std,
+                                self.flt, self.fix, self.false_fix, expected)
+
+
+def session_hour(path: str) -> str:
+    """
+    Ora (due cifre) della sessione indicata nel nome del file.
+
+    Es. L001.2022.08.23.235.a.pp.pos -> sessione 'a' -> "00".
+    ValueError se il nome non contiene una sessione a..x.
+    """
+    parts = os.path.basename(path).split(".")
+    ses = parts[5].lower() if len(parts) > 5 else ""
+    if len(ses) != 1 or not "a" <= ses <= "x":
+        raise ValueError("no session in the file name (expected SITE.YYYY.MM.DD.DDD.s...pos)")
+    return "%02d" % (ord(ses) - ord("a"))
+
+
+def load_columns(path: str, hour: Optional[str] = None) -> Optional[PosColumns]:
+    """
+    Carica le colonne lat/lon/quota/Q delle epoche dell'ora indicata.
+
+    Come nello script originale sono escluse le righe che contengono '#'
+    e, se hour è indicata, quelle con ora diversa. ValueError se un campo
+    lat/lon/quota/Q non è numerico.
+    """
+    rows = []
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            if "#" in line:
+                continue
+            fields = line.split()
+            if len(fields) < 6 or (hour is not None and fields[1][:2] != hour):
+                continue
+            rows.append(fields[:6])
+    if not rows:
+        return None
+    data = np.array([r[2:6] for r in rows], dtype=float)
+    return PosColumns(date=rows[0][0], lat=data[:, 0], lon=data[:, 1],
+                      height=data[:, 2], q=data[:, 3])
+
+
+def analyze(cols: PosColumns, ref_llh: tuple,
+            false_fix_limit: float = FALSE_FIX_LIMIT) -> PosStat:
+    """Conta epoche per qualità e fix distanti più di false_fix_limit dal riferimento."""
+    q = cols.q
+    is_fix = q == Q_FIX
+    fix = int(np.count_nonzero(is_fix))
+    flt = int(np.count_nonzero(q == Q_FLOAT))
+    std = int(np.count_nonzero(q == Q_SINGLE))
+    total = int(q.size)
+
+    e, n, u = llh2enu(cols.lat[is_fix], cols.lon[is_fix], cols.height[is_fix],
+                      *ref_llh)
+    dist = np.sqrt(e * e + n * n + u * u)
+    false_fix = int(np.count_nonzero(dist > false_fix_limit))
+
+    return PosStat(date=cols.date, total=total, oth=total - fix - flt - std,
+                   std=std, flt=flt, fix=fix, false_fix=false_fix)
+
+
+def pos_stat(path: str, ref_llh: tuple,
+             false_fix_limit: float = FALSE_FIX_LIMIT) -> Optional[PosStat]:
+    """Statistica della sessione oraria di un file .pos (None se non ci sono epoche)."""
+    cols = load_columns(path, session_hour(path))
+    if cols is None:
+        return None
+    return analyze(cols, ref_llh, false_fix_limit)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Archivio colonnare per sito delle soluzioni .pos (tempo reale e 1Hpp).
+
+Ogni giornata è una directory con un file binario per colonna (t, lat,
+lon, height, q, ns, sigma, age, ratio) e un indice JSON:
+
+    STORE/SITE/KIND/YYYY/DDD/t.bin lat.bin ... index.json
+
+Le ore completate vengono aggiunte in coda ai file delle colonne;
+l'indice registra per ogni file sorgente dimensione, mtime e righe, così
+a ogni esecuzione vengono lette solo le ore nuove (o modificate, nel
+qual caso la giornata viene ricostruita). Il numero di righe confermate
+è scritto nell'indice dopo i dati: le code di un'aggiunta interrotta
+vengono troncate alla riapertura.
+
+Le interrogazioni aprono le colonne con np.memmap: si leggono dal disco
+solo le colonne e le pagine richieste, e su una giornata ordinata
+l'intervallo di tempo è una vista senza copia.
+"""
+
+import glob
+import json
+import os
+import re
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from lzer0_pos import iter_pos_rows
+
+# Colonne e tipi su disco (little endian)
+COLUMNS = (
+    ("t", "<f8"),        # secondi GPST dall'epoca Unix
+    ("lat", "<f8"), ("lon", "<f8"), ("height", "<f8"),
+    ("q", "u1"), ("ns", "u1"),
+    ("sdn", "<f4"), ("sde", "<f4"), ("sdu", "<f4"),
+    ("sdne", "<f4"), ("sdeu", "<f4"), ("sdun", "<f4"),
+    ("age", "<f4"), ("ratio", "<f4"),
+)
+DTYPES = dict(COLUMNS)
+INDEX_NAME = "index.json"
+
+# Le ore ancora in scrittura (str2str, rnx2rtkp) non vengono acquisite
+COMPLETE_AFTER = 300
+
+# Sorgenti: file orari di lzer0.record.hourlypos (rt) e di lzer0.start.pp (pp)
+KINDS = {
+    "rt": ("{dumpdir}/[0-9][0-9][0-9][0-9]/[0-9][0-9][0-9]/[a-x]/{site}.*.pos",
+           re.compile(r"^[A-Z0-9]+\.\d{4}\.\d\d\.\d\d\.\d{3}\.[a-x]\.pos$")),
+    "pp": ("{dumpdir}/[0-9][0-9][0-9][0-9]/[0-9][0-9][0-9]/1Hpp/{site}.*.pp.pos",
+           re.compile(r"^[A-Z0-9]+\.\d{4}\.\d\d\.\d\d\.\d{3}\.[a-x]\.pp\.pos$")),
+}
+
+
+def parse_pos(path: str) -> Dict[str, np.ndarray]:
+    """Colonne di un file .pos (righe incomplete ignorate)."""
+    rows = [f for f in iter_pos_rows(path) if len(f) >= 15]
+    if not rows:
+        return {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+    stamps = np.array([f"{r[0].replace('/', '-')}T{r[1]}" for r in rows], dtype="datetime64[ms]")
+    data = np.array([r[2:15] for r in rows], dtype=float)
+    out = {"t": stamps.astype("int64") / 1000.0}
+    for i, (name, dtype) in enumerate(COLUMNS[1:]):
+        out[name] = data[:, i].astype(dtype)
+    return out
+
+
+def day_of(t: float) -> Tuple[str, str]:
+    """(anno, giorno dell'anno) di un istante in secondi."""
+    st = time.gmtime(t)
+    return "%04d" % st.tm_year, "%03d" % st.tm_yday
+
+
+class DayStore:
+    """Le colonne di una giornata di un sito."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = {"rows": 0, "sorted": True, "t_max": None, "sources": {}}
+        try:
+            with open(os.path.join(path, INDEX_NAME)) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def rows(self) -> int:
+        return self.index["rows"]
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _save_index(self) -> None:
+        tmp = os.path.join(self.path, f".{INDEX_NAME}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX_NAME))
+
+    def recover(self) -> None:
+        """Tronca le colonne alle righe confermate (aggiunta interrotta)."""
+        for name, dtype in COLUMNS:
+            path = self._column_path(name)
+            size = self.rows * np.dtype(dtype).itemsize
+            try:
+                if os.path.getsize(path) > size:
+                    os.truncate(path, size)
+            except FileNotFoundError:
+                pass
+
+    def append(self, source: str, ident: List[int], cols: Dict[str, np.ndarray]) -> None:
+        """Aggiunge le righe di un file sorgente e conferma l'indice."""
+        os.makedirs(self.path, exist_ok=True)
+        self.recover()
+        n = len(cols["t"])
+        for name, dtype in COLUMNS:
+            with open(self._column_path(name), "ab") as f:
+                f.write(np.ascontiguousarray(cols[name], dtype=dtype).tobytes())
+        idx = self.index
+        if n:
+            t = cols["t"]
+            ordered = bool(np.all(t[1:] >= t[:-1]))
+            if idx["t_max"] is not None and t[0] < idx["t_max"]:
+                ordered = False
+            idx["sorted"] = idx["sorted"] and ordered
+            idx["t_max"] = max(float(t.max()), idx["t_max"] or float("-inf"))
+        idx["sources"][source] = ident + [idx["rows"], n]
+        idx["rows"] += n
+        self._save_index()
+
+    def reset(self) -> None:
+        """Svuota la giornata (per ricostruirla da tutte le sorgenti)."""
+        for name, _ in COLUMNS:
+            try:
+                os.remove(self._column_path(name))
+            except FileNotFoundError:
+                pass
+        self.index = {"rows": 0, "sorted": True, "t_max": None, "sources": {}}
+        if os.path.isdir(self.path):
+            self._save_index()
+
+    def column(self, name: str) -> np.ndarray:
+        """Colonna mappata in memoria (sola lettura), limitata alle righe confermate."""
+        if self.rows == 0:
+            return np.empty(0, DTYPES[name])
+        return np.memmap(self._column_path(name), dtype=DTYPES[name], mode="r", shape=(self.rows,))
+
+    def select(self, start: float, end: float, q: Optional[int] = None,
+               columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Righe con start <= t < end (e Q = q); vista senza copia se possibile."""
+        columns = columns or [name for name, _ in COLUMNS]
+        t = self.column("t")
+        if self.index.get("sorted", False):
+            i, j = np.searchsorted(t, [start, end])
+            rows = slice(int(i), int(j))
+        else:
+            rows = np.flatnonzero((t >= start) & (t < end))
+        if q is not None:
+            qcol = self.column("q")[rows]
+            sel = qcol == q
+            rows = (np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows)[sel]
+        out = {}
+        for name in columns:
+            out[name] = t[rows] if name == "t" else self.column(name)[rows]
+        if not isinstance(rows, slice) and not self.index.get("sorted", False):
+            order = np.argsort(out.get("t", t[rows]), kind="stable")
+            out = {k: v[order] for k, v in out.items()}
+        return out
+
+
+class PosStore:
+    """Archivio colonnare delle soluzioni di tutti i siti."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def day(self, site: str, kind: str, year: str, doy: str) -> DayStore:
+        return DayStore(os.path.join(self.root, site.upper(), kind, year, doy))
+
+    # ------------------------------------------------------------------
+    # Acquisizione
+    # ------------------------------------------------------------------
+
+    def sources(self, dumpdir: str, site: str, kind: str) -> List[str]:
+        pattern, name_re = KINDS[kind]
+        paths = glob.glob(pattern.format(dumpdir=dumpdir, site=site.upper()))
+        return sorted(p for p in paths if name_re.match(os.path.basename(p)))
+
+    def ingest(self, dumpdir: str, site: str, kind: str = "rt",
+               now: Optional[float] = None) -> Iterator[Tuple[str, int]]:
+        """
+        Acquisisce le ore completate non ancora presenti; restituisce (file, righe).
+
+        Una sorgente già acquisita ma cambiata su disco fa ricostruire la sua giornata.
+        """
+        now = now or time.time()
+        by_day: Dict[str, List[Tuple[str, List[int]]]] = {}
+        for path in self.sources(dumpdir, site, kind):
+            st = os.stat(path)
+            if now - st.st_mtime < COMPLETE_AFTER:
+                continue
+            year, doy = os.path.relpath(path, dumpdir).split(os.sep)[:2]
+            by_day.setdefault(f"{year}/{doy}", []).append((path, [st.st_size, st.st_mtime_ns]))
+        for key, items in sorted(by_day.items()):
+            store = self.day(site, kind, *key.split("/"))
+            known = store.index["sources"]
+            changed = any(known.get(os.path.basename(p), ident)[:2] != ident for p, ident in items)
+            if changed:
+                store.reset()
+            else:
+                items = [(p, ident) for p, ident in items if os.path.basename(p) not in known]
+            for path, ident in items:
+                cols = parse_pos(path)
+                store.append(os.path.basename(path), ident, cols)
+                yield path, len(cols["t"])
+
+    # ------------------------------------------------------------------
+    # Interrogazione
+    # ------------------------------------------------------------------
+
+    def days(self, site: str, kind: str, start: float, end: float) -> Iterator[DayStore]:
+        t = start - start % 86400
+        while t < end:
+            year, doy = day_of(t)
+            store = self.day(site, kind, year, doy)
+            if store.rows:
+                yield store
+            t += 86400
+
+    def query(self, site: str, kind: str, start: float, end: float, q: Optional[int] = None,
+              columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Serie temporale di start <= t < end; su una sola giornata ordinata è una vista mmap."""
+        parts = [d.select(start, end, q, columns) for d in self.days(site, kind, start, end)]
+        parts = [p for p in parts if len(next(iter(p.values())))]
+        columns = columns or [name for name, _ in COLUMNS]
+        if not parts:
+            return {name: np.empty(0, DTYPES[name]) for name in columns}
+        if len(parts) == 1:
+            return parts[0]
+        return {name: np.concatenate([p[name] for p in parts]) for name in columns}
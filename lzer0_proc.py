@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Ricerca e terminazione di processi leggendo direttamente /proc.
+
+Sostituisce le catene `ps -ef | grep ... | grep -v grep | gawk` e
+kill_family degli script tcsh senza lanciare alcun processo.
+"""
+
+import os
+import signal
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+def cmdline(pid: int) -> Optional[str]:
+    """Riga di comando del processo (argomenti separati da spazio), None se non esiste."""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    return raw.rstrip(b"\0").replace(b"\0", b" ").decode("utf-8", "replace")
+
+
+def _ppid(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Il nome del processo (campo 2) può contenere spazi e parentesi
+    return int(stat[stat.rindex(b")") + 2:].split()[1])
+
+
+def pids() -> List[int]:
+    return [int(d) for d in os.listdir("/proc") if d.isdigit()]
+
+
+def find_pids(*keywords: str, exclude: Iterable[int] = ()) -> List[int]:
+    """
+    PID dei processi la cui riga di comando contiene tutte le parole chiave.
+
+    Equivale a `ps -ef | grep K1 | grep K2 ... | grep -v grep`, escluso
+    il processo corrente e i PID indicati in exclude.
+    """
+    skip = {os.getpid(), *exclude}
+    found = []
+    for pid in pids():
+        if pid in skip:
+            continue
+        line = cmdline(pid)
+        if line and all(k in line for k in keywords):
+            found.append(pid)
+    return found
+
+
+def children_map() -> Dict[int, List[int]]:
+    """Mappa PID padre -> PID figli di tutti i processi."""
+    children: Dict[int, List[int]] = {}
+    for pid in pids():
+        ppid = _ppid(pid)
+        if ppid is not None:
+            children.setdefault(ppid, []).append(pid)
+    return children
+
+
+def family(pid: int) -> List[int]:
+    """Il processo e tutti i suoi discendenti, prima i figli (come kill_family)."""
+    children = children_map()
+    order: List[int] = []
+
+    def visit(p: int) -> None:
+        for child in children.get(p, []):
+            visit(child)
+        order.append(p)
+
+    visit(pid)
+    return order
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def kill_family(pid: int, sig: int = signal.SIGKILL) -> List[int]:
+    """Invia sig al processo e a tutti i suoi discendenti; restituisce i PID colpiti."""
+    killed = []
+    for p in family(pid):
+        try:
+            os.kill(p, sig)
+            killed.append(p)
+        except ProcessLookupError:
+            pass
+    return killed
+
+
+def terminate(pids_: Iterable[int], grace: float = 2.0) -> None:
+    """SIGTERM alle famiglie dei processi, poi SIGKILL a chi è ancora vivo dopo grace secondi."""
+    targets = list(pids_)
+    for pid in targets:
+        kill_family(pid, signal.SIGTERM)
+    deadline = time.monotonic() + grace
+    while time.monotonic() < deadline and any(alive(p) for p in targets):
+        time.sleep(0.1)
+    for pid in targets:
+        if alive(pid):
+            kill_family(pid, signal.SIGKILL)
+
+
+TAP_SCRIPT = "lzer0.tap.stream"
+
+
+def tap_recorders(stream: str) -> Dict[int, str]:
+    """
+    Istanze di lzer0.tap.stream che registrano stream ("raw" o "pos").
+
+    Restituisce PID -> sito passato con -s ("" se il sito è il rover di
+    sites.cfg, opzione -f). Sono escluse le istanze con --no-<stream> o
+    --datetime e le righe che nominano solo lo script (es. il suo log).
+    """
+    found = {}
+    for pid in find_pids(TAP_SCRIPT):
+        argv = (cmdline(pid) or "").split()
+        if not any(os.path.basename(a) == TAP_SCRIPT for a in argv[:2]):
+            continue
+        if f"--no-{stream}" in argv or "--datetime" in argv:
+            continue
+        site = ""
+        if "-s" in argv[:-1]:
+            site = argv[argv.index("-s") + 1].upper()
+        found[pid] = site
+    return found
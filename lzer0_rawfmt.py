@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Riconoscimento del formato dei file GNSS grezzi dai primi KB.
+
+Invece di provare convbin con ognuno dei 12 formati (con `sleep 8` e
+kill_family dopo ciascuno) vengono cercati nei primi SNIFF_SIZE byte i
+messaggi dei formati principali, validati con il loro checksum:
+
+    ubx     0xB5 0x62, checksum Fletcher a 8 bit
+    rtcm3   0xD3, CRC-24Q
+    nov     0xAA 0x44 0x12 (OEM4/OEM6), CRC-32
+    oem3    0xAA 0x44 0x11, checksum XOR
+    stq     0xA0 0xA1 ... 0x0D 0x0A (SkyTraq), checksum XOR
+    rinex   intestazione "RINEX VERSION / TYPE"
+
+Le frasi NMEA ($..*hh) sono riconosciute ma convbin non le converte:
+un file solo NMEA non ha un formato valido. I file .bz2 sono
+decompressi in streaming, solo per i byte necessari.
+"""
+
+import bz2
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+from typing import Dict, Optional
+
+SNIFF_SIZE = 16384
+
+# Ordine dei formati provati dalla versione tcsh (anche per gli spareggi)
+CONVBIN_FORMATS = ("ubx", "rtcm3", "rtcm2", "nvs", "rinex", "nov", "oem3",
+                   "ss2", "hemis", "stq", "javad", "binex")
+
+CONVBIN_TIMEOUT = 8
+
+
+def _crc24q_table():
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+        table.append(crc & 0xFFFFFF)
+    return table
+
+
+def _crc32_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC24Q = _crc24q_table()
+_CRC32 = _crc32_table()
+
+
+def crc24q(data: bytes) -> int:
+    crc = 0
+    for b in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ _CRC24Q[(crc >> 16) ^ b]
+    return crc
+
+
+def crc32_novatel(data: bytes) -> int:
+    """CRC-32 dei messaggi NovAtel (senza inversione iniziale e finale)."""
+    crc = 0
+    for b in data:
+        crc = _CRC32[(crc ^ b) & 0xFF] ^ (crc >> 8)
+    return crc
+
+
+def _xor(data: bytes) -> int:
+    cs = 0
+    for b in data:
+        cs ^= b
+    return cs
+
+
+def count_ubx(buf: bytes) -> int:
+    """Messaggi UBX completi con checksum corretto."""
+    n = 0
+    i = buf.find(b"\xb5\x62")
+    while 0 <= i and i + 8 <= len(buf):
+        length = buf[i + 4] | buf[i + 5] << 8
+        end = i + 6 + length + 2
+        if end <= len(buf):
+            ck_a = ck_b = 0
+            for b in buf[i + 2:end - 2]:
+                ck_a = (ck_a + b) & 0xFF
+                ck_b = (ck_b + ck_a) & 0xFF
+            if buf[end - 2] == ck_a and buf[end - 1] == ck_b:
+                n += 1
+                i = buf.find(b"\xb5\x62", end)
+                continue
+        i = buf.find(b"\xb5\x62", i + 1)
+    return n
+
+
+def count_rtcm3(buf: bytes) -> int:
+    """Messaggi RTCM3 completi con CRC-24Q corretto."""
+    n = 0
+    i = buf.find(b"\xd3")
+    while 0 <= i and i + 6 <= len(buf):
+        if buf[i + 1] & 0xFC == 0:
+            length = (buf[i + 1] & 0x03) << 8 | buf[i + 2]
+            end = i + 3 + length + 3
+            if end <= len(buf) and crc24q(buf[i:end - 3]) == int.from_bytes(buf[end - 3:end], "big"):
+                n += 1
+                i = buf.find(b"\xd3", end)
+                continue
+        i = buf.find(b"\xd3", i + 1)
+    return n
+
+
+def count_novatel(buf: bytes) -> int:
+    """Messaggi binari NovAtel OEM4/OEM6 con CRC-32 corretto."""
+    n = 0
+    i = buf.find(b"\xaa\x44\x12")
+    while 0 <= i and i + 28 <= len(buf):
+        hlen = buf[i + 3]
+        length = buf[i + 8] | buf[i + 9] << 8
+        end = i + hlen + length + 4
+        if end <= len(buf) and crc32_novatel(buf[i:end - 4]) == int.from_bytes(buf[end - 4:end], "little"):
+            n += 1
+            i = buf.find(b"\xaa\x44\x12", end)
+            continue
+        i = buf.find(b"\xaa\x44\x12", i + 1)
+    return n
+
+
+def count_oem3(buf: bytes) -> int:
+    """Messaggi NovAtel OEM3 (intestazione di 12 byte, XOR di tutto il messaggio nullo)."""
+    n = 0
+    i = buf.find(b"\xaa\x44\x11")
+    while 0 <= i and i + 12 <= len(buf):
+        length = int.from_bytes(buf[i + 8:i + 12], "little")
+        end = i + length
+        if 12 <= length <= 4096 and end <= len(buf) and _xor(buf[i:end]) == 0:
+            n += 1
+            i = buf.find(b"\xaa\x44\x11", end)
+            continue
+        i = buf.find(b"\xaa\x44\x11", i + 1)
+    return n
+
+
+def count_skytraq(buf: bytes) -> int:
+    """Messaggi SkyTraq: A0 A1, lunghezza, payload, XOR, 0D 0A."""
+    n = 0
+    i = buf.find(b"\xa0\xa1")
+    while 0 <= i and i + 7 <= len(buf):
+        length = buf[i + 2] << 8 | buf[i + 3]
+        end = i + 4 + length + 3
+        if (end <= len(buf) and buf[end - 2:end] == b"\r\n"
+                and _xor(buf[i + 4:end - 3]) == buf[end - 3]):
+            n += 1
+            i = buf.find(b"\xa0\xa1", end)
+            continue
+        i = buf.find(b"\xa0\xa1", i + 1)
+    return n
+
+
+def count_nmea(buf: bytes) -> int:
+    """Frasi NMEA $..*hh con checksum corretto."""
+    n = 0
+    i = buf.find(b"$")
+    while 0 <= i:
+        star = buf.find(b"*", i, i + 100)
+        if star < 0 or star + 3 > len(buf):
+            i = buf.find(b"$", i + 1)
+            continue
+        try:
+            ok = _xor(buf[i + 1:star]) == int(buf[star + 1:star + 3], 16)
+        except ValueError:
+            ok = False
+        if ok:
+            n += 1
+            i = buf.find(b"$", star)
+        else:
+            i = buf.find(b"$", i + 1)
+    return n
+
+
+def is_rinex(buf: bytes) -> bool:
+    first = buf.split(b"\n", 1)[0]
+    return first[60:80].rstrip() == b"RINEX VERSION / TYPE"
+
+
+_COUNTERS = {
+    "ubx": count_ubx,
+    "rtcm3": count_rtcm3,
+    "nov": count_novatel,
+    "oem3": count_oem3,
+    "stq": count_skytraq,
+}
+
+
+def is_bz2(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(3) == b"BZh"
+
+
+def read_head(path: str, size: int = SNIFF_SIZE) -> bytes:
+    """
+    Primi size byte del file, decompressi in streaming se è un bzip2.
+
+    Un bzip2 troncato o corrotto solleva OSError come un file illeggibile.
+    """
+    opener = bz2.open if is_bz2(path) else open
+    try:
+        with opener(path, "rb") as f:
+            return f.read(size)
+    except EOFError as e:
+        raise OSError("truncated bzip2 file") from e
+
+
+def score(buf: bytes) -> Dict[str, int]:
+    """Numero di messaggi validi trovati per ogni formato riconoscibile."""
+    scores = {fmt: count(buf) for fmt, count in _COUNTERS.items()}
+    scores["rinex"] = 1 if is_rinex(buf) else 0
+    scores["nmea"] = count_nmea(buf)
+    return scores
+
+
+def sniff(buf: bytes) -> Optional[str]:
+    """Formato convbin del buffer, None se non riconosciuto."""
+    scores = score(buf)
+    best = None
+    for fmt in CONVBIN_FORMATS:
+        if scores.get(fmt, 0) > (scores[best] if best else 0):
+            best = fmt
+    return best
+
+
+def convbin_trial(path: str, formats=CONVBIN_FORMATS,
+                  timeout: float = CONVBIN_TIMEOUT) -> Optional[str]:
+    """
+    Metodo della versione tcsh: il primo formato per cui convbin produce
+    un file di osservazioni non vuoto. Ogni tentativo è interrotto dopo
+    timeout secondi invece dell'attesa fissa.
+    """
+    tmpdir = tempfile.mkdtemp(prefix="lzer0.check.fileformat.")
+    try:
+        out = os.path.join(tmpdir, "test.o")
+        for fmt in formats:
+            proc = subprocess.Popen(["convbin", "-r", fmt, path, "-o", out],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                    start_new_session=True)
+            try:
+                proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+            if os.path.exists(out) and os.path.getsize(out) > 0:
+                return fmt
+    except OSError:
+        return None
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return None
+
+
+def detect(path: str, fallback: bool = True) -> Optional[str]:
+    """
+    Formato convbin del file: riconoscimento dai primi KB e, se non
+    riuscito, tentativi con convbin sui formati non riconoscibili (non
+    per i .bz2, che convbin non legge, né per i file solo NMEA).
+    """
+    buf = read_head(path)
+    fmt = sniff(buf)
+    if fmt is not None or not fallback or is_bz2(path) or count_nmea(buf):
+        return fmt
+    remaining = [f for f in CONVBIN_FORMATS if f not in _COUNTERS and f != "rinex"]
+    return convbin_trial(path, remaining)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Gestione dello spazio dell'archivio GNSS (DUMPDIR/YEAR/DOY).
+
+Un piccolo indice persistente (DUMPDIR/.retention.json) conserva per
+ogni directory giornaliera occupazione e numero di file. A ogni
+esecuzione vengono rilette solo le giornate la cui firma (mtime della
+directory e delle sottodirectory di sessione) è cambiata, più le ultime
+RESCAN_DAYS in cui i file orari possono ancora crescere; le altre
+restano quelle dell'indice, senza `du`/`find` su anni di dati.
+
+Dall'indice si calcola in un solo passo l'elenco delle giornate più
+vecchie da eliminare per scendere sotto la soglia di occupazione
+(lzer0.check.storage) o per tenere solo gli ultimi N giorni
+(lzer0.cleanup.oldgnss), senza rileggere `df` dopo ogni cancellazione.
+"""
+
+import json
+import math
+import os
+import shutil
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+INDEX_NAME = ".retention.json"
+RESCAN_DAYS = 2
+
+
+@dataclass
+class DayDir:
+    """Una directory giornaliera YEAR/DOY dell'archivio."""
+    year: str
+    doy: str
+    bytes: int = 0     # spazio occupato su disco (come du -s)
+    apparent: int = 0  # dimensione dei file (come du -sb)
+    files: int = 0
+    signature: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"{self.year}/{self.doy}"
+
+    @property
+    def date(self) -> datetime:
+        return datetime(int(self.year), 1, 1) + timedelta(days=int(self.doy) - 1)
+
+
+def _signature(path: str) -> float:
+    """Massima mtime della directory e delle sue sottodirectory dirette."""
+    sig = os.stat(path).st_mtime
+    with os.scandir(path) as it:
+        for e in it:
+            if e.is_dir(follow_symlinks=False):
+                sig = max(sig, e.stat(follow_symlinks=False).st_mtime)
+    return sig
+
+
+def _measure(path: str) -> Tuple[int, int, int]:
+    """(byte su disco, byte apparenti, numero di file) dell'albero."""
+    used = apparent = files = 0
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    continue
+                st = e.stat(follow_symlinks=False)
+                used += st.st_blocks * 512
+                apparent += st.st_size
+                files += 1
+    return used, apparent, files
+
+
+def _disk_usage(path: str) -> Tuple[int, int]:
+    """(byte usati, byte usati + disponibili) come li conta df."""
+    st = os.statvfs(path)
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    return used, used + st.f_bavail * st.f_frsize
+
+
+def _percent(used: int, total: int) -> int:
+    return math.ceil(used * 100 / total) if total else 0
+
+
+def disk_usage_percent(path: str) -> int:
+    """Occupazione percentuale come la colonna Use% di df (arrotondata per eccesso)."""
+    return _percent(*_disk_usage(path))
+
+
+class RetentionIndex:
+    """Indice delle directory giornaliere di DUMPDIR, aggiornato in modo incrementale."""
+
+    def __init__(self, dumpdir: str):
+        self.dumpdir = dumpdir
+        self.path = os.path.join(dumpdir, INDEX_NAME)
+        self.days: Dict[str, DayDir] = {}
+        self.rescanned = 0
+        try:
+            with open(self.path) as f:
+                for entry in json.load(f).get("days", []):
+                    day = DayDir(**entry)
+                    self.days[day.key] = day
+        except (OSError, ValueError, TypeError):
+            self.days = {}
+
+    def refresh(self, now: Optional[datetime] = None) -> None:
+        """Allinea l'indice al disco rileggendo solo le giornate cambiate o recenti."""
+        now = now or datetime.now()
+        recent = now - timedelta(days=RESCAN_DAYS)
+        seen = {}
+        for year in sorted(os.listdir(self.dumpdir)):
+            ypath = os.path.join(self.dumpdir, year)
+            if not (len(year) == 4 and year.isdigit() and os.path.isdir(ypath)):
+                continue
+            for doy in sorted(os.listdir(ypath)):
+                dpath = os.path.join(ypath, doy)
+                if not (len(doy) == 3 and doy.isdigit() and os.path.isdir(dpath)):
+                    continue
+                try:
+                    sig = _signature(dpath)
+                except OSError:
+                    continue
+                day = self.days.get(f"{year}/{doy}")
+                if day is None or day.signature != sig or day.date >= recent:
+                    day = DayDir(year, doy, *_measure(dpath), signature=sig)
+                    self.rescanned += 1
+                seen[day.key] = day
+        self.days = seen
+
+    def save(self) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"days": [asdict(d) for d in self.ordered()]}, f)
+        os.replace(tmp, self.path)
+
+    def ordered(self) -> List[DayDir]:
+        """Giornate dalla più vecchia alla più recente."""
+        return sorted(self.days.values(), key=lambda d: (d.year, d.doy))
+
+    # ------------------------------------------------------------------
+    # Politiche
+    # ------------------------------------------------------------------
+
+    def plan_usage(self, limit_percent: float, protect_after: datetime) -> List[DayDir]:
+        """
+        Giornate più vecchie da eliminare perché l'occupazione scenda sotto limit_percent.
+
+        Le giornate da protect_after in poi (quella corrente) non vengono mai proposte.
+        """
+        used, total = _disk_usage(self.dumpdir)
+        plan = []
+        for day in self.ordered():
+            if _percent(used, total) < limit_percent:
+                break
+            if day.date >= protect_after:
+                break
+            plan.append(day)
+            used -= day.bytes
+        return plan
+
+    def plan_age(self, days_to_keep: int, now: Optional[datetime] = None) -> List[DayDir]:
+        """Giornate anteriori a days_to_keep giorni fa."""
+        cutoff = (now or datetime.now()) - timedelta(days=days_to_keep)
+        return [d for d in self.ordered() if d.date < cutoff]
+
+    def delete(self, day: DayDir) -> bool:
+        """Elimina la giornata (e la directory dell'anno se resta vuota)."""
+        dpath = os.path.join(self.dumpdir, day.year, day.doy)
+        try:
+            shutil.rmtree(dpath)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            return False
+        self.days.pop(day.key, None)
+        ypath = os.path.join(self.dumpdir, day.year)
+        try:
+            os.rmdir(ypath)
+        except OSError:
+            pass
+        return True
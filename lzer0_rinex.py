@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Conversione oraria dei dati grezzi compressi (.bz2) in RINEX con cache.
+
+La conversione (decompressione, riconoscimento del formato e convbin)
+viene salvata in una cache indirizzata per contenuto sotto ~/tmp: la
+chiave è calcolata da percorso, dimensione e mtime del .bz2 sorgente e
+dalle opzioni di convbin. Alla seconda richiesta della stessa ora (es.
+il master condiviso da più rover) i file RINEX vengono collegati nella
+directory di destinazione senza decomprimere né convertire di nuovo.
+
+La cache ha una dimensione massima: le voci usate meno di recente
+vengono eliminate (LRU sull'mtime della directory della voce, aggiornato
+a ogni uso). Un lock (flock) per chiave evita che due processi
+convertano contemporaneamente la stessa ora; il file di lock è rimosso
+insieme alla voce (o subito, se la conversione fallisce).
+
+Il file grezzo decompresso è scritto in RAM (/dev/shm) se c'è spazio:
+sulla SD finiscono solo i file RINEX. Il formato è riconosciuto sul
+primo blocco decompresso, senza rileggere il file. convbin legge il file
+due volte (scansione dei tipi di osservazione e conversione), per questo
+l'ingresso è un file e non una pipe.
+"""
+
+import bz2
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from lzer0_rawfmt import SNIFF_SIZE, detect, sniff
+from lzer0_session import from_script_hour
+
+HOME = os.path.expanduser("~")
+CACHE_DIR = f"{HOME}/tmp/rinex.cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Estensione RINEX -> opzione di convbin
+RINEX_OUTPUTS = (("o", "-o"), ("n", "-n"), ("g", "-g"), ("h", "-h"),
+                 ("q", "-q"), ("l", "-l"), ("s", "-s"))
+
+COPY_BUFSIZE = 1024 * 1024
+
+# File grezzo decompresso in RAM se SHM_DIR ha almeno RAW_RATIO volte la
+# dimensione del .bz2 libera (altrimenti nella directory di lavoro)
+SHM_DIR = "/dev/shm"
+RAW_RATIO = 10
+
+
+class RinexError(Exception):
+    pass
+
+
+def convbin_options(rate: int) -> List[str]:
+    """Opzioni di default di convbin con intervallo di campionamento rate [s]."""
+    return ["-os", "-oi", "-ot", "-ol", "-f", "1", "-ti", str(rate)]
+
+
+def rinex_names(site: str, year: str, doy: str, ses: str) -> Dict[str, str]:
+    """Nomi dei file RINEX dell'ora per estensione (es. 'o' -> l001235a.22o)."""
+    return {ext: f"{site.lower()}{doy}{ses}.{year[2:4]}{ext}" for ext, _ in RINEX_OUTPUTS}
+
+
+def decompress(src: str, dest: str) -> bytes:
+    """Decompressione in streaming del .bz2; restituisce il primo blocco (per sniff)."""
+    with bz2.open(src, "rb") as fin, open(dest, "wb") as fout:
+        head = fin.read(SNIFF_SIZE)
+        fout.write(head)
+        shutil.copyfileobj(fin, fout, COPY_BUFSIZE)
+    return head
+
+
+def scratch_dir(src: str, default: str) -> str:
+    """Directory per il file grezzo decompresso: SHM_DIR se ha spazio, altrimenti default."""
+    try:
+        st = os.statvfs(SHM_DIR)
+    except OSError:
+        return default
+    need = os.path.getsize(src) * RAW_RATIO
+    return SHM_DIR if st.f_bavail * st.f_frsize >= need else default
+
+
+def convert(src: str, names: Dict[str, str], options: List[str], workdir: str) -> List[str]:
+    """Converte il .bz2 in workdir e restituisce i file RINEX prodotti."""
+    base = os.path.basename(src)[:-len(".bz2")] if src.endswith(".bz2") else "raw"
+    fd, raw = tempfile.mkstemp(prefix=f"{base}.", dir=scratch_dir(src, workdir))
+    os.close(fd)
+    try:
+        head = decompress(src, raw)
+        fmt = sniff(head) or detect(raw)
+        if fmt is None:
+            raise RinexError(f"Unknown format for {os.path.basename(src)}")
+        cmd = ["convbin", "-r", fmt, raw] + options
+        for ext, flag in RINEX_OUTPUTS:
+            cmd += [flag, names[ext]]
+        try:
+            subprocess.run(cmd, cwd=workdir, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=False)
+        except OSError as e:
+            raise RinexError(f"convbin: {e}")
+    finally:
+        os.remove(raw)
+    produced = [n for n in names.values() if os.path.exists(os.path.join(workdir, n))]
+    if names["o"] not in produced:
+        raise RinexError(f"convbin produced no observations for {os.path.basename(src)}")
+    return produced
+
+
+def _place(src: str, dest: str) -> None:
+    """Collega (o copia, tra file system diversi) un file della cache in dest."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def _lock(path: str, blocking: bool = True):
+    """
+    Apre e blocca (flock) il file di lock path; None se occupato e non bloccante.
+
+    Chi elimina una voce rimuove anche il suo lock: ottenuto il flock si
+    verifica che il file sia ancora quello su disco, altrimenti si
+    riprova con quello nuovo.
+    """
+    while True:
+        f = open(path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except OSError:
+            f.close()
+            return None
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class RinexCache:
+    """Cache LRU, limitata in dimensione, delle conversioni RINEX orarie."""
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._counters = threading.Lock()
+
+    def key(self, src: str, options: List[str]) -> str:
+        st = os.stat(src)
+        ident = "\0".join([os.path.realpath(src), str(st.st_size), str(st.st_mtime_ns)] + options)
+        return hashlib.sha1(ident.encode()).hexdigest()
+
+    def fetch(self, src: str, names: Dict[str, str], options: List[str],
+              dest: str, refresh: bool = False) -> Tuple[List[str], bool]:
+        """
+        Mette in dest i file RINEX dell'ora, convertendo solo se non sono in cache.
+
+        Restituisce i nomi dei file e True se erano in cache (hits/misses
+        sono totali della cache, condivisa anche tra thread); refresh forza
+        una nuova conversione.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(dest, exist_ok=True)
+        key = self.key(src, options)
+        entry = os.path.join(self.root, key)
+        with _lock(f"{entry}.lock"):
+            if refresh and os.path.isdir(entry):
+                shutil.rmtree(entry)
+            hit = os.path.isdir(entry)
+            with self._counters:
+                if hit:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if hit:
+                os.utime(entry)
+            else:
+                work = tempfile.mkdtemp(prefix=f".{key}.", dir=self.root)
+                try:
+                    convert(src, names, options, work)
+                except BaseException:
+                    shutil.rmtree(work, ignore_errors=True)
+                    _unlink(f"{entry}.lock")   # nessuna voce: il lock non serve più
+                    raise
+                os.rename(work, entry)
+            files = sorted(os.listdir(entry))
+            for name in files:
+                _place(os.path.join(entry, name), os.path.join(dest, name))
+        self.evict(keep=key)
+        return files, hit
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """Elimina le voci usate meno di recente finché la cache supera max_bytes."""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            if name.endswith(".lock"):
+                if not os.path.isdir(path[:-len(".lock")]):
+                    # lock rimasto senza voce (es. processo interrotto)
+                    lock = _lock(path, blocking=False)
+                    if lock is not None:
+                        with lock:
+                            if not os.path.isdir(path[:-len(".lock")]):
+                                _unlink(path)
+                continue
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path))
+                entries.append((os.stat(path).st_mtime, size, name))
+            except OSError:
+                continue
+            total += size
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            lock_path = os.path.join(self.root, f"{name}.lock")
+            lock = _lock(lock_path, blocking=False)
+            if lock is None:
+                continue   # in uso da un altro processo
+            with lock:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                _unlink(lock_path)
+            total -= size
+
+
+def fetch_hour(dumpdir: str, site: str, year: str, doy: str, hour: int, rate: int,
+               dest: str, cache: Optional[RinexCache] = None,
+               refresh: bool = False) -> Tuple[List[str], bool]:
+    """
+    RINEX di un'ora di un sito in dest, con gli stessi nomi di lzer0.get.hourlygnss.
+
+    hour segue la convenzione degli script (HOUR 1..24, sessione hr2ses).
+    Restituisce, come RinexCache.fetch, i nomi dei file e se erano in cache.
+    """
+    h = from_script_hour(year, doy, hour)
+    src = h.bz2_path(dumpdir, site)
+    if not os.path.exists(src):
+        raise RinexError(f"Missing source file {src}")
+    cache = cache or RinexCache()
+    return cache.fetch(src, rinex_names(site, h.year, h.doy, h.ses), convbin_options(rate), dest, refresh)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Qualità delle soluzioni in tempo reale su finestre mobili.
+
+Ogni riga .pos dello stream di rtkrcv (porta 5754) aggiorna le finestre
+(es. 1 min, 10 min, 1 h) in tempo costante: le somme correnti delle
+epoche nella finestra vengono incrementate per l'epoca nuova e
+decrementate per quelle che escono. Per ciascuna finestra sono
+disponibili in ogni momento la media dei fix (coordinate, ENU rispetto al
+riferimento, RMS delle sigma) nel formato del file .mean.pos e le
+percentuali OTH/STD/FLT/FIX/FFIX nel formato del file .stat, senza
+attendere la fine dell'ora e rnx2rtkp.
+
+I falsi fix (fix a più di false_fix_limit dal riferimento) vengono
+segnalati all'inizio e alla fine di ogni episodio.
+"""
+
+import calendar
+import time
+from collections import deque
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from lzer0_geodesy import llh2enu
+from lzer0_pos import Q_FIX, Q_FLOAT, Q_SINGLE, PosMean, _num, format_stat_line
+from lzer0_posstat import FALSE_FIX_LIMIT
+
+WINDOWS = (60, 600, 3600)
+EPOCH_INTERVAL = 1.0
+
+# Posizioni nel vettore delle somme dei fix
+_DLAT, _DLON, _DH, _E, _N, _U, _NS = range(7)
+_SD2 = 7          # 6 quadrati delle sigma (sdn sde sdu sdne sdeu sdun)
+_AGE, _RATIO = 13, 14
+_NSUM = 15
+
+
+class Epoch(NamedTuple):
+    """Un'epoca ridotta ai valori che entrano nelle somme."""
+    t: float                 # secondi GPST (per le finestre)
+    date: str
+    time: str
+    q: int
+    fix: Optional[tuple]     # vettore da sommare, solo per i fix
+    false_fix: bool
+
+
+def epoch_seconds(date: str, hms: str) -> float:
+    """'2025/04/29' '09:40:51.000' -> secondi dall'epoca Unix."""
+    return calendar.timegm(time.strptime(f"{date} {hms[:8]}", "%Y/%m/%d %H:%M:%S")) + float(hms[8:] or 0)
+
+
+class RollingWindow:
+    """Somme correnti delle epoche degli ultimi seconds secondi."""
+
+    def __init__(self, seconds: float, interval: float = EPOCH_INTERVAL):
+        self.seconds = seconds
+        self.interval = interval
+        self.epochs: deque = deque()
+        self.total = self.fix = self.flt = self.std = self.false_fix = 0
+        self.sums = [0.0] * _NSUM
+        self._evicted = 0
+
+    def _count(self, ep: Epoch, sign: int) -> None:
+        self.total += sign
+        if ep.q == Q_FIX:
+            self.fix += sign
+            self.false_fix += sign * ep.false_fix
+            sums = self.sums
+            for i, v in enumerate(ep.fix):
+                sums[i] += sign * v
+        elif ep.q == Q_FLOAT:
+            self.flt += sign
+        elif ep.q == Q_SINGLE:
+            self.std += sign
+
+    def add(self, ep: Epoch) -> None:
+        self.epochs.append(ep)
+        self._count(ep, 1)
+        start = ep.t - self.seconds
+        while self.epochs[0].t <= start:
+            self._count(self.epochs.popleft(), -1)
+            self._evicted += 1
+        if self._evicted > len(self.epochs) + 1:
+            self._resync()
+
+    def _resync(self) -> None:
+        """Ricalcola le somme da zero (una volta per ricambio della finestra: costo ammortizzato costante)."""
+        self.total = self.fix = self.flt = self.std = self.false_fix = 0
+        self.sums = [0.0] * _NSUM
+        for ep in self.epochs:
+            self._count(ep, 1)
+        self._evicted = 0
+
+    def mean(self, ref: Tuple[float, float, float]) -> Optional[PosMean]:
+        """Media dei fix della finestra nel formato .mean.pos (None senza fix)."""
+        n = self.fix
+        if n < 1:
+            return None
+        s = self.sums
+        last = self.epochs[-1]
+        return PosMean(
+            date=last.date, hour=last.time[:2], quality=Q_FIX, count=n,
+            lat=ref[0] + s[_DLAT] / n, lon=ref[1] + s[_DLON] / n, height=ref[2] + s[_DH] / n,
+            nsat=s[_NS] / n,
+            sdn=(max(s[_SD2], 0) / n) ** 0.5, sde=(max(s[_SD2 + 1], 0) / n) ** 0.5,
+            sdu=(max(s[_SD2 + 2], 0) / n) ** 0.5, sdne=(max(s[_SD2 + 3], 0) / n) ** 0.5,
+            sdeu=(max(s[_SD2 + 4], 0) / n) ** 0.5, sdun=(max(s[_SD2 + 5], 0) / n) ** 0.5,
+            age=s[_AGE] / n, ratio=s[_RATIO] / n, time=last.time,
+        )
+
+    def enu(self) -> Optional[Tuple[float, float, float]]:
+        """East/North/Up medi dei fix rispetto al riferimento [m]."""
+        n = self.fix
+        if n < 1:
+            return None
+        return self.sums[_E] / n, self.sums[_N] / n, self.sums[_U] / n
+
+    def stat_line(self) -> Optional[str]:
+        """Percentuali della finestra nel formato del file .stat."""
+        if not self.epochs:
+            return None
+        expected = max(1, round(self.seconds / self.interval))
+        return format_stat_line(self.epochs[-1].date, self.total,
+                                self.total - self.fix - self.flt - self.std,
+                                self.std, self.flt, self.fix, self.false_fix, expected)
+
+
+class RollingQuality:
+    """
+    Finestre mobili di qualità per uno stream .pos.
+
+    ref_llh è il punto di riferimento (coordinate di sites.cfg o
+    station.pos); senza riferimento le coordinate ENU sono relative al
+    primo fix e i falsi fix non vengono cercati.
+    """
+
+    def __init__(self, ref_llh: Optional[Tuple[float, float, float]],
+                 windows=WINDOWS, interval: float = EPOCH_INTERVAL,
+                 false_fix_limit: float = FALSE_FIX_LIMIT,
+                 on_false_fix: Optional[Callable[[str], None]] = None):
+        self.ref = ref_llh
+        self.check_false_fix = ref_llh is not None
+        self.windows: Dict[int, RollingWindow] = {int(w): RollingWindow(w, interval) for w in windows}
+        self.limit = false_fix_limit
+        self.on_false_fix = on_false_fix
+        self._false_since: Optional[Epoch] = None
+        self._false_max = 0.0
+        self.epochs = 0
+
+    def add_fields(self, fields: List[str]) -> Optional[Epoch]:
+        """Aggiunge una riga .pos già suddivisa in campi (intestazioni e righe incomplete ignorate)."""
+        if len(fields) < 6 or "%" in fields[0]:
+            return None
+        try:
+            t = epoch_seconds(fields[0], fields[1])
+            q = int(fields[5])
+        except ValueError:
+            return None
+        vec = None
+        false_fix = False
+        dist = 0.0
+        if q == Q_FIX:
+            lat, lon, h = _num(fields, 2), _num(fields, 3), _num(fields, 4)
+            if self.ref is None:
+                self.ref = (lat, lon, h)
+            e, n, u = (float(v) for v in llh2enu(lat, lon, h, *self.ref))
+            dist = (e * e + n * n + u * u) ** 0.5
+            false_fix = self.check_false_fix and dist > self.limit
+            vec = (lat - self.ref[0], lon - self.ref[1], h - self.ref[2], e, n, u, _num(fields, 6),
+                   *(_num(fields, i) ** 2 for i in range(7, 13)), _num(fields, 13), _num(fields, 14))
+        ep = Epoch(t, fields[0], fields[1], q, vec, false_fix)
+        for w in self.windows.values():
+            w.add(ep)
+        self.epochs += 1
+        self._track_false_fix(ep, dist)
+        return ep
+
+    def _track_false_fix(self, ep: Epoch, dist: float) -> None:
+        if ep.q != Q_FIX or self.on_false_fix is None:
+            return
+        if ep.false_fix:
+            if self._false_since is None:
+                self._false_since = ep
+                self._false_max = dist
+                self.on_false_fix(f"{ep.date} {ep.time} FALSE FIX start: {dist:.3f} m from reference"
+                                  f" (limit {self.limit:.3f} m)")
+            self._false_max = max(self._false_max, dist)
+        elif self._false_since is not None:
+            start = self._false_since
+            self.on_false_fix(f"{ep.date} {ep.time} FALSE FIX end: started {start.date} {start.time},"
+                              f" {ep.t - start.t:.0f} s, max {self._false_max:.3f} m")
+            self._false_since = None
+
+    def summaries(self) -> Dict[int, Tuple[Optional[str], Optional[str], Optional[tuple]]]:
+        """Per ogni finestra: riga .mean.pos, riga .stat e ENU medio."""
+        out = {}
+        for seconds, w in self.windows.items():
+            mean = w.mean(self.ref) if self.ref is not None else None
+            out[seconds] = (mean.format_line() if mean else None, w.stat_line(), w.enu())
+        return out
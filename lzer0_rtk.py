@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Client per lo stream delle soluzioni di rtkrcv (porta TCP 5754).
+
+rtkrcv pubblica sulla porta una riga .pos per epoca. Il client mantiene
+una connessione persistente, legge in modo non bloccante tutto quello
+che è arrivato dall'ultima lettura e restituisce la soluzione più
+recente, senza processi esterni (socat, head, sh) e senza una seconda
+connessione di prova. In caso di errore la riconnessione avviene con
+backoff esponenziale.
+"""
+
+import select
+import socket
+import time
+from typing import List, NamedTuple, Optional
+
+RECV_SIZE = 65536
+
+
+class Solution(NamedTuple):
+    """Campi principali di una riga di soluzione .pos."""
+    date: str
+    time: str
+    lat: float
+    lon: float
+    height: float
+    q: str
+    ns: int
+    sdn: float
+    sde: float
+    sdu: float
+    ratio: float
+
+
+def parse_solution(line: str) -> Optional[Solution]:
+    """Interpreta una riga .pos; None se è un'intestazione o non è completa."""
+    if not line or line.startswith("%"):
+        return None
+    v = line.split()
+    if len(v) < 6:
+        return None
+    try:
+        return Solution(
+            date=v[0], time=v[1], lat=float(v[2]), lon=float(v[3]),
+            height=float(v[4]), q=v[5],
+            ns=int(v[6]) if len(v) > 6 else 0,
+            sdn=float(v[7]) if len(v) > 7 else 0.0,
+            sde=float(v[8]) if len(v) > 8 else 0.0,
+            sdu=float(v[9]) if len(v) > 9 else 0.0,
+            ratio=float(v[14]) if len(v) > 14 else 0.0,
+        )
+    except ValueError:
+        return None
+
+
+class RTKSolutionClient:
+    """Connessione persistente e non bloccante allo stream delle soluzioni."""
+
+    def __init__(self, host: str, port: int, timeout: float = 10,
+                 backoff_min: float = 1, backoff_max: float = 30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.sock: Optional[socket.socket] = None
+        self.failures = 0
+        self.last_error = ""
+        self._backoff = 0.0
+        self._next_attempt = 0.0
+        self._buf = b""
+
+    @property
+    def connected(self) -> bool:
+        return self.sock is not None
+
+    def fileno(self) -> int:
+        return self.sock.fileno() if self.sock is not None else -1
+
+    def connect(self) -> bool:
+        """
+        Apre la connessione se non è già attiva.
+
+        Durante il backoff dopo un errore non tenta e restituisce False.
+        """
+        if self.sock is not None:
+            return True
+        now = time.monotonic()
+        if now < self._next_attempt:
+            return False
+        try:
+            sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError as e:
+            self.failures += 1
+            self.last_error = str(e)
+            self._backoff = min(max(self._backoff * 2, self.backoff_min), self.backoff_max)
+            self._next_attempt = now + self._backoff
+            return False
+        sock.setblocking(False)
+        self.sock = sock
+        self.failures = 0
+        self.last_error = ""
+        self._backoff = 0.0
+        self._buf = b""
+        return True
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self._buf = b""
+
+    def _disconnect(self, reason: str) -> None:
+        self.last_error = reason
+        self.close()
+        self._next_attempt = time.monotonic() + self.backoff_min
+
+    def read_lines(self) -> List[str]:
+        """
+        Legge tutto ciò che è disponibile senza bloccare e restituisce le righe complete.
+
+        Se il server chiude la connessione il client si disconnette; la
+        riconnessione avviene alla successiva chiamata a connect().
+        """
+        if self.sock is None:
+            return []
+        chunks = [self._buf]
+        while True:
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self._disconnect(str(e))
+                break
+            if not data:
+                self._disconnect("connessione chiusa dal server")
+                break
+            chunks.append(data)
+        buf = b"".join(chunks)
+        if self.sock is None:
+            return []
+        lines = buf.split(b"\n")
+        self._buf = lines.pop()
+        return [l.decode("ascii", "replace").strip() for l in lines if l.strip()]
+
+    def latest(self, timeout: Optional[float] = None) -> Optional[Solution]:
+        """
+        Restituisce la soluzione più recente.
+
+        Svuota il buffer del socket e, se non c'è ancora una riga
+        completa, attende al massimo timeout secondi la prossima epoca.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while self.sock is not None:
+            for line in reversed(self.read_lines()):
+                sol = parse_solution(line)
+                if sol is not None:
+                    return sol
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.sock is None:
+                break
+            select.select([self.sock], [], [], remaining)
+        return None
+
+
+class ConsoleError(Exception):
+    pass
+
+
+# Byte di controllo del protocollo telnet usati dalla console di rtkrcv
+IAC, SB, SE = 255, 250, 240
+
+
+def _strip_telnet(data: bytes) -> bytes:
+    """Rimuove le sequenze di negoziazione telnet (IAC ...) dall'output."""
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        b = data[i]
+        if b != IAC:
+            out.append(b)
+            i += 1
+        elif i + 1 < len(data) and data[i + 1] == SB:
+            end = data.find(bytes([IAC, SE]), i + 2)
+            i = len(data) if end < 0 else end + 2
+        elif i + 1 < len(data) and data[i + 1] >= 251:
+            i += 3   # WILL/WONT/DO/DONT opzione
+        else:
+            i += 2
+    return bytes(out)
+
+
+class RTKConsole:
+    """
+    Console telnet di rtkrcv (rtkrcv -p 2950), senza il client telnet.
+
+    Equivale alla sequenza `(echo admin; echo start; echo exit) | telnet
+    localhost 2950` di lzer0.start.rtk, ma attende il prompt invece di
+    usare sleep fissi e restituisce l'output di ogni comando.
+    """
+
+    PROMPT = b"rtkrcv> "
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 2950,
+                 password: str = "admin", timeout: float = 10):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+
+    def _read_until(self, marks: List[bytes]) -> str:
+        buf = b""
+        deadline = time.monotonic() + self.timeout
+        while not any(buf.endswith(m) for m in marks):
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise ConsoleError(f"timeout waiting for rtkrcv on {self.host}:{self.port}")
+            self.sock.settimeout(left)
+            try:
+                data = self.sock.recv(RECV_SIZE)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConsoleError("rtkrcv console closed the connection")
+            buf += _strip_telnet(data)
+        return buf.decode("ascii", "replace")
+
+    def open(self) -> None:
+        try:
+            self.sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError as e:
+            raise ConsoleError(f"cannot connect to rtkrcv console {self.host}:{self.port}: {e}")
+        try:
+            first = self._read_until([b"password: ", self.PROMPT])
+            if first.endswith("password: "):
+                self.sock.sendall(self.password.encode() + b"\r\n")
+                self._read_until([self.PROMPT])
+        except (OSError, ConsoleError):
+            self.close()
+            raise
+
+    def command(self, cmd: str) -> str:
+        """Esegue un comando e restituisce l'output fino al prompt successivo."""
+        if self.sock is None:
+            self.open()
+        try:
+            self.sock.sendall(cmd.encode() + b"\r\n")
+            out = self._read_until([self.PROMPT])
+        except OSError as e:
+            raise ConsoleError(f"rtkrcv console: {e}")
+        return out[:-len(self.PROMPT)].strip()
+
+    def close(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.sendall(b"exit\r\n")
+            except OSError:
+                pass
+            self.sock.close()
+        self.sock = None
+
+    def __enter__(self) -> "RTKConsole":
+        self.open()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
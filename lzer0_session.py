@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Ore, sessioni e date dei file orari lzer0 da tabelle precalcolate.
+
+Sostituisce, per gli script Python, hr2ses/ses2hr, il padding di DOY e
+ora con awk e le chiamate `date -d` per FULLDATE e per il passaggio
+della mezzanotte: una (anno, DOY, ora) o un intervallo di ore viene
+risolto in tutti i nomi derivati (sessione, YY, data completa, percorsi
+del grezzo, del .bz2, dei RINEX e dei .pos sotto DUMPDIR) senza
+processi esterni e senza un datetime per ora.
+
+Due convenzioni per l'ora, come negli script:
+    ora dei dati   0..23, sessione a..x (RTKLIB %H, lzer0.batch.pp)
+    HOUR           1..24 = ora dei dati + 1 (hr2ses, lzer0.start.pp)
+"""
+
+import calendar
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+SESSIONS = "abcdefghijklmnopqrstuvwx"
+HR2SES = ("X",) + tuple(SESSIONS.upper())          # indice = HOUR 0..24
+SES2HR = {s: i + 1 for i, s in enumerate(SESSIONS.upper())}
+HH = tuple("%02d" % h for h in range(25))
+DDD = tuple("%03d" % d for d in range(367))
+RINEX_EXTS = "onghqls"
+
+
+def hr2ses(hour: int) -> str:
+    """Come lo script hr2ses: 1..24 -> A..X, 0 -> X."""
+    hour = int(hour)
+    if not 0 <= hour <= 24:
+        raise ValueError(f"invalid hour {hour}")
+    return HR2SES[hour]
+
+
+def ses2hr(ses: str) -> int:
+    """Come lo script ses2hr: A..X -> 1..24 (anche minuscole)."""
+    return SES2HR[ses.upper()]
+
+
+@lru_cache(maxsize=None)
+def year_dates(year: int) -> Tuple[str, ...]:
+    """Data YYYY.MM.DD di ogni DOY dell'anno (indice 1..365/366, 0 vuoto)."""
+    first = date(year, 1, 1).toordinal()
+    ndays = 366 if calendar.isleap(year) else 365
+    return ("",) + tuple(date.fromordinal(first + i).strftime("%Y.%m.%d") for i in range(ndays))
+
+
+class Hour(NamedTuple):
+    """Un'ora di dati su disco: anno, DOY (3 cifre), sessione e data completa."""
+    year: str
+    doy: str
+    ses: str
+    fulldate: str
+
+    @property
+    def yy(self) -> str:
+        return self.year[2:4]
+
+    @property
+    def SES(self) -> str:
+        return self.ses.upper()
+
+    @property
+    def hour(self) -> int:
+        """Ora dei dati 0..23."""
+        return ord(self.ses) - 97
+
+    @property
+    def script_hour(self) -> int:
+        """HOUR degli script 1..24."""
+        return ord(self.ses) - 96
+
+    @property
+    def start(self) -> datetime:
+        return datetime(int(self.year), 1, 1) + timedelta(days=int(self.doy) - 1, hours=self.hour)
+
+    @property
+    def key(self) -> str:
+        """Es. 2022.235.a"""
+        return f"{self.year}.{self.doy}.{self.ses}"
+
+    def session_dir(self, dumpdir: str) -> str:
+        return f"{dumpdir}/{self.year}/{self.doy}/{self.ses}"
+
+    def raw_name(self, site: str, prefix: str = "") -> str:
+        """Es. L001a22.235, UL001a22.235"""
+        return f"{prefix}{site.upper()}{self.ses}{self.yy}.{self.doy}"
+
+    def raw_path(self, dumpdir: str, site: str, prefix: str = "") -> str:
+        return f"{self.session_dir(dumpdir)}/{self.raw_name(site, prefix)}"
+
+    def bz2_path(self, dumpdir: str, site: str, prefix: str = "") -> str:
+        """Es. /mnt/hd/gnss/2022/235/a/L001a22.235.bz2"""
+        return f"{self.raw_path(dumpdir, site, prefix)}.bz2"
+
+    def rinex_name(self, site: str, ext: str) -> str:
+        """Es. l001235a.22o"""
+        return f"{site.lower()}{self.doy}{self.ses}.{self.yy}{ext}"
+
+    def rinex_names(self, site: str) -> Dict[str, str]:
+        return {ext: self.rinex_name(site, ext) for ext in RINEX_EXTS}
+
+    def pos_path(self, dumpdir: str, site: str) -> str:
+        """Soluzione in tempo reale di lzer0.record.hourlypos (%Y/%n/%H/SITE.%Y.%m.%d.%n.%H.pos)."""
+        return f"{self.session_dir(dumpdir)}/{site.upper()}.{self.fulldate}.{self.doy}.{self.ses}.pos"
+
+    def pp_dir(self, dumpdir: str) -> str:
+        return f"{dumpdir}/{self.year}/{self.doy}/1Hpp"
+
+    def pp_name(self, site: str) -> str:
+        """Es. BRU1.2019.01.11.011.a.pp.pos"""
+        return f"{site.upper()}.{self.fulldate}.{self.doy}.{self.ses}.pp.pos"
+
+    def pp_path(self, dumpdir: str, site: str) -> str:
+        return f"{self.pp_dir(dumpdir)}/{self.pp_name(site)}"
+
+
+def from_session(year, doy, ses: str) -> Hour:
+    """Ora di una sessione (lettera a..x, maiuscola o minuscola) del giorno indicato."""
+    year, doy, ses = int(year), int(doy), ses.lower()
+    if ses not in SESSIONS or len(ses) != 1:
+        raise ValueError(f"invalid session {ses!r}")
+    days = year_dates(year)
+    if not 1 <= doy < len(days):
+        raise ValueError(f"invalid day of year {doy} for {year}")
+    return Hour(str(year), DDD[doy], ses, days[doy])
+
+
+def from_script_hour(year, doy, hour: int) -> Hour:
+    """HOUR degli script (1..24; 0 come hr2ses è la sessione x dello stesso giorno)."""
+    return from_session(year, doy, hr2ses(hour))
+
+
+def from_datetime(t: datetime) -> Hour:
+    """Ora dei dati che contiene t."""
+    return from_session(t.year, t.timetuple().tm_yday, SESSIONS[t.hour])
+
+
+def current(now: Optional[datetime] = None) -> Hour:
+    """
+    L'ora appena conclusa, default di lzer0.start.pp: HOUR = ora corrente,
+    e a mezzanotte (HOUR 00) la sessione x del giorno precedente.
+    """
+    return from_datetime((now or datetime.now()) - timedelta(hours=1))
+
+
+def parse_hour(text: str) -> Hour:
+    """YYYY.DDD.HH (ora dei dati, facoltativa, default 00)."""
+    parts = text.split(".")
+    hour = int(parts[2]) if len(parts) > 2 else 0
+    if len(parts) < 2 or not 0 <= hour <= 23:
+        raise ValueError(f"invalid hour {text!r}, expected YYYY.DDD.HH")
+    return from_session(parts[0], parts[1], SESSIONS[hour])
+
+
+def next_hour(h: Hour) -> Hour:
+    hour = ord(h.ses) - 96
+    if hour < 24:
+        return Hour(h.year, h.doy, SESSIONS[hour], h.fulldate)
+    year, doy = int(h.year), int(h.doy) + 1
+    days = year_dates(year)
+    if doy == len(days):
+        year, doy = year + 1, 1
+        days = year_dates(year)
+    return Hour(str(year), DDD[doy], "a", days[doy])
+
+
+def hour_range(begin: Hour, end: Hour) -> Iterator[Hour]:
+    """Ore da begin a end compresi."""
+    stop = (end.year, end.doy, end.ses)
+    h = begin
+    while (h.year, h.doy, h.ses) <= stop:
+        yield h
+        h = next_hour(h)
+
+
+def past_hours(nhours: int, now: Optional[datetime] = None) -> List[Hour]:
+    """Le nhours ore precedenti a quella corrente, dalla più vecchia."""
+    if nhours <= 0:
+        return []
+    now = now or datetime.now()
+    return list(hour_range(from_datetime(now - timedelta(hours=nhours)),
+                           from_datetime(now - timedelta(hours=1))))
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Lettura unica degli stream TCP di str2str/rtkrcv e distribuzione ai sink.
+
+Ogni porta (es. 2222 grezzo u-blox, 5754 soluzioni rtkrcv) viene letta
+una sola volta, con recv_into in un buffer preallocato; i byte letti
+diventano un unico oggetto bytes condiviso da tutti i sink, invece di
+un processo (str2str, socat) per consumatore.
+
+Sink disponibili:
+    HourlyFileSink  file orari con i nomi di str2str (%Y/%n/%H, ...)
+    NMEATimeSink    data e ora dalle frasi $GNRMC/$GNGGA
+
+Ogni sink ha una coda limitata in byte: se il consumatore non tiene il
+passo i dati in eccesso vengono scartati e contati (dropped), e ogni
+superamento della soglia alta viene contato come back-pressure. Un
+errore di scrittura (disco USB pieno o rimontato) scarta solo il blocco
+corrente: il file viene riaperto al blocco successivo. run_taps riavvia
+i sink terminati per un errore imprevisto.
+"""
+
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional
+
+READ_SIZE = 256 * 1024
+QUEUE_LIMIT = 4 * 1024 * 1024
+RECONNECT_MIN = 1.0
+RECONNECT_MAX = 30.0
+
+# Differenza GPST - UTC: str2str ruota i file sull'ora GPS
+GPS_LEAP_SECONDS = 18
+GPS_EPOCH = datetime(1980, 1, 6, tzinfo=timezone.utc)
+
+
+def gpst_now() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(seconds=GPS_LEAP_SECONDS)
+
+
+def expand_path(pattern: str, t: datetime) -> str:
+    """
+    Sostituisce le parole chiave dei percorsi RTKLIB (reppath).
+
+    %Y yyyy, %y yy, %m mm, %d dd, %h hh, %H sessione a-x, %M minuti,
+    %n giorno dell'anno ddd, %W settimana GPS, %D giorno della settimana.
+    """
+    week, dow = divmod((t.date() - GPS_EPOCH.date()).days, 7)
+    keys = {
+        "%Y": f"{t:%Y}", "%y": f"{t:%y}", "%m": f"{t:%m}", "%d": f"{t:%d}",
+        "%h": f"{t:%H}", "%H": chr(ord("a") + t.hour), "%M": f"{t:%M}",
+        "%n": f"{t:%j}", "%W": "%04d" % week, "%D": str(dow),
+    }
+    out = []
+    i = 0
+    while i < len(pattern):
+        key = pattern[i:i + 2]
+        if key in keys:
+            out.append(keys[key])
+            i += 2
+        else:
+            out.append(pattern[i])
+            i += 1
+    return "".join(out)
+
+
+class Sink:
+    """Consumatore dello stream con coda limitata e contatori."""
+
+    name = "sink"
+
+    def __init__(self, queue_limit: int = QUEUE_LIMIT, log: Callable[[str], None] = print):
+        self.queue_limit = queue_limit
+        self.log = log
+        self.high_water = queue_limit // 2
+        self._queue: List[bytes] = []
+        self._queued = 0
+        self._event = asyncio.Event()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped = 0
+        self.backpressure = 0
+        self.errors = 0
+        self._over = False
+        self._failing = False
+
+    def offer(self, data: bytes) -> None:
+        """Accoda i dati senza bloccare il lettore; scarta e conta se la coda è piena."""
+        self.bytes_in += len(data)
+        if self._queued + len(data) > self.queue_limit:
+            self.dropped += len(data)
+            return
+        self._queue.append(data)
+        self._queued += len(data)
+        if self._queued > self.high_water and not self._over:
+            self.backpressure += 1
+            self._over = True
+        self._event.set()
+
+    async def run(self) -> None:
+        """Consuma la coda fino alla cancellazione."""
+        try:
+            while True:
+                if not self._queue:
+                    await self._event.wait()
+                self._event.clear()
+                while self._queue:
+                    chunk = b"".join(self._queue)
+                    self._queue.clear()
+                    self._queued = 0
+                    self._over = False
+                    try:
+                        await self.consume(chunk)
+                    except OSError as e:
+                        self._write_error(chunk, e)
+                        continue
+                    self.bytes_out += len(chunk)
+                    if self._failing:
+                        self._failing = False
+                        self.log(f"{self.name}: scrittura ripresa")
+        finally:
+            self.close()
+
+    def _write_error(self, chunk: bytes, error: OSError) -> None:
+        """Scarta il blocco e chiude l'uscita: il blocco successivo la riapre."""
+        self.errors += 1
+        self.dropped += len(chunk)
+        if not self._failing:
+            # Un solo messaggio per episodio, non uno per blocco
+            self._failing = True
+            self.log(f"{self.name}: errore di scrittura, dati scartati fino al ripristino: {error}")
+        self.close()
+
+    async def consume(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> str:
+        return (f"{self.name}: in {self.bytes_in} out {self.bytes_out} "
+                f"dropped {self.dropped} backpressure {self.backpressure} errors {self.errors}")
+
+
+class HourlyFileSink(Sink):
+    """
+    Scrive lo stream in file ruotati come `str2str -out file://PATTERN::S=1`.
+
+    Il nome viene ricalcolato sull'ora GPS; con line_aligned (file .pos)
+    il cambio di file avviene a fine riga. I file sono aperti in append,
+    così un riavvio a metà ora non tronca i dati già scritti.
+    """
+
+    def __init__(self, pattern: str, swap_hours: int = 1, line_aligned: bool = False,
+                 clock: Callable[[], datetime] = gpst_now, **kwargs):
+        super().__init__(**kwargs)
+        self.pattern = pattern
+        self.swap = timedelta(hours=swap_hours)
+        self.line_aligned = line_aligned
+        self.clock = clock
+        self.name = os.path.basename(pattern)
+        self.path: Optional[str] = None
+        self._file = None
+
+    def _target(self) -> str:
+        t = self.clock()
+        step = int(self.swap.total_seconds())
+        t0 = datetime.fromtimestamp(int(t.timestamp()) // step * step, t.tzinfo)
+        return expand_path(self.pattern, t0)
+
+    def _write(self, data: bytes) -> None:
+        target = self._target()
+        if target != self.path:
+            if self.line_aligned and self._file is not None:
+                # Le righe complete vanno ancora nel file dell'ora precedente
+                cut = data.rfind(b"\n") + 1
+                self._file.write(data[:cut])
+                data = data[cut:]
+            self.close()
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            self._file = open(target, "ab")
+            self.path = target
+        self._file.write(data)
+        self._file.flush()
+
+    async def consume(self, data: bytes) -> None:
+        # La scrittura su disco (USB) non deve fermare il ciclo di lettura
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def close(self) -> None:
+        """Chiude il file corrente; il prossimo blocco riapre il file dell'ora."""
+        f, self._file, self.path = self._file, None, None
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass   # flush fallito: l'errore è già stato registrato
+
+
+class NMEATimeSink(Sink):
+    """
+    Data (da $xxRMC) e ora (da $xxGGA) più recenti dello stream.
+
+    Equivale alle due sessioni socat | grep | gawk di lzer0.get.datetime:
+    datetime() restituisce "YYYY/MM/DD hh:mm:ss.ss".
+    """
+
+    name = "nmea"
+
+    def __init__(self, on_time: Optional[Callable[[str], None]] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.on_time = on_time
+        self.date: Optional[str] = None
+        self.time: Optional[str] = None
+        self._buf = b""
+
+    @staticmethod
+    def _valid(sentence: bytes) -> bool:
+        star = sentence.rfind(b"*")
+        if star < 0:
+            return False
+        cs = 0
+        for b in sentence[1:star]:
+            cs ^= b
+        try:
+            return cs == int(sentence[star + 1:star + 3], 16)
+        except ValueError:
+            return False
+
+    async def consume(self, data: bytes) -> None:
+        buf = self._buf + data
+        start = buf.find(b"$")
+        while start >= 0:
+            end = buf.find(b"\n", start)
+            if end < 0:
+                break
+            self._sentence(buf[start:end].rstrip(b"\r"))
+            start = buf.find(b"$", end)
+        # Solo l'eventuale frase incompleta resta nel buffer
+        self._buf = buf[start:] if start >= 0 and len(buf) - start < 256 else b""
+
+    def _sentence(self, s: bytes) -> None:
+        if len(s) < 7 or not self._valid(s):
+            return
+        fields = s.split(b"*")[0].split(b",")
+        kind = fields[0][3:6]
+        if kind == b"RMC" and len(fields) > 9 and len(fields[9]) == 6:
+            d = fields[9].decode()
+            self.date = f"20{d[4:6]}/{d[2:4]}/{d[0:2]}"
+        elif kind == b"GGA" and len(fields) > 1 and len(fields[1]) >= 6:
+            t = fields[1].decode()
+            self.time = f"{t[0:2]}:{t[2:4]}:{t[4:9]}"
+        else:
+            return
+        if self.on_time is not None and self.date and self.time:
+            self.on_time(self.datetime())
+
+    def datetime(self) -> Optional[str]:
+        if self.date and self.time:
+            return f"{self.date} {self.time}"
+        return None
+
+    def stats(self) -> str:
+        return f"{super().stats()} last {self.datetime() or '-'}"
+
+
+class StreamTap:
+    """Una connessione TCP letta una volta sola e distribuita ai sink."""
+
+    def __init__(self, host: str, port: int, sinks: List[Sink],
+                 log: Callable[[str], None] = print, read_size: int = READ_SIZE):
+        self.host = host
+        self.port = port
+        self.sinks = sinks
+        self.log = log
+        self.read_size = read_size
+        self.bytes_read = 0
+        self.reconnects = 0
+
+    async def _connect(self) -> socket.socket:
+        loop = asyncio.get_running_loop()
+        backoff = RECONNECT_MIN
+        while True:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            try:
+                await loop.sock_connect(sock, (self.host, self.port))
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.read_size)
+                self.log(f"Connesso a {self.host}:{self.port}")
+                return sock
+            except OSError as e:
+                sock.close()
+                self.log(f"Connessione a {self.host}:{self.port} fallita: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        buf = bytearray(self.read_size)
+        view = memoryview(buf)
+        while True:
+            sock = await self._connect()
+            try:
+                while True:
+                    n = await loop.sock_recv_into(sock, buf)
+                    if n == 0:
+                        self.log(f"Connessione chiusa da {self.host}:{self.port}")
+                        break
+                    self.bytes_read += n
+                    # Una sola copia per lettura, condivisa da tutti i sink
+                    data = bytes(view[:n])
+                    for sink in self.sinks:
+                        sink.offer(data)
+            except OSError as e:
+                self.log(f"Errore di lettura da {self.host}:{self.port}: {e}")
+            finally:
+                sock.close()
+            self.reconnects += 1
+            await asyncio.sleep(RECONNECT_MIN)
+
+    def stats(self) -> str:
+        return (f"{self.host}:{self.port} read {self.bytes_read} reconnects {self.reconnects}; "
+                + "; ".join(s.stats() for s in self.sinks))
+
+
+async def supervise_sink(sink: Sink, log: Callable[[str], None] = print) -> None:
+    """Esegue il sink e lo riavvia se termina per un errore imprevisto."""
+    while True:
+        try:
+            await sink.run()
+        except Exception as e:
+            log(f"{sink.name}: sink terminato per errore ({e!r}), riavvio")
+        await asyncio.sleep(RECONNECT_MIN)
+
+
+async def run_taps(taps: List[StreamTap], log: Callable[[str], None] = print,
+                   stats_interval: float = 300) -> None:
+    """Esegue tap e sink (sorvegliati) e registra periodicamente i contatori."""
+    tasks = [asyncio.create_task(t.run()) for t in taps]
+    for t in taps:
+        for s in t.sinks:
+            s.log = log
+            tasks.append(asyncio.create_task(supervise_sink(s, log)))
+    try:
+        while True:
+            await asyncio.sleep(stats_interval)
+            for t in taps:
+                log(t.stats())
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def read_datetime(host: str, port: int, timeout: float = 30) -> Optional[str]:
+    """Prima data e ora complete dallo stream NMEA (modalità di lzer0.get.datetime)."""
+    found = asyncio.get_running_loop().create_future()
+
+    def on_time(value: str) -> None:
+        if not found.done():
+            found.set_result(value)
+
+    sink = NMEATimeSink(on_time)
+    tap = StreamTap(host, port, [sink], log=lambda m: None)
+    tasks = [asyncio.create_task(tap.run()), asyncio.create_task(sink.run())]
+    try:
+        return await asyncio.wait_for(found, timeout)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -3,15 +3,283 @@
 # vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
 from pprint import pprint
 import json
+import os
+import socket
+import stat
 import sys
+import time
+
+# Unix socket of the resident daemon (--daemon), in a directory only the service user can enter,
+# and lifetime of its cached reads
+SOCKET_PATH = os.path.expanduser('~/var/pijuice/pijuice_util.sock')
+CACHE_TTL = 2.0
+CLIENT_TIMEOUT = 2.0
 
 def getDataOrError(d):
     rv = d.get('data', d['error'])
     return rv
 
+class Snapshot(object):
+    """
+    Memoized PiJuice Get* calls: each register is read over I2C once and
+    then served from memory, for the whole run (ttl None) or for ttl seconds.
+    """
+
+    def __init__(self, pj, ttl=None):
+        self.pj = pj
+        self.ttl = ttl
+        self.reads = 0
+        self._cache = {}
+
+    def get(self, interface, name, *args):
+        key = (interface, name) + args
+        now = time.monotonic()
+        hit = self._cache.get(key)
+        if hit is not None and (self.ttl is None or now - hit[0] < self.ttl):
+            return hit[1]
+        rv = getattr(getattr(self.pj, interface), name)(*args)
+        self._cache[key] = (now, rv)
+        self.reads += 1
+        return rv
+
+    def invalidate(self):
+        self._cache.clear()
+
+def read_status(snap):
+    return snap.get('status', 'GetStatus')
+
+def read_battery(snap):
+    v = {}
+    v['batteryCurrent'] = getDataOrError(snap.get('status', 'GetBatteryCurrent'))
+    v['batteryVoltage'] = getDataOrError(snap.get('status', 'GetBatteryVoltage'))
+    v['chargeLevel'] = getDataOrError(snap.get('status', 'GetChargeLevel'))
+    s = read_status(snap).get('data',{ 'error': 'NO-STATUS-AVAILABLE'})
+    v['batteryStatus']  = s.get('battery', 'BATTERY_STATUS-NOT-IN-STATUS')
+    return v
+
+def read_input(snap):
+    v = {}
+    # TODO should we camelCase here
+    v['ioVoltage'] = getDataOrError(snap.get('status', 'GetIoVoltage'))
+    v['ioCurrent'] = getDataOrError(snap.get('status', 'GetIoCurrent'))
+    s = read_status(snap).get('data',{ 'error': 'NO-STATUS-AVAILABLE'})
+    # TODO is 'gpioPowerStatus' name good, or should it be powerInput5vIo?
+    v['gpioPowerStatus'] = s.get('powerInput5vIo', 'GPIO_POWER_STATUS-NOT-IN-STATUS')
+    v['usbPowerInput']  = s.get('powerInput', 'POWERINPUT-NOT-IN-STATUS')
+    return v
+
+QUERIES = {
+    'status': read_status,
+    'battery': read_battery,
+    'input': read_input,
+}
+
+POWER_INPUTS_KEYS = ['precedence', 'gpio_in_enabled', 'usb_micro_current_limit', 'usb_micro_dpm', 'no_battery_turn_on']
+
+def read_config(snap):
+    """Settings in the --dump JSON layout, every register read once."""
+    cfg = snap.pj.config
+    RUN_PIN_VALUES = cfg.runPinConfigs
+    EEPROM_ADDRESSES = cfg.idEepromAddresses
+    INPUTS_PRECEDENCE = cfg.powerInputs
+    USB_CURRENT_LIMITS = cfg.usbMicroCurrentLimits
+    USB_MICRO_IN_DPMS = cfg.usbMicroDPMs
+    POWER_REGULATOR_MODES = cfg.powerRegulatorModes
+
+    config = {}
+    config['general'] = {}
+    config['general']['run_pin'] = RUN_PIN_VALUES.index(snap.get('config', 'GetRunPinConfig').get('data'))
+    config['general']['i2c_addr'] = snap.get('config', 'GetAddress', 1).get('data')
+    config['general']['i2c_addr_rtc'] = snap.get('config', 'GetAddress', 2).get('data')
+    config['general']['eeprom_addr'] = EEPROM_ADDRESSES.index(snap.get('config', 'GetIdEepromAddress').get('data'))
+    config['general']['eeprom_write_unprotected'] = not snap.get('config', 'GetIdEepromWriteProtect').get('data', False)
+
+    result = snap.get('config', 'GetPowerInputsConfig')
+    if result['error'] == 'NO_ERROR':
+        pow_config = result['data']
+        config['general']['precedence'] = INPUTS_PRECEDENCE.index(pow_config['precedence'])
+        config['general']['gpio_in_enabled'] = pow_config['gpio_in_enabled']
+        config['general']['usb_micro_current_limit'] = USB_CURRENT_LIMITS.index(pow_config['usb_micro_current_limit'])
+        config['general']['usb_micro_dpm'] = USB_MICRO_IN_DPMS.index(pow_config['usb_micro_dpm'])
+        config['general']['no_battery_turn_on'] = pow_config['no_battery_turn_on']
+
+    config['general']['power_reg_mode'] = POWER_REGULATOR_MODES.index(snap.get('config', 'GetPowerRegulatorMode').get('data'))
+    config['general']['charging_enabled'] = snap.get('config', 'GetChargingConfig').get('data', {}).get('charging_enabled')
+
+    LED_FUNCTIONS_OPTIONS = cfg.ledFunctionsOptions
+
+    config['led'] = []
+
+    for led in cfg.leds:
+        result = snap.get('config', 'GetLedConfiguration', led)
+        led_config = {}
+        try:
+            led_config['function'] = result['data']['function']
+        except ValueError:
+            led_config['function'] = LED_FUNCTIONS_OPTIONS[0]
+        led_config['color'] = [result['data']['parameter']['r'], result['data']['parameter']['g'], result['data']['parameter']['b']]
+        config['led'].append(led_config)
+
+    config['button'] = {}
+
+    for button in cfg.buttons:
+        button_config = snap.get('config', 'GetButtonConfiguration', button)
+        config['button'][button] = button_config.get('data')
+
+    return config
+
+def load_config(pj, config, ns):
+    """Write the settings of ns that differ from config (as read by read_config); return the Set* calls made."""
+    cfg = pj.config
+    RUN_PIN_VALUES = cfg.runPinConfigs
+    EEPROM_ADDRESSES = cfg.idEepromAddresses
+    INPUTS_PRECEDENCE = cfg.powerInputs
+    USB_CURRENT_LIMITS = cfg.usbMicroCurrentLimits
+    USB_MICRO_IN_DPMS = cfg.usbMicroDPMs
+    POWER_REGULATOR_MODES = cfg.powerRegulatorModes
+    written = []
+
+    # Address has to be set first
+    for i, addr in enumerate(['i2c_addr', 'i2c_addr_rtc']):
+        if config['general'][addr] != ns['general'][addr]:
+            value = config['general'][addr]
+            try:
+                new_value = int(str(ns['general'][addr]), 16)
+                if new_value >= 8 and new_value <= 0x77:
+                    value = ns['general'][addr]
+            except:
+                pass
+            cfg.SetAddress(i + 1, value)
+            written.append('SetAddress')
+
+    if config['general']['run_pin'] != ns['general']['run_pin']:
+        cfg.SetRunPinConfig(RUN_PIN_VALUES[ns['general']['run_pin']])
+        written.append('SetRunPinConfig')
+    if config['general']['eeprom_addr'] != ns['general']['eeprom_addr']:
+        cfg.SetIdEepromAddress(EEPROM_ADDRESSES[ns['general']['eeprom_addr']])
+        written.append('SetIdEepromAddress')
+    # a failed GetPowerInputsConfig leaves the keys out of config: write them
+    if any(config['general'].get(k) != ns['general'][k] for k in POWER_INPUTS_KEYS):
+        power_config = {
+            'precedence': INPUTS_PRECEDENCE[ns['general']['precedence']],
+            'gpio_in_enabled': ns['general']['gpio_in_enabled'],
+            'no_battery_turn_on': ns['general']['no_battery_turn_on'],
+            'usb_micro_current_limit': USB_CURRENT_LIMITS[ns['general']['usb_micro_current_limit']],
+            'usb_micro_dpm': USB_MICRO_IN_DPMS[ns['general']['usb_micro_dpm']],
+        }
+        cfg.SetPowerInputsConfig(power_config, True)
+        written.append('SetPowerInputsConfig')
+    if config['general']['power_reg_mode'] != ns['general']['power_reg_mode']:
+        cfg.SetPowerRegulatorMode(POWER_REGULATOR_MODES[ns['general']['power_reg_mode']])
+        written.append('SetPowerRegulatorMode')
+    if config['general']['charging_enabled'] != ns['general']['charging_enabled']:
+        cfg.SetChargingConfig({'charging_enabled': ns['general']['charging_enabled']}, True)
+        written.append('SetChargingConfig')
+
+    for i, led in enumerate(cfg.leds):
+        if config['led'][i] == ns['led'][i]:
+            continue
+        led_config = {
+            'function': ns['led'][i]['function'],
+            'parameter': {
+                'r': ns['led'][i]['color'][0],
+                'g': ns['led'][i]['color'][1],
+                'b': ns['led'][i]['color'][2],
+            }
+        }
+        cfg.SetLedConfiguration(led, led_config)
+        written.append('SetLedConfiguration')
+
+    for button in cfg.buttons:
+        if config['button'][button] != ns['button'][button]:
+            cfg.SetButtonConfiguration(button, ns['button'][button])
+            written.append('SetButtonConfiguration')
+
+    return written
+
+def query_daemon(path, what, timeout=CLIENT_TIMEOUT):
+    """Ask the resident daemon for status/battery/input; None if it is not running."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall((what + '\n').encode())
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = s.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        rv = json.loads(data.decode())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(rv, dict) or 'query_error' in rv:
+        return None
+    return rv
+
+def check_socket_dir(path):
+    """Create the socket directory (0700) if missing; an error message unless only we can write in it."""
+    d = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(d, mode=0o700, exist_ok=True)
+        st = os.lstat(d)
+    except OSError as e:
+        return 'cannot create %s: %s' % (d, e)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        return '%s must be a directory owned by uid %d and not writable by group or others' % (d, os.getuid())
+    return None
+
+def serve(snap, path):
+    """Answer one-line queries (status, battery, input) on a Unix socket from the cached snapshot."""
+    import logging, signal, socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            what = self.rfile.readline(64).decode(errors='replace').strip()
+            try:
+                rv = QUERIES[what](snap)
+            except KeyError:
+                rv = {'query_error': 'unknown query %r, expected one of %s' % (what, ', '.join(QUERIES))}
+            except Exception as e:
+                logging.exception('query %s failed', what)
+                snap.invalidate()
+                rv = {'query_error': str(e)}
+            self.wfile.write((json.dumps(rv) + '\n').encode())
+
+    error = check_socket_dir(path)
+    if error:
+        logging.error(error)
+        return 1
+    if os.path.lexists(path):
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            logging.error('%s exists and is not a socket', path)
+            return 1
+        os.remove(path)
+    # the socket is created 0600: no window in which others can connect
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(path, Handler)
+    finally:
+        os.umask(umask)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    logging.info('serving %s on %s (cache ttl %.1f s)', ', '.join(QUERIES), path, snap.ttl)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(path)
+        logging.info('%d I2C reads', snap.reads)
+    return 0
+
 if __name__ == '__main__':
-    import pijuice
-    from pijuice import pijuice_hard_functions, pijuice_sys_functions, pijuice_user_functions
     import argparse, logging
 
     parser = argparse.ArgumentParser(description='Command line utility for a PiJiuce')
@@ -24,8 +292,12 @@ if __name__ == '__main__':
     g.add_argument('--get-battery', action='store_true', help='print the pijuice battery status')
     g.add_argument('--get-input', action='store_true', help='print the pijuice input status')
     g.add_argument('--dump', action='store_true', help='print settings in JSON format to stdout')
-    g.add_argument('--load', action='store_true', help='load settings in JSON format from stdin')
+    g.add_argument('--load', action='store_true', help='load settings in JSON format from stdin (only changed values are written)')
+    g.add_argument('--daemon', action='store_true', help='stay resident and answer status, battery and input queries on --socket')
 
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket of the daemon (default %(default)s)')
+    parser.add_argument('--ttl', type=float, default=CACHE_TTL, help='daemon cache lifetime in seconds (default %(default)s)')
+    parser.add_argument('--no-daemon', action='store_true', help='always read the pijuice directly')
     parser.add_argument('--verbose', action='count', help='crank up logging')
 
     args = parser.parse_args()
@@ -34,8 +306,24 @@ if __name__ == '__main__':
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    # a running daemon answers without importing pijuice or touching the I2C bus
+    for what, wanted in (('status', args.get_status), ('battery', args.get_battery), ('input', args.get_input)):
+        if wanted and not args.no_daemon:
+            rv = query_daemon(args.socket, what)
+            if rv is not None:
+                print(rv)
+                sys.exit(0)
+
+    import pijuice
+    from pijuice import pijuice_hard_functions, pijuice_sys_functions, pijuice_user_functions
+
     # TODO does this need to be configurable
     pj = pijuice.PiJuice(1, 0x14)
+    snap = Snapshot(pj)
+
+    if args.daemon:
+        snap.ttl = args.ttl
+        sys.exit(serve(snap, args.socket))
 
     if args.enable_wakeup:
         rtc = pj.rtcAlarm
@@ -56,56 +344,7 @@ if __name__ == '__main__':
         print(ctr)
 
     if args.dump or args.load:
-        RUN_PIN_VALUES = pj.config.runPinConfigs
-        EEPROM_ADDRESSES = pj.config.idEepromAddresses
-        INPUTS_PRECEDENCE = pj.config.powerInputs
-        USB_CURRENT_LIMITS = pj.config.usbMicroCurrentLimits
-        USB_MICRO_IN_DPMS = pj.config.usbMicroDPMs
-        POWER_REGULATOR_MODES = pj.config.powerRegulatorModes
-
-        config = {}
-        config['general'] = {}
-        config['general']['run_pin'] = RUN_PIN_VALUES.index(pj.config.GetRunPinConfig().get('data'))
-        config['general']['i2c_addr'] = pj.config.GetAddress(1).get('data')
-        config['general']['i2c_addr_rtc'] = pj.config.GetAddress(2).get('data')
-        config['general']['eeprom_addr'] = EEPROM_ADDRESSES.index(pj.config.GetIdEepromAddress().get('data'))
-        config['general']['eeprom_write_unprotected'] = not pj.config.GetIdEepromWriteProtect().get('data', False)
-
-        result = pj.config.GetPowerInputsConfig()
-        if result['error'] == 'NO_ERROR':
-            pow_config = result['data']
-            config['general']['precedence'] = INPUTS_PRECEDENCE.index(pow_config['precedence'])
-            config['general']['gpio_in_enabled'] = pow_config['gpio_in_enabled']
-            config['general']['usb_micro_current_limit'] = USB_CURRENT_LIMITS.index(pow_config['usb_micro_current_limit'])
-            config['general']['usb_micro_dpm'] = USB_MICRO_IN_DPMS.index(pow_config['usb_micro_dpm'])
-            config['general']['no_battery_turn_on'] = pow_config['no_battery_turn_on']
-
-        config['general']['power_reg_mode'] = POWER_REGULATOR_MODES.index(pj.config.GetPowerRegulatorMode().get('data'))
-        config['general']['charging_enabled'] = pj.config.GetChargingConfig().get('data', {}).get('charging_enabled')
-
-        LED_FUNCTIONS_OPTIONS = pj.config.ledFunctionsOptions
-        LED_NAMES = pj.config.leds
-
-        config['led'] = []
-
-        for i in range(len(LED_NAMES)):
-            result = pj.config.GetLedConfiguration(LED_NAMES[i])
-            led_config = {}
-            try:
-                led_config['function'] = result['data']['function']
-            except ValueError:
-                led_config['function'] = LED_FUNCTIONS_OPTIONS[0]
-            led_config['color'] = [result['data']['parameter']['r'], result['data']['parameter']['g'], result['data']['parameter']['b']]
-            config['led'].append(led_config)
-
-        BUTTONS = pj.config.buttons
-
-        config['button'] = {}
-
-        got_error = False
-        for button in BUTTONS:
-            button_config = pj.config.GetButtonConfiguration(button)
-            config['button'][button] = button_config.get('data')
+        config = read_config(snap)
 
     if args.dump:
         if args.verbose:
@@ -118,53 +357,13 @@ if __name__ == '__main__':
             encoded_settings = encoded_settings + line.rstrip()
         ns = json.loads(encoded_settings)
 
-        # Address has to be set first
-        for i, addr in enumerate(['i2c_addr', 'i2c_addr_rtc']):
-            if config['general'][addr] != ns['general'][addr]:
-                value = config['general'][addr]
-                try:
-                    new_value = int(str(ns['general'][addr]), 16)
-                    if new_value >= 8 and new_value <= 0x77:
-                        value = ns['general'][addr]
-                except:
-                    pass
-                pj.config.SetAddress(i + 1, value)
-
-        if config['general']['run_pin'] != ns['general']['run_pin']:
-            pj.config.SetRunPinConfig(RUN_PIN_VALUES[ns['general']['run_pin']])
-        if config['general']['eeprom_addr'] != ns['general']['eeprom_addr']:
-            pj.config.SetIdEepromAddress(EEPROM_ADDRESSES[ns['general']['eeprom_addr']])
-        power_config = {
-            'precedence': INPUTS_PRECEDENCE[ns['general']['precedence']],
-            'gpio_in_enabled': ns['general']['gpio_in_enabled'],
-            'no_battery_turn_on': ns['general']['no_battery_turn_on'],
-            'usb_micro_current_limit': USB_CURRENT_LIMITS[ns['general']['usb_micro_current_limit']],
-            'usb_micro_dpm': USB_MICRO_IN_DPMS[ns['general']['usb_micro_dpm']],
-        }
-        pj.config.SetPowerInputsConfig(power_config, True);
-        if config['general']['power_reg_mode'] != ns['general']['power_reg_mode']:
-            pj.config.SetPowerRegulatorMode(POWER_REGULATOR_MODES[ns['general']['power_reg_mode']])
-        if config['general']['charging_enabled'] != ns['general']['charging_enabled']:
-            pj.config.SetChargingConfig({'charging_enabled': ns['general']['charging_enabled']}, True)
-
-        for i in range(len(LED_NAMES)):
-            led_config = {
-                'function': ns['led'][i]['function'],
-                'parameter': {
-                    'r': ns['led'][i]['color'][0],
-                    'g': ns['led'][i]['color'][1],
-                    'b': ns['led'][i]['color'][2],
-                }
-            }
-            pj.config.SetLedConfiguration(LED_NAMES[i], led_config)
-
-        for button in BUTTONS:
-            pj.config.SetButtonConfiguration(button, ns['button'][button])
+        written = load_config(pj, config, ns)
+        logging.debug ('%d reads, %d writes: %s', snap.reads, len(written), ', '.join(written) or 'settings unchanged')
 
     # primitives
 
     if args.get_status:
-        print(pj.status.GetStatus())
+        print(read_status(snap))
 
     if args.get_time:
         rtc = pj.rtcAlarm
@@ -174,11 +373,10 @@ if __name__ == '__main__':
 
     if args.get_config:
         rv = {}
-        config = pj.config
         # TODO either clean this up (making it like get_battery), else break it into several actions
-        rv['chargingConfig'] = getDataOrError(config.GetChargingConfig())
-        rv['batteryProfile'] = getDataOrError(config.GetBatteryProfile())
-        rv['firmwareVersion'] = getDataOrError(config.GetFirmwareVersion())
+        rv['chargingConfig'] = getDataOrError(snap.get('config', 'GetChargingConfig'))
+        rv['batteryProfile'] = getDataOrError(snap.get('config', 'GetBatteryProfile'))
+        rv['firmwareVersion'] = getDataOrError(snap.get('config', 'GetFirmwareVersion'))
         print('ChargingConfig: ', rv['chargingConfig'])
         print('Battery Profile: ', rv['batteryProfile'])
         print('Firmware Version: ', rv['firmwareVersion'])
@@ -192,25 +390,7 @@ if __name__ == '__main__':
         print('Controlstatus: ', rv['controlStatus'])
 
     if args.get_battery:
-        v = {}
-        status = pj.status
-        v['batteryCurrent'] = getDataOrError(status.GetBatteryCurrent())
-        v['batteryVoltage'] = getDataOrError(status.GetBatteryVoltage())
-        v['chargeLevel'] = getDataOrError(status.GetChargeLevel())
-        s = status.GetStatus().get('data',{ 'error': 'NO-STATUS-AVAILABLE'})
-        v['batteryStatus']  = s.get('battery', 'BATTERY_STATUS-NOT-IN-STATUS')
-        print(v)
+        print(read_battery(snap))
 
     if args.get_input:
-        v = {}
-        status = pj.status
-
-        # TODO should we camelCase here
-        v['ioVoltage'] = getDataOrError(status.GetIoVoltage())
-        v['ioCurrent'] = getDataOrError(status.GetIoCurrent())
-        s = status.GetStatus().get('data',{ 'error': 'NO-STATUS-AVAILABLE'})
-        # TODO is 'gpioPowerStatus' name good, or should it be powerInput5vIo?
-        v['gpioPowerStatus'] = s.get('powerInput5vIo', 'GPIO_POWER_STATUS-NOT-IN-STATUS')
-        v['usbPowerInput']  = s.get('powerInput', 'POWERINPUT-NOT-IN-STATUS')
-        print(v)
-
+        print(read_input(snap))
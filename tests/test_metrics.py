@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Formato Prometheus ed endpoint HTTP di lzer0_metrics.
+"""
+
+import os
+import selectors
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lzer0_metrics import REQUEST_TIMEOUT, MetricsServer, Sample, render_prometheus
+
+
+class RenderPrometheusTest(unittest.TestCase):
+
+    def test_families_are_grouped(self):
+        text = render_prometheus([
+            Sample("lzer0_service_running", "gauge", "In esecuzione", 1, {"service": "rtkrcv"}),
+            Sample("lzer0_service_restarts_total", "counter", "Riavvii", 0, {"service": "rtkrcv"}),
+            Sample("lzer0_service_running", "gauge", "In esecuzione", 0, {"service": "str2str"}),
+        ])
+        self.assertEqual(text.splitlines(), [
+            "# HELP lzer0_service_running In esecuzione",
+            "# TYPE lzer0_service_running gauge",
+            'lzer0_service_running{service="rtkrcv"} 1',
+            'lzer0_service_running{service="str2str"} 0',
+            "# HELP lzer0_service_restarts_total Riavvii",
+            "# TYPE lzer0_service_restarts_total counter",
+            'lzer0_service_restarts_total{service="rtkrcv"} 0',
+        ])
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.selector = selectors.DefaultSelector()
+        samples = lambda: [Sample("lzer0_up", "gauge", "Attivo", 1)]
+        self.server = MetricsServer("127.0.0.1:0", self.selector, samples, lambda n: {},
+                                    clock=lambda: self.now)
+        self.addr = self.server.sock.getsockname()
+
+    def tearDown(self):
+        self.server.close()
+        self.selector.close()
+
+    def _dispatch(self) -> None:
+        for key, _ in self.selector.select(0.1):
+            key.data()
+
+    def _connect(self) -> socket.socket:
+        client = socket.create_connection(self.addr, 2)
+        self.addCleanup(client.close)
+        self._dispatch()
+        return client
+
+    def test_request(self):
+        client = self._connect()
+        client.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+        self._dispatch()
+        reply = client.recv(4096)
+        self.assertTrue(reply.startswith(b"HTTP/1.0 200 OK"))
+        self.assertIn(b"lzer0_up 1", reply)
+        self.assertEqual(self.server.conns, {})
+
+    def test_idle_connection_expires(self):
+        client = self._connect()
+        self.assertEqual(self.server.next_deadline(), self.now + REQUEST_TIMEOUT)
+        self.server.expire(self.now + REQUEST_TIMEOUT - 1)
+        self.assertEqual(len(self.server.conns), 1)
+        self.server.expire(self.now + REQUEST_TIMEOUT)
+        self.assertEqual(self.server.conns, {})
+        self.assertIsNone(self.server.next_deadline())
+        self.assertEqual(client.recv(1), b"")   # chiusa dal server
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Lettura dell'inizio dei file grezzi in lzer0_rawfmt.
+"""
+
+import bz2
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lzer0_rawfmt import SNIFF_SIZE, detect, read_head
+
+
+class ReadHeadTest(unittest.TestCase):
+
+    def _write(self, data: bytes) -> str:
+        with tempfile.NamedTemporaryFile(suffix=".bz2", delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_bz2_head(self):
+        path = self._write(bz2.compress(b"$GNRMC" * 4000))
+        self.assertEqual(read_head(path), (b"$GNRMC" * 4000)[:SNIFF_SIZE])
+
+    def test_truncated_bz2_is_unreadable(self):
+        path = self._write(bz2.compress(os.urandom(4096))[:100])
+        with self.assertRaises(OSError):
+            read_head(path)
+        with self.assertRaises(OSError):
+            detect(path)
+
+    def test_corrupt_bz2_is_unreadable(self):
+        path = self._write(b"BZh9" + b"x" * 1000)
+        with self.assertRaises(OSError):
+            read_head(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Macchina a stati di lzer0.reset.rtklib.py contro un finto rtkrcv TCP.
+
+Il server pubblica righe .pos sulla porta come rtkrcv; il tempo del
+monitor è un orologio finto, così le attese di minuti durano pochi ms.
+"""
+
+import importlib.util
+import os
+import selectors
+import socket
+import sys
+import tempfile
+import unittest
+from importlib.machinery import SourceFileLoader
+
+BINDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BINDIR)
+
+_loader = SourceFileLoader("lzer0_reset_rtklib", os.path.join(BINDIR, "lzer0.reset.rtklib.py"))
+_spec = importlib.util.spec_from_loader(_loader.name, _loader)
+rtklib = importlib.util.module_from_spec(_spec)
+_loader.exec_module(rtklib)
+
+from lzer0_metrics import REQUEST_TIMEOUT
+
+POS_LINE = "2024/07/01 10:00:00.000   45.437181234   12.335910987    48.1234   %s  12   0.0040   0.0030   0.0090\n"
+
+
+class FakeRTKServer:
+    """Porta delle soluzioni di rtkrcv: accetta un client e gli invia righe .pos."""
+
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.conn = None
+
+    def accept(self) -> None:
+        self.listener.settimeout(2)
+        self.conn, _ = self.listener.accept()
+
+    def send(self, q: str) -> None:
+        self.conn.sendall((POS_LINE % q).encode())
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+        self.listener.close()
+
+
+class RTKMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.server = FakeRTKServer()
+        self.now = 1000.0
+        self.restarts = []
+        cfg = rtklib.Config(PORT=self.server.port, LOG_DIR=self.tmp.name,
+                            PIDFILE=os.path.join(self.tmp.name, "pid"), STARTUP_DELAY=0)
+        self.monitor = rtklib.RTKMonitor(cfg, clock=lambda: self.now,
+                                         restart_action=self.restarts.append)
+        self.monitor.start(self.now)
+        self._step()                 # fine dell'attesa iniziale
+        self._step()                 # primo controllo: connessione
+        self.assertTrue(self.monitor.client.connected)
+        self.server.accept()
+
+    def tearDown(self):
+        self.monitor.close()
+        self.server.close()
+        self.tmp.cleanup()
+
+    def _step(self, wait: float = 0.05) -> None:
+        self.monitor.step(max_wait=wait)
+
+    def _receive(self, q: str) -> None:
+        """Invia una soluzione e la fa leggere al monitor."""
+        received = self.monitor.ring.total
+        self.server.send(q)
+        for _ in range(20):
+            self._step()
+            if self.monitor.ring.total > received:
+                return
+        self.fail(f"solution Q={q} not received")
+
+    def _advance(self, seconds: float) -> None:
+        self.now += seconds
+        self._step(0)
+
+    def test_status2_recovered_between_checks_does_not_restart(self):
+        self._receive("2")
+        self.assertEqual(self.monitor.state, rtklib.State.STATUS2)
+        self.assertIsNotNone(self.monitor.status2_deadline)
+        for _ in range(4):           # controlli a 60..240 s, sempre status 2
+            self._advance(60)
+            self._receive("2")
+        self.assertIsNone(self.monitor.sample_deadline)
+        self._advance(10)            # 250 s: nessun controllo in corso
+        self._receive("1")
+        self.assertEqual(self.monitor.state, rtklib.State.OK)
+        self.assertIsNone(self.monitor.status2_deadline)
+        self._advance(50)            # 300 s: scadenza dello status 2 e controllo
+        self.assertEqual(self.restarts, [])
+
+    def test_status2_persistent_restarts(self):
+        self._receive("2")
+        for _ in range(5):
+            self._advance(60)
+            if self.restarts:
+                break
+            self._receive("2")
+        self.assertEqual(self.now - 1000.0, 300)
+        self.assertEqual(self.restarts, ["status 2 persistente"])
+        self.assertEqual(self.monitor.state, rtklib.State.RESTART_WAIT)
+
+    def test_status5_streak_restarts(self):
+        self._receive("5")
+        for _ in range(3):
+            self._advance(60)
+            self._receive("5")
+        self.assertEqual(self.restarts, ["status 5 persistente"])
+
+    def test_unknown_status_restarts_immediately(self):
+        self._receive("4")
+        self.assertEqual(self.restarts, ["status 4"])
+
+    def test_connection_loss_is_detected_without_waiting_for_a_check(self):
+        self._receive("1")
+        self.server.conn.close()
+        for _ in range(20):
+            self._step()
+            if not self.monitor.client.connected:
+                break
+        self.assertFalse(self.monitor.client.connected)
+        self.assertLessEqual(self.monitor.next_tick, self.now + self.monitor.cfg.RECONNECT_BACKOFF_MIN)
+
+    def test_idle_metrics_connection_is_closed_by_the_timers(self):
+        self.monitor.serve_metrics("127.0.0.1:0")
+        self.addCleanup(self.monitor._close_metrics)
+        client = socket.create_connection(self.monitor.metrics_server.sock.getsockname(), 2)
+        self.addCleanup(client.close)
+        self._step()
+        self.assertEqual(len(self.monitor.metrics_server.conns), 1)
+        self._advance(REQUEST_TIMEOUT)
+        self.assertEqual(self.monitor.metrics_server.conns, {})
+
+    def test_shutdown_interrupts_the_wait(self):
+        self._receive("2")
+        self.monitor.request_shutdown()
+        self.monitor.step(max_wait=5)
+        self.assertTrue(self.monitor.shutdown_requested)
+
+
+class TCPProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.selector = selectors.DefaultSelector()
+        self.now = 1000.0
+        self.restarts = []
+
+    def tearDown(self):
+        self.selector.close()
+        self.tmp.cleanup()
+
+    def _probe(self, port: int):
+        cfg = rtklib.Config(PORT=port, LOG_DIR=self.tmp.name, STARTUP_DELAY=0,
+                            CONNECTION_FAIL_TIME_THRESHOLD=0)
+        probe = rtklib.TCPProbe(cfg, lambda: self.now, self.restarts.append, "test", self.selector)
+        probe.start(self.now)
+        return probe
+
+    def _check(self, probe) -> None:
+        """Avvia un controllo senza bloccare e ne attende l'esito dal selector."""
+        probe.run_timers(self.now)
+        self.assertIsNotNone(probe.sock)
+        for _ in range(20):
+            for key, _ in self.selector.select(0.1):
+                key.data()
+            if probe.sock is None:
+                return
+        self.fail("connect did not complete")
+
+    def test_open_port(self):
+        server = FakeRTKServer()
+        self.addCleanup(server.close)
+        probe = self._probe(server.port)
+        self._check(probe)
+        self.assertEqual((probe.checks, probe.failures), (1, 0))
+        self.assertEqual(self.restarts, [])
+
+    def test_closed_port_restarts(self):
+        server = FakeRTKServer()
+        port = server.port
+        server.close()
+        probe = self._probe(port)
+        self._check(probe)
+        self.assertEqual(probe.failures, 1)
+        self.assertEqual(self.restarts, ["porta non raggiungibile"])
+
+    def test_pending_connect_times_out(self):
+        server = FakeRTKServer()
+        self.addCleanup(server.close)
+        probe = self._probe(server.port)
+        probe.run_timers(self.now)   # esito mai letto dal selector
+        self.assertEqual(probe.next_deadline(), self.now + probe.cfg.SOCKET_TIMEOUT)
+        self.now = probe.next_deadline()
+        probe.run_timers(self.now)
+        self.assertEqual(probe.failures, 1)
+        self.assertEqual(self.restarts, ["porta non raggiungibile"])
+        self.assertIsNone(probe.sock)
+        self.assertEqual(len(self.selector.get_map()), 0)
+        self.assertEqual(probe.next_deadline(), 1000.0 + probe.cfg.CHECK_INTERVAL)
+
+
+class LoadServicesTest(unittest.TestCase):
+
+    def _load(self, text: str):
+        with tempfile.NamedTemporaryFile("w", suffix=".cfg", delete=False) as f:
+            f.write(text)
+        self.addCleanup(os.remove, f.name)
+        return rtklib.load_services(f.name)
+
+    def test_probe_port(self):
+        spec, = self._load("[rtkrcv]\ncommand = rtkrcv -s\nprobe = rtk:127.0.0.1:5754\n")
+        self.assertEqual(spec.probe, "rtk:127.0.0.1:5754")
+
+    def test_invalid_probe_port(self):
+        for probe in ("tcp:127.0.0.1:http", "tcp:127.0.0.1:", "rtk:localhost:70000"):
+            with self.assertRaisesRegex(ValueError, "probe non valido"):
+                self._load(f"[s]\ncommand = str2str\nprobe = {probe}\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
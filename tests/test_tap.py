@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Sink di lzer0_tap: errori di scrittura e riavvio dei sink.
+"""
+
+import asyncio
+import errno
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lzer0_tap
+from lzer0_tap import HourlyFileSink, Sink, supervise_sink
+
+T0 = datetime(2024, 7, 1, 10, 15, tzinfo=timezone.utc)
+
+
+async def _feed(sink: Sink, chunks, runner) -> None:
+    task = asyncio.create_task(runner)
+    for chunk in chunks:
+        sink.offer(chunk)
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+            if not sink._queue:
+                break
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+class HourlyFileSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.messages = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_error_reopens_the_file(self):
+        sink = HourlyFileSink(f"{self.tmp.name}/%Y/%n/%H/L001%H%y.%n", clock=lambda: T0,
+                              log=self.messages.append)
+        write = sink._write
+        failures = [OSError(errno.ENOSPC, "No space left on device")]
+
+        def flaky_write(data):
+            if failures and sink.bytes_out:
+                raise failures.pop()
+            write(data)
+
+        sink._write = flaky_write
+        chunks = [bytes([65 + i]) * 1000 for i in range(30)]
+        asyncio.run(_feed(sink, chunks, sink.run()))
+        with open(f"{self.tmp.name}/2024/183/k/L001k24.183", "rb") as f:
+            data = f.read()
+        self.assertEqual((sink.errors, sink.dropped), (1, 1000))
+        self.assertEqual(len(data), 29000)
+        self.assertEqual(sink.bytes_out, 29000)
+        self.assertEqual(len(self.messages), 2)
+        self.assertIn("No space left on device", self.messages[0])
+        self.assertIn("ripresa", self.messages[1])
+
+
+class CrashingSink(Sink):
+    name = "crash"
+
+    def __init__(self):
+        super().__init__()
+        self.seen = []
+        self.crashed = False
+
+    async def consume(self, data: bytes) -> None:
+        if not self.crashed:
+            self.crashed = True
+            raise RuntimeError("bug")
+        self.seen.append(data)
+
+
+class SuperviseSinkTest(unittest.TestCase):
+
+    def test_crashed_sink_is_restarted(self):
+        messages = []
+        sink = CrashingSink()
+        lzer0_tap.RECONNECT_MIN, saved = 0.01, lzer0_tap.RECONNECT_MIN
+        self.addCleanup(setattr, lzer0_tap, "RECONNECT_MIN", saved)
+        asyncio.run(_feed(sink, [b"a", b"b"], supervise_sink(sink, messages.append)))
+        self.assertEqual(sink.seen, [b"b"])
+        self.assertEqual(len(messages), 1)
+        self.assertIn("riavvio", messages[0])
+
+
+if __name__ == "__main__":
+    unittest.main()